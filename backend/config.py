@@ -33,6 +33,145 @@ class Settings(BaseSettings):
         validation_alias=AliasChoices("runninghub_base_url", "RUNNINGHUB_BASE_URL")
     )
 
+    # RunningHub task completion: adaptive polling + optional webhook
+    runninghub_poll_min_interval: float = 0.5
+    runninghub_poll_max_interval: float = 10.0
+    runninghub_poll_backoff: float = 1.5
+    runninghub_max_poll_time: float = 300.0
+    # Process-wide poller: timing-wheel tick (seconds) and global cap on status queries in flight
+    runninghub_poll_tick: float = 0.05
+    runninghub_poll_max_in_flight: int = 32
+    # 本服务的公网地址；设置后提交任务时附带 webhookUrl=<base>/api/runninghub/webhook
+    # （仅单工作进程时放宽轮询，多进程下 webhook 只能唤醒收到它的进程）
+    runninghub_webhook_base_url: str = ""
+
+    # Image CPU pool (decode / validate / resize off the event loop); 0 workers = inline
+    image_pool_workers: int = 4
+    image_pool_queue_depth: int = 64
+
+    # Vision LLM input preprocessing (analyze / recognize-product)
+    vision_preprocess_enabled: bool = True
+    vision_max_edge: int = 1536
+    vision_output_format: str = "JPEG"  # JPEG 或 WEBP
+    vision_quality: int = 85
+    vision_tile_ratio: float = 2.5
+    vision_max_tiles: int = 4
+
+    # SSE output of the LLM endpoints: after the first chunk, flush every sse_flush_interval seconds or once
+    # sse_flush_bytes are buffered (both 0 = one frame per upstream chunk)
+    sse_flush_interval: float = 0.03
+    sse_flush_bytes: int = 2048
+
+    # Content-addressed LLM result cache (analyze / recognize-product)
+    result_cache_enabled: bool = True
+    result_cache_ttl: float = 7 * 24 * 3600
+    result_cache_memory_bytes: int = 32 * 1024 * 1024
+    result_cache_path: str = "data/result_cache.sqlite3"  # 为空时仅使用内存层
+    result_cache_disk_bytes: int = 256 * 1024 * 1024
+    fuse_prompt_cache_enabled: bool = True  # fuse-prompt 按规范化输入精确匹配
+
+    # Upload-once image store (POST /api/images -> image_id), idle TTL + disk quota
+    image_store_path: str = "data/images"
+    image_store_ttl: float = 24 * 3600
+    image_store_max_bytes: int = 1024 * 1024 * 1024
+
+    # Coalesce concurrent identical analyze / recognize / fuse / generate requests
+    singleflight_enabled: bool = True
+
+    # Batch generation: matrix size cap, concurrent submissions, shared poll cycle (seconds)
+    batch_max_jobs: int = 24
+    batch_max_concurrency: int = 6
+    batch_poll_interval: float = 1.0
+
+    # Async generation jobs: "memory" or "sqlite"
+    job_store_backend: str = "memory"
+    job_store_path: str = "data/jobs.sqlite3"
+
+    # 参考图先上传到 RunningHub 媒体接口并复用返回的 URL（链接有效期 1 天），关闭时发送 data URI
+    runninghub_upload_images: bool = False
+    runninghub_upload_url_ttl: float = 20 * 3600
+
+    # RunningHub channel resilience: hedged requests + per-path circuit breaker
+    runninghub_hedge_enabled: bool = False
+    runninghub_hedge_delay: float = 60.0  # 历史样本不足时的对冲阈值（秒）
+    runninghub_hedge_min_samples: int = 20
+    runninghub_breaker_failures: int = 3
+    runninghub_breaker_cooldown: float = 60.0
+
+    # Admission control per upstream API key: concurrency caps, token-bucket rate (calls/s, 0 = unlimited),
+    # fair queue between keys; a full queue returns 429 + Retry-After. Off by default: requests without a key
+    # header all share the server key's limits, so size those for the deployment before enabling it
+    admission_enabled: bool = False
+    runninghub_admission_global_limit: int = 16
+    runninghub_admission_key_limit: int = 4
+    runninghub_admission_key_rate: float = 1.0
+    runninghub_admission_key_burst: int = 8
+    runninghub_admission_global_rate: float = 0.0
+    runninghub_admission_queue_size: int = 64
+    runninghub_admission_key_queue_size: int = 24
+    llm_admission_global_limit: int = 32
+    llm_admission_key_limit: int = 8
+    llm_admission_key_rate: float = 2.0
+    llm_admission_key_burst: int = 10
+    llm_admission_global_rate: float = 0.0
+    llm_admission_queue_size: int = 128
+    llm_admission_key_queue_size: int = 32
+
+    # Shared HTTP connection pool (RunningHub and other upstream calls)
+    http_pool_http2: bool = True
+    http_pool_max_connections: int = 100
+    http_pool_max_keepalive: int = 20
+    http_pool_keepalive_expiry: float = 30.0
+
+    # LLM model instance cache (keyed by api key hash + model + temperature)
+    llm_model_cache_size: int = 256
+    llm_model_cache_ttl: float = 900.0
+
+    # Generated image proxy: stream RunningHub results into a local content-addressed store and serve
+    # them from /api/results/{digest} (Range, ETag, immutable caching, ?w= thumbnails); LRU under the quota
+    result_store_enabled: bool = False
+    result_store_path: str = "data/results"
+    result_store_ttl: float = 30 * 24 * 3600
+    result_store_max_bytes: int = 4 * 1024 * 1024 * 1024
+    result_store_max_download_bytes: int = 64 * 1024 * 1024
+
+    # Durable journal of submitted RunningHub tasks (SQLite WAL): retries with the same Idempotency-Key header reuse
+    # the pending or succeeded task, tasks left behind by an exited process are resumed at startup; finished rows
+    # are kept for task_journal_retention
+    task_journal_enabled: bool = False
+    task_journal_path: str = "data/runninghub_tasks.sqlite3"
+    task_journal_retention: float = 7 * 24 * 3600
+
+    # Production server (serve.py; 0 = CPU cores, exported to its workers). With more than one worker,
+    # admission rate limits share token buckets in shared_state_path and concurrency caps are split per worker
+    server_workers: int = 1
+    shared_state_path: str = "data/shared_state.sqlite3"
+
+    # Logging: JSON lines written by a background thread (QueueHandler -> QueueListener); log_path "" = stderr,
+    # otherwise size-based rotation (one file per worker under serve.py). Successful access and upstream-call
+    # events are kept with the sample rates below (0..1); warnings and errors are always written
+    log_level: str = "INFO"
+    log_path: str = ""
+    log_max_bytes: int = 50 * 1024 * 1024
+    log_backup_count: int = 5
+    log_queue_size: int = 10000
+    log_access_sample_rate: float = 1.0
+    log_upstream_sample_rate: float = 1.0
+
+    # Metrics: the model label of the llm_* metrics is the configured llm_model, one of metrics_llm_models
+    # (comma separated) or "other", so per-request x-gemini-model headers cannot add label sets without bound
+    metrics_llm_models: str = ""
+
+    # Tracing: "" (off), "console" (stderr) or "otlp-file" (OTLP/JSON lines at tracing_path)
+    tracing_exporter: str = ""
+    tracing_path: str = "data/traces.jsonl"
+    tracing_service_name: str = "ecommerce-image-backend"
+
+    # Prompt templates (*.md): prompt_dir "" = the repository's Guidance directory; modified files are picked up
+    # every prompt_reload_interval seconds (0 = load once at startup)
+    prompt_dir: str = ""
+    prompt_reload_interval: float = 2.0
+
     # Temperature config
     llm_temperature: float = 0.7
     llm_recognize_temperature: float = 0.3
@@ -1,14 +1,19 @@
+import asyncio
 import json
 import importlib
+import logging
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from dotenv import load_dotenv
 import os
-import traceback
+import time
 from pathlib import Path
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import asynccontextmanager
 from typing import Optional
 
 from models.schemas import (
@@ -17,22 +22,93 @@ from models.schemas import (
     GenerateResponse,
     FusePromptRequest,
     RecognizeProductRequest,
+    JobResponse,
+    BatchGenerateRequest,
+    ImageUploadRequest,
+    ImageUploadResponse,
 )
 from services.llm_manager import LLMManager
-from services.runninghub_client import RunningHubClient
-from services.image_utils import validate_image_base64
-from services.prompt_loader import load_reverse_prompt_template, load_fuse_prompt_template, load_recognize_product_template
+from services.runninghub_client import RunningHubClient, IMAGE_SIZE_TO_RESOLUTION
+from services.task_poller import get_task_poller
+from services.metrics import (
+    MetricsMiddleware,
+    current_endpoint,
+    image_validation_seconds,
+    llm_cache_requests,
+    llm_first_token_seconds,
+    llm_output_chars,
+    llm_stream_seconds,
+    model_label,
+    outcome_of,
+    registry,
+    sse_disconnects,
+    sse_frames,
+)
+from services.tracing import TracingMiddleware, configure_tracing, tracer
+from services.event_log import AccessLogMiddleware, configure_logging, logging_stats
+from services.admission import AdmissionRejected, get_llm_admission, get_runninghub_admission
+from services.http_pool import open_http_pool, close_http_pool, get_http_client
+from services.model_cache import get_model_cache
+from services.task_completion import duration_model, task_waiter
+from services.resilience import get_path_breaker, path_latency
+from services.job_store import Job, build_job_store
+from services.job_manager import JobManager
+from services.task_journal import JournalEntry, correlation_id, get_task_journal, idempotency_key
+from services.image_utils import (
+    MAX_IMAGE_BYTES,
+    ImagePayload,
+    ImageValidationError,
+    VisionOptions,
+    decode_image_base64,
+    load_image_bytes,
+    prepare_for_vision,
+)
+from services.image_store import get_image_store, is_image_id, remote_urls
+from services.result_store import get_result_store, make_thumbnail, thumbnail_key, thumbnail_width
+from services.result_cache import canonical_text, get_result_cache, make_key
+from services.singleflight import inflight
+from services.sse import coalesce, sse_content, sse_error, until_disconnected
+from services.cpu_pool import PoolSaturatedError, close_image_pool, get_image_pool
+from services.prompt_loader import FUSE_PROMPT, RECOGNIZE_PRODUCT, REVERSE_PROMPT, PromptTemplate, get_prompt_registry
 _config_module = importlib.import_module("config")
 get_settings = _config_module.get_settings
 
 # 加载环境变量
 _ = load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """进程级资源：共享 HTTP 连接池、异步任务管理器随应用启动创建、关闭时释放。"""
+    global job_manager
+    configure_tracing(settings)
+    open_http_pool(settings)
+    job_manager = JobManager(build_job_store(settings), journal=get_task_journal(settings))
+    resume_task = asyncio.create_task(_resume_journaled_tasks(), name="task-journal-resume")
+    background = [resume_task]
+    if settings.prompt_reload_interval > 0:
+        background.append(asyncio.create_task(
+            prompt_registry.watch(settings.prompt_reload_interval), name="prompt-template-watch"
+        ))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await job_manager.shutdown()
+        job_manager = None
+        await close_http_pool()
+        close_image_pool()
+        tracer.close()
+
+
 # 创建FastAPI应用
 app = FastAPI(
     title="E-commerce Image Generator API",
     description="电商产品图生成器 - 使用AI分析竞品详情页并生成同风格产品图",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS配置（开发环境）
@@ -43,11 +119,30 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 每个请求一个 server span，按 x-workflow-id 归入同一 trace（见 services/tracing.py）
+app.add_middleware(TracingMiddleware)
+# 分配 request id 并记录访问日志（JSON 行，见 services/event_log.py）
+app.add_middleware(AccessLogMiddleware)
+# 按路由模板统计请求耗时，并向下游暴露当前端点（须在 TracingMiddleware 外层，见 services/metrics.py）
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    """准入排队已满：429 + Retry-After，客户端稍后重试。"""
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
 # 初始化配置与懒加载客户端
 settings = get_settings()
+configure_logging(settings)
+logger = logging.getLogger(__name__)
 llm_manager: Optional[LLMManager] = None
 runninghub_client: Optional[RunningHubClient] = None
+job_manager: Optional[JobManager] = None
 
 
 def get_llm_manager() -> LLMManager:
@@ -60,10 +155,16 @@ def get_llm_manager() -> LLMManager:
 def get_runninghub_client() -> RunningHubClient:
     global runninghub_client
     if runninghub_client is None:
-        runninghub_client = RunningHubClient(settings)
+        runninghub_client = RunningHubClient(settings, http_client=get_http_client(settings))
     return runninghub_client
 
 
+def get_job_manager() -> JobManager:
+    if job_manager is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="任务服务未启动")
+    return job_manager
+
+
 def _resolve_llm(request: Request) -> LLMManager:
     """Return a per-request LLMManager when the caller supplies an API key header,
     otherwise fall back to the global singleton."""
@@ -81,7 +182,7 @@ def _resolve_llm(request: Request) -> LLMManager:
 
 def _resolve_runninghub(request: Request) -> RunningHubClient:
     """Return a per-request RunningHubClient when the caller supplies an API key header,
-    otherwise fall back to the global singleton."""
+    otherwise fall back to the global singleton. Both share the process-wide HTTP pool."""
     api_key = request.headers.get("x-runninghub-api-key")
     if not api_key:
         return get_runninghub_client()
@@ -89,36 +190,312 @@ def _resolve_runninghub(request: Request) -> RunningHubClient:
     per_req_settings = settings.model_copy(update={
         "runninghub_api_key": _SecretStr(api_key),
     })
-    return RunningHubClient(per_req_settings)
+    return RunningHubClient(per_req_settings, http_client=get_http_client(settings))
 
-# 加载提示词模板（全部在启动时加载）
-try:
-    reverse_prompt_template = load_reverse_prompt_template()
-except FileNotFoundError as e:
-    print(f"警告: {e}")
-    reverse_prompt_template = "请分析这张电商详情页图片的构图方式、背景设计、光影质感、文字排版等元素，生成一段可用于图片生成的提示词。"
+# 提示词模板注册表：启动时加载 Guidance/*.md，之后后台检查修改（见 services/prompt_loader.py）
+prompt_registry = get_prompt_registry(settings)
 
-try:
-    fuse_prompt_template = load_fuse_prompt_template()
-except FileNotFoundError as e:
-    print(f"警告: {e}")
-    fuse_prompt_template = "请将目标产品信息融入到竞品分析模板的视觉风格中，生成新的产品图片生成提示词。"
 
-try:
-    recognize_template = load_recognize_product_template()
-except FileNotFoundError as e:
-    print(f"警告: {e}")
-    recognize_template = "请识别图片中的产品信息，包括产品名称、外观特征、材质、卖点等。"
+def _prompt_template(request: Request, name: str) -> PromptTemplate:
+    """当前模板版本；请求头 x-prompt-variant 选择 A/B 变体（不存在时使用默认模板）。"""
+    return prompt_registry.get(name, request.headers.get("x-prompt-variant", "")[:64])
 
 
 def _sse_chunk(content: str, done: bool = False) -> str:
     """Format a single SSE data line."""
-    return f"data: {json.dumps({'content': content, 'done': done}, ensure_ascii=False)}\n\n"
+    return sse_content(content, done)
 
 
 def _sse_error(message: str) -> str:
     """Format an SSE error line."""
-    return f"data: {json.dumps({'error': message, 'done': True}, ensure_ascii=False)}\n\n"
+    return sse_error(message)
+
+
+async def _sse_response(lines: AsyncGenerator[str, None], raw_request: Request) -> StreamingResponse:
+    """
+    预取第一条 SSE 消息后再返回流式响应。
+
+    上游准入在第一条消息之前完成，排队已满时 AdmissionRejected 在此抛出，
+    客户端收到 429 JSON（带 Retry-After）而不是一个只含错误事件的 SSE 流。
+    客户端断开后立即停止迭代，取消仍在进行的上游 LLM 流。
+    """
+    endpoint = current_endpoint.get()
+    try:
+        first: Optional[str] = await anext(lines)
+    except StopAsyncIteration:
+        first = None
+
+    async def body() -> AsyncGenerator[str, None]:
+        if first is not None:
+            sse_frames.inc(endpoint)
+            yield first
+        async for line in until_disconnected(
+            lines, raw_request.receive, on_disconnect=lambda: sse_disconnects.inc(endpoint)
+        ):
+            sse_frames.inc(endpoint)
+            yield line
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+async def _ingest_image(fn: Callable[..., ImagePayload], data: str | bytes, label: str = "") -> ImagePayload:
+    """在图片线程池中解码并校验一张图片，失败时抛出 400（label 用于多图时指明第几张）。"""
+    started = time.perf_counter()
+    outcome = "invalid"
+    try:
+        with tracer.span("image.validate", **{"image.input_bytes": len(data)}) as span:
+            image = await get_image_pool(settings).run(fn, data)
+            span.set_attribute("image.format", image.format)
+        outcome = "success"
+        return image
+    except PoolSaturatedError as e:
+        outcome = "saturated"
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
+    except ImageValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{label}{e}")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{label}图片验证失败: {str(e)}")
+    finally:
+        image_validation_seconds.observe(time.perf_counter() - started, current_endpoint.get(), outcome)
+
+
+async def _decode_image(image_base64: str, label: str = "") -> ImagePayload:
+    """解码并校验一张 Base64 图片（JSON 请求体）。"""
+    return await _ingest_image(decode_image_base64, image_base64, label)
+
+
+async def _stored_image(image_id: str, label: str = "") -> ImagePayload:
+    """按 image_id 从图片仓库读取并校验图片，不存在或已过期时抛出 404。"""
+    data = await get_image_store(settings).get(image_id)
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{label}图片不存在或已过期，请重新上传: {image_id}"
+        )
+    return await _ingest_image(load_image_bytes, data, label)
+
+
+async def _request_image(image: Optional[str], image_id: Optional[str]) -> ImagePayload:
+    """解析 image（Base64）/ image_id 二选一的单图请求。"""
+    if image_id:
+        return await _stored_image(image_id)
+    if image:
+        return await _decode_image(image)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="缺少图片数据（image 或 image_id）"
+    )
+
+
+# RunningHub imageUrls 上限
+MAX_UPLOAD_IMAGES = 10
+# multipart 请求体中图片以外的余量（表单字段、分段头），也是单个文本字段的上限
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def _too_large(label: str, size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"{label}图片过大（{size / 1024 / 1024:.1f}MB），最大支持5MB",
+    )
+
+
+async def _read_upload_file(upload: UploadFile, label: str = "") -> ImagePayload:
+    """读取 multipart 文件（大文件已由 Starlette 落盘暂存）并校验，最多读入 5MB。"""
+    if upload.size is not None and upload.size > MAX_IMAGE_BYTES:
+        raise _too_large(label, upload.size)
+    data = await upload.read(MAX_IMAGE_BYTES + 1)
+    await upload.close()
+    if len(data) > MAX_IMAGE_BYTES:
+        raise _too_large(label, len(data))
+    return await _ingest_image(load_image_bytes, data, label)
+
+
+async def _read_multipart(raw_request: Request, max_files: int, max_fields: int = 10) -> FormData:
+    """
+    解析 multipart 表单：文件数、字段数与字段大小交给 Starlette 限制；文件部分 Starlette 不限大小，
+    因此请求体边读边计数，超过 max_files 张 5MB 图片的总量立即拒绝，不把超大上传写入临时文件
+    """
+    limit = max_files * MAX_IMAGE_BYTES + MULTIPART_OVERHEAD_BYTES
+
+    def too_large() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"上传内容过大，最多{max_files}张图片、每张最大5MB",
+        )
+
+    declared = raw_request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise too_large()
+
+    async def limited_stream() -> AsyncGenerator[bytes, None]:
+        received = 0
+        async for chunk in raw_request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise too_large()
+            yield chunk
+
+    parser = MultiPartParser(
+        raw_request.headers,
+        limited_stream(),
+        max_files=max_files,
+        max_fields=max_fields,
+        max_part_size=MULTIPART_OVERHEAD_BYTES,
+    )
+    try:
+        return await parser.parse()
+    except MultiPartException as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"表单无效或超出限制（最多{max_files}个文件）: {exc.message}",
+        )
+
+
+async def _read_single_upload(raw_request: Request) -> ImagePayload:
+    """
+    读取单图上传：multipart/form-data 的 image 字段，或 image/* / application/octet-stream 原始请求体
+    """
+    content_type = raw_request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type == "multipart/form-data":
+        form = await _read_multipart(raw_request, max_files=1)
+        try:
+            upload = form.get("image")
+            if not isinstance(upload, UploadFile):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="缺少 image 文件字段")
+            return await _read_upload_file(upload)
+        finally:
+            await form.close()
+
+    if content_type.startswith("image/") or content_type == "application/octet-stream":
+        # 分块读取，超过 5MB 立即拒绝，不把超大请求体读入内存
+        buffer = bytearray()
+        async for chunk in raw_request.stream():
+            buffer.extend(chunk)
+            if len(buffer) > MAX_IMAGE_BYTES:
+                raise _too_large("", len(buffer))
+        return await _ingest_image(load_image_bytes, bytes(buffer))
+
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="请使用 multipart/form-data（image 字段）或图片二进制请求体上传",
+    )
+
+
+def _vision_options() -> Optional[VisionOptions]:
+    """视觉模型输入预处理参数，关闭预处理时返回 None。"""
+    if not settings.vision_preprocess_enabled:
+        return None
+    return VisionOptions(
+        max_edge=settings.vision_max_edge,
+        output_format=settings.vision_output_format.upper(),
+        quality=settings.vision_quality,
+        tile_ratio=settings.vision_tile_ratio,
+        max_tiles=settings.vision_max_tiles,
+    )
+
+
+def _vision_cache_tag() -> str:
+    options = _vision_options()
+    return options.cache_tag if options else "original"
+
+
+async def _vision_image_blocks(image: ImagePayload) -> list[dict]:
+    """将图片转为 LLM 多模态消息中的 image_url 块（预处理在线程池执行，长图切为多块）。"""
+    options = _vision_options()
+    images = [image] if options is None else await get_image_pool(settings).run(prepare_for_vision, image, options)
+    return [{"type": "image_url", "image_url": {"url": img.data_uri}} for img in images]
+
+
+def _cache_bypassed(raw_request: Request) -> bool:
+    """请求头 Cache-Control: no-cache 时跳过结果缓存读取（新结果仍会写回缓存）。"""
+    return "no-cache" in raw_request.headers.get("cache-control", "").lower()
+
+
+async def _stream_chat_sse(
+    llm: LLMManager,
+    messages: list[dict] | Callable[[], Awaitable[list[dict]]],
+    temperature: Optional[float] = None,
+    cache_key: Optional[str] = None,
+    cache_namespace: str = "",
+    bypass_cache: bool = False,
+    prompt: str = "",
+) -> AsyncGenerator[str, None]:
+    """
+    流式输出 LLM 结果为 SSE；命中结果缓存时直接回放，完整成功的结果写入缓存。
+
+    prompt 为系统提示词模板的 名称:版本，作为 LLM 指标的标签，按模板修订分别统计耗时与输出长度。
+
+    messages 可以是构建消息的协程函数，缓存命中时不会执行（省去图片预处理）。
+    同一 cache_key 的并发请求合并为一次上游调用，后到的请求通过扇出缓冲订阅同一流。
+    """
+    endpoint = current_endpoint.get()
+    cache = get_result_cache(settings) if cache_key else None
+    if cache is not None and cache_key:
+        if bypass_cache:
+            cache.record(cache_namespace, "bypassed")
+            llm_cache_requests.inc(endpoint, "bypassed")
+        else:
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                cache.record(cache_namespace, "hits")
+                llm_cache_requests.inc(endpoint, "hit")
+                yield _sse_chunk(cached)
+                yield _sse_chunk("", done=True)
+                return
+            cache.record(cache_namespace, "misses")
+            llm_cache_requests.inc(endpoint, "miss")
+
+    async def upstream() -> AsyncGenerator[str, None]:
+        nonlocal messages
+        if callable(messages):
+            messages = await messages()
+        model = model_label(llm.settings.llm_model, [settings.llm_model, *settings.metrics_llm_models.split(",")])
+        parts: list[str] = []
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            # 按时间窗口 / 字节数合并 token 块，减少 SSE 帧数与序列化开销
+            chunks = coalesce(
+                llm.stream_chat(messages, temperature=temperature),
+                settings.sse_flush_bytes,
+                settings.sse_flush_interval,
+            )
+            async for chunk in chunks:
+                if not parts:
+                    llm_first_token_seconds.observe(time.perf_counter() - started, endpoint, model, prompt)
+                parts.append(chunk)
+                yield _sse_chunk(chunk)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            llm_stream_seconds.observe(time.perf_counter() - started, endpoint, model, prompt, outcome_of(error))
+        llm_output_chars.observe(sum(map(len, parts)), endpoint, model, prompt)
+        if cache is not None and cache_key and parts:
+            await cache.set(cache_key, "".join(parts))
+        yield _sse_chunk("", done=True)
+
+    # 相同内容且使用同一 API Key 的并发请求共享同一条上游流（显式 no-cache 的请求单独执行）；
+    # 结果缓存键不含凭据，合并键需要加上，否则后到者会借用先到者的 Key
+    if cache_key and settings.singleflight_enabled and not bypass_cache:
+        stream = inflight.stream(make_key("stream", cache_key, llm.admission_key), upstream)
+    else:
+        stream = upstream()
+    async for line in stream:
+        yield line
 
 
 @app.get("/")
@@ -127,6 +504,86 @@ async def root():
     return {"status": "ok", "message": "E-commerce Image Generator API"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式指标（各阶段耗时直方图、上游调用计数）"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/stats")
+async def service_stats():
+    """进程内缓存与连接复用统计"""
+    return {
+        "llm_model_cache": get_model_cache(settings).stats(),
+        "runninghub_task_durations": duration_model.snapshot(),
+        "runninghub_path_latency": path_latency.snapshot(),
+        "runninghub_path_breakers": get_path_breaker(settings).snapshot(),
+        "runninghub_poller": get_task_poller(settings).stats(),
+        "logging": logging_stats(),
+        "prompt_templates": {"reloads": prompt_registry.reloads, "templates": prompt_registry.snapshot()},
+        "jobs_in_flight": job_manager.in_flight if job_manager else 0,
+        "result_cache": cache.stats() if (cache := get_result_cache(settings)) else None,
+        "singleflight": inflight.stats(),
+        "admission": {
+            "runninghub": get_runninghub_admission(settings).stats(),
+            "llm": get_llm_admission(settings).stats(),
+        },
+        "image_store": get_image_store(settings).stats(),
+        "result_store": get_result_store(settings).stats() if settings.result_store_enabled else None,
+        "task_journal": await journal.stats() if (journal := get_task_journal(settings)) else None,
+        "runninghub_remote_urls": remote_urls.stats(),
+        "image_pool": get_image_pool(settings).stats(),
+    }
+
+
+@app.post("/api/runninghub/webhook")
+async def runninghub_webhook(raw_request: Request):
+    """
+    RunningHub 任务完成回调
+
+    仅用于唤醒等待中的轮询协程；结果仍以 /openapi/v2/query 的查询为准，回调内容不被信任。
+    """
+    try:
+        body = await raw_request.json()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="回调内容不是有效的 JSON")
+    data = body.get("data") if isinstance(body, dict) and isinstance(body.get("data"), dict) else body
+    task_id = data.get("taskId") if isinstance(data, dict) else None
+    if not task_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="回调缺少 taskId")
+    return {"status": "ok", "waiting": task_waiter.notify(str(task_id))}
+
+
+@app.post("/api/images", response_model=ImageUploadResponse)
+async def upload_image(raw_request: Request):
+    """
+    上传图片到图片仓库，返回可复用的 image_id
+
+    - multipart/form-data 的 **image** 文件字段、image/* 原始请求体，或 JSON {"image": "<Base64>"}
+    - 相同内容返回相同 ID；闲置超过 IMAGE_STORE_TTL 后过期
+    """
+    content_type = raw_request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "application/json":
+        try:
+            body = ImageUploadRequest.model_validate(await raw_request.json())
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请求体应为 {\"image\": \"<Base64>\"}")
+        image = await _decode_image(body.image)
+    else:
+        image = await _read_single_upload(raw_request)
+
+    store = get_image_store(settings)
+    image_id = await store.put(image.data)
+    return ImageUploadResponse(
+        image_id=image_id,
+        format=image.format,
+        width=image.width,
+        height=image.height,
+        size=image.size,
+        expires_in=store.ttl,
+    )
+
+
 @app.post("/api/analyze")
 async def analyze_competitor_image(request: AnalyzeRequest, raw_request: Request):
     """
@@ -136,43 +593,174 @@ async def analyze_competitor_image(request: AnalyzeRequest, raw_request: Request
     """
     # 预流验证：返回400 JSON（非SSE）
     llm = _resolve_llm(raw_request)
-    is_valid, error_msg = validate_image_base64(request.image)
-    if not is_valid:
+    image = await _request_image(request.image, request.image_id)
+    return await _analyze_response(raw_request, llm, image)
+
+
+@app.post("/api/analyze/upload")
+async def analyze_competitor_image_upload(raw_request: Request):
+    """
+    分析竞品详情页图片（二进制上传版，SSE流式响应）
+
+    - multipart/form-data 的 **image** 文件字段，或 image/* 原始请求体
+    """
+    llm = _resolve_llm(raw_request)
+    image = await _read_single_upload(raw_request)
+    return await _analyze_response(raw_request, llm, image)
+
+
+async def _analyze_response(raw_request: Request, llm: LLMManager, image: ImagePayload) -> StreamingResponse:
+    bypass_cache = _cache_bypassed(raw_request)
+    template = _prompt_template(raw_request, REVERSE_PROMPT)
+    cache_key = make_key(
+        "analyze",
+        image.sha256,
+        template.version,
+        llm.settings.llm_model,
+        settings.llm_temperature,
+        _vision_cache_tag(),
+    )
+
+    async def build_messages() -> list[dict]:
+        return [
+            {"role": "system", "content": template.text},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "请分析这张电商详情页图片并生成视觉风格提示词"},
+                    *await _vision_image_blocks(image),
+                ]
+            }
+        ]
+
+    async def generate() -> AsyncGenerator[str, None]:
+        try:
+            async for line in _stream_chat_sse(
+                llm,
+                build_messages,
+                cache_key=cache_key,
+                cache_namespace="analyze",
+                bypass_cache=bypass_cache,
+                prompt=template.label,
+            ):
+                yield line
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            logger.exception("analyze.failed")
+            yield _sse_error(f"图片分析失败: {str(e)}")
+
+    return await _sse_response(generate(), raw_request)
+
+
+async def _validate_generate_request(request: GenerateRequest) -> Optional[list[ImagePayload]]:
+    """校验生成请求，返回解码后的参考图列表（文生图模式返回 None），失败时抛出 400。"""
+    # 验证提示词
+    if not request.prompt or len(request.prompt.strip()) == 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error_msg
+            detail="提示词不能为空"
         )
 
-    async def generate() -> AsyncGenerator[str, None]:
+    # 图生图模式时在线程池中并行解码并验证每张图片（跳过空字符串），结果直接交给 RunningHub
+    encoded = [img for img in request.target_images or [] if img and not img.isspace()]
+    image_ids = [image_id for image_id in request.target_image_ids or [] if image_id]
+    if len(encoded) + len(image_ids) > MAX_UPLOAD_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"参考图片最多{MAX_UPLOAD_IMAGES}张"
+        )
+    images = await asyncio.gather(
+        *(_decode_image(img, label=f"第{i+1}张图片验证失败: ") for i, img in enumerate(encoded)),
+        *(
+            _stored_image(image_id, label=f"第{len(encoded) + i + 1}张图片: ")
+            for i, image_id in enumerate(image_ids)
+        ),
+    )
+
+    return list(images) or None
+
+
+async def _localize_result(image_url: str) -> str:
+    """开启结果代理时把结果图流式下载到本地仓库并返回 /api/results/{digest}；下载失败时退回远端 URL。"""
+    if not settings.result_store_enabled:
+        return image_url
+    store = get_result_store(settings)
+    try:
+        digest = await inflight.do(
+            make_key("result-fetch", image_url),
+            lambda: store.fetch(get_http_client(settings), image_url),
+        )
+    except Exception:
+        logger.exception("result_store.fetch_failed")
+        return image_url
+    return f"/api/results/{digest}"
+
+
+async def _resume_journaled_tasks() -> None:
+    """启动时接管已退出进程遗留的 RunningHub 任务，轮询到完成后回写对应的异步任务。"""
+    journal = get_task_journal(settings)
+    if journal is None:
+        return
+    await journal.prune(settings.task_journal_retention)
+    entries = await journal.claim_orphans(settings.runninghub_max_poll_time)
+    if not entries:
+        return
+    runninghub = get_runninghub_client()
+    manager = get_job_manager()
+
+    async def resume(entry: JournalEntry) -> None:
+        if entry.key_id != runninghub.admission_key:
+            # API Key 不落盘：前端 Key 提交的任务由客户端重试相同请求时接管
+            await manager.resolve(
+                entry.correlation_id, error="服务重启，请重新提交（带相同 Idempotency-Key 与参数将继续等待原任务，不会重复计费）"
+            )
+            return
         try:
-            messages = [
-                {"role": "system", "content": reverse_prompt_template},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "请分析这张电商详情页图片并生成视觉风格提示词"},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{request.image}"}
-                        }
-                    ]
-                }
-            ]
-            async for chunk in llm.stream_chat(messages):
-                yield _sse_chunk(chunk)
-            yield _sse_chunk("", done=True)
+            image_url = await _localize_result(await runninghub.resume(entry))
         except Exception as e:
-            traceback.print_exc()
-            yield _sse_error(f"图片分析失败: {str(e)}")
+            await manager.resolve(entry.correlation_id, error=f"图片生成失败: {str(e)}")
+        else:
+            await manager.resolve(entry.correlation_id, image_url=image_url)
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-        }
+    logger.info("task_journal.resume", extra={"tasks": len(entries)})
+    await asyncio.gather(*(resume(entry) for entry in entries))
+
+
+async def _generate_coalesced(
+    raw_request: Request,
+    runninghub: RunningHubClient,
+    prompt: str,
+    model: str,
+    reference_images: Optional[list[ImagePayload]],
+    aspect_ratio: str,
+    image_size: str,
+) -> str:
+    """调用 RunningHub 生成图片；同一凭证下参数完全相同的并发请求（双击、多标签页）合并为一次上游任务。"""
+    correlation_id.set(raw_request.headers.get("x-workflow-id", ""))
+    idempotency_key.set(raw_request.headers.get("idempotency-key", ""))
+
+    async def run() -> str:
+        return await _localize_result(await runninghub.generate_image(
+            prompt=prompt,
+            model=model,
+            reference_images=reference_images,
+            aspect_ratio=aspect_ratio,
+            image_size=image_size,
+        ))
+
+    if not settings.singleflight_enabled:
+        return await run()
+    key = make_key(
+        "generate",
+        raw_request.headers.get("x-runninghub-api-key", ""),
+        prompt,
+        model,
+        aspect_ratio,
+        image_size,
+        *(image.sha256 for image in reference_images or []),
     )
+    return await inflight.do(key, run)
 
 
 @app.post("/api/generate", response_model=GenerateResponse)
@@ -187,37 +775,13 @@ async def generate_product_image(request: GenerateRequest, raw_request: Request)
     """
     try:
         runninghub = _resolve_runninghub(raw_request)
+        valid_images = await _validate_generate_request(request)
 
-        # 判断生成模式：有有效图片则为图生图
-        has_images = bool(request.target_images and any(img.strip() for img in request.target_images))
-
-        # 图生图模式时验证每张图片
-        if has_images:
-            for i, img in enumerate(request.target_images or []):
-                if not img.strip():
-                    continue
-                is_valid, error_msg = validate_image_base64(img)
-                if not is_valid:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"第{i+1}张图片验证失败: {error_msg}"
-                    )
-
-        # 验证提示词
-        if not request.prompt or len(request.prompt.strip()) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="提示词不能为空"
-            )
-
-        effective_model = request.model or "nano-banana-v2"
-
-        # 过滤空字符串
-        valid_images = [img for img in (request.target_images or []) if img.strip()] if has_images else None
-
-        image_url = await runninghub.generate_image(
+        image_url = await _generate_coalesced(
+            raw_request,
+            runninghub,
             prompt=request.prompt,
-            model=effective_model,
+            model=request.model or "nano-banana-v2",
             reference_images=valid_images,
             aspect_ratio=request.aspect_ratio or "1:1",
             image_size=request.image_size or "2K",
@@ -225,7 +789,7 @@ async def generate_product_image(request: GenerateRequest, raw_request: Request)
 
         return GenerateResponse(image_url=image_url)
 
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         raise HTTPException(
@@ -234,6 +798,275 @@ async def generate_product_image(request: GenerateRequest, raw_request: Request)
         )
 
 
+@app.post("/api/generate/upload", response_model=GenerateResponse)
+async def generate_product_image_upload(raw_request: Request):
+    """
+    生成产品图片（multipart 上传版，参考图以二进制文件提交，免去 Base64 膨胀）
+
+    - **target_images**: 产品参考图片文件（可重复，最多10张；为空时使用文生图模式）
+    - **prompt** / **model** / **aspect_ratio** / **image_size**: 同 /api/generate
+    - 请求体按文件数与每张 5MB 的总量边读边限制，超出时直接返回 400
+    """
+    form = await _read_multipart(raw_request, max_files=MAX_UPLOAD_IMAGES)
+    try:
+        return await _generate_from_form(raw_request, form)
+    finally:
+        await form.close()
+
+
+async def _generate_from_form(raw_request: Request, form: FormData) -> GenerateResponse:
+    def field(name: str) -> Optional[str]:
+        value = form.get(name)
+        return value if isinstance(value, str) else None
+
+    prompt = field("prompt")
+    model, aspect_ratio, image_size = field("model"), field("aspect_ratio"), field("image_size")
+    target_images = [value for value in form.getlist("target_images") if isinstance(value, UploadFile)]
+    if not prompt or len(prompt.strip()) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="提示词不能为空"
+        )
+
+    try:
+        runninghub = _resolve_runninghub(raw_request)
+        images = await asyncio.gather(*(
+            _read_upload_file(upload, label=f"第{i+1}张图片验证失败: ")
+            for i, upload in enumerate(target_images)
+        ))
+
+        image_url = await _generate_coalesced(
+            raw_request,
+            runninghub,
+            prompt=prompt,
+            model=model or "nano-banana-v2",
+            reference_images=list(images) or None,
+            aspect_ratio=aspect_ratio or "1:1",
+            image_size=image_size or "2K",
+        )
+
+        return GenerateResponse(image_url=image_url)
+
+    except (HTTPException, AdmissionRejected):
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"图片生成失败: {str(e)}"
+        )
+
+
+@app.post("/api/generate/batch")
+async def generate_product_image_batch(request: BatchGenerateRequest, raw_request: Request):
+    """
+    批量生成产品图片（SSE流式响应，每完成一张推送一条）
+
+    - **models** × **aspect_ratios** × **image_sizes**: 生成矩阵，所有组合共用 prompt 与参考图
+    - 提交并发受 BATCH_MAX_CONCURRENCY 限制，所有任务由一个轮询器统一查询状态
+    """
+    runninghub = _resolve_runninghub(raw_request)
+    valid_images = await _validate_generate_request(
+        GenerateRequest(
+            target_images=request.target_images,
+            target_image_ids=request.target_image_ids,
+            prompt=request.prompt,
+        )
+    )
+
+    combos = [
+        (model, ratio, size)
+        for model in dict.fromkeys(request.models)
+        for ratio in dict.fromkeys(request.aspect_ratios)
+        for size in dict.fromkeys(s.upper() for s in request.image_sizes)
+    ]
+    if not combos:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="生成组合为空")
+    if len(combos) > settings.batch_max_jobs:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"生成组合过多（{len(combos)}），最多支持 {settings.batch_max_jobs} 个"
+        )
+    for model, _, size in combos:
+        try:
+            runninghub.resolve_model(model)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if size not in IMAGE_SIZE_TO_RESOLUTION:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"不支持的分辨率: {size}")
+
+    async def generate() -> AsyncGenerator[str, None]:
+        correlation_id.set(raw_request.headers.get("x-workflow-id", ""))
+        retry_key = raw_request.headers.get("idempotency-key", "")
+        client = runninghub.with_poll_interval(settings.batch_poll_interval)
+        semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+
+        async def run_one(index: int, model: str, ratio: str, size: str) -> dict[str, object]:
+            # 按组合序号区分：同一批里重复的组合是有意多出几张图
+            idempotency_key.set(f"{retry_key}#{index}" if retry_key else "")
+            item: dict[str, object] = {"index": index, "model": model, "aspect_ratio": ratio, "image_size": size}
+            try:
+                async with semaphore:
+                    item["image_url"] = await _localize_result(await client.generate_image(
+                        prompt=request.prompt,
+                        model=model,
+                        reference_images=valid_images,
+                        aspect_ratio=ratio,
+                        image_size=size,
+                    ))
+            except Exception as e:
+                item["error"] = f"图片生成失败: {str(e)}"
+            return item
+
+        tasks = [asyncio.create_task(run_one(i, *combo)) for i, combo in enumerate(combos)]
+        succeeded = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                item = await finished
+                succeeded += "image_url" in item
+                yield f"data: {json.dumps({**item, 'done': False}, ensure_ascii=False)}\n\n"
+            summary = {"total": len(combos), "succeeded": succeeded, "failed": len(combos) - succeeded, "done": True}
+            yield f"data: {json.dumps(summary, ensure_ascii=False)}\n\n"
+        finally:
+            # 客户端断开时取消尚未完成的组合
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+RESULT_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+
+@app.get("/api/results/{digest}")
+async def get_result_image(digest: str, raw_request: Request, w: Optional[int] = None):
+    """
+    读取本地缓存的生成结果（RESULT_STORE_ENABLED 开启时 /api/generate 返回此地址）
+
+    - 内容按 sha256 寻址，响应带 ETag 与 immutable 缓存头，支持 Range 断点续传
+    - **w**: 可选缩略图宽度（取 128 / 256 / 512 / 1024 中不小于该值的最小档）
+    """
+    if not is_image_id(digest):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="结果图片不存在")
+    store = get_result_store(settings)
+    key = digest if w is None else thumbnail_key(digest, thumbnail_width(max(1, w)))
+    etag = f'"{key}"'
+    if etag in raw_request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **RESULT_CACHE_HEADERS})
+
+    found = await asyncio.to_thread(store.open, key)
+    if found is None and w is not None:
+        original = await asyncio.to_thread(store.locate, digest)
+        if original is not None:
+            try:
+                thumbnail = await get_image_pool(settings).run(make_thumbnail, original, thumbnail_width(max(1, w)))
+            except PoolSaturatedError:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="服务繁忙，请稍后重试")
+            except Exception:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="结果图片无法生成缩略图")
+            await asyncio.to_thread(store.put_derived, key, thumbnail)
+            found = await asyncio.to_thread(store.open, key)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="结果图片不存在或已过期")
+
+    path, stat_result, media_type = found
+    return FileResponse(
+        path,
+        media_type=media_type,
+        stat_result=stat_result,
+        headers={"ETag": etag, **RESULT_CACHE_HEADERS},
+    )
+
+
+def _job_response(job: Job) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        image_url=job.image_url,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(request: GenerateRequest, raw_request: Request):
+    """
+    提交异步图片生成任务，立即返回任务ID
+
+    参数同 /api/generate；通过 GET /api/jobs/{job_id} 查询或 GET /api/jobs/{job_id}/events 订阅状态。
+    """
+    manager = get_job_manager()
+    runninghub = _resolve_runninghub(raw_request)
+    valid_images = await _validate_generate_request(request)
+
+    model = request.model or "nano-banana-v2"
+    aspect_ratio = request.aspect_ratio or "1:1"
+    image_size = request.image_size or "2K"
+    retry_key = raw_request.headers.get("idempotency-key", "")
+
+    async def run() -> str:
+        idempotency_key.set(retry_key)
+        return await _localize_result(await runninghub.generate_image(
+            prompt=request.prompt,
+            model=model,
+            reference_images=valid_images,
+            aspect_ratio=aspect_ratio,
+            image_size=image_size,
+        ))
+
+    job = await manager.submit(
+        {
+            "prompt": request.prompt,
+            "model": model,
+            "aspect_ratio": aspect_ratio,
+            "image_size": image_size,
+            "reference_image_count": len(valid_images or []),
+        },
+        run,
+    )
+    return _job_response(job)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_generation_job(job_id: str):
+    """查询异步生成任务状态"""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+    return _job_response(job)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str):
+    """订阅异步生成任务状态变化（SSE），任务结束后关闭连接"""
+    manager = get_job_manager()
+    if await manager.get(job_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+
+    async def generate() -> AsyncGenerator[str, None]:
+        async for job in manager.watch(job_id):
+            data = _job_response(job).model_dump()
+            data["done"] = job.is_terminal
+            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 @app.post("/api/fuse-prompt")
 async def fuse_prompt(request: FusePromptRequest, raw_request: Request):
     """
@@ -256,31 +1089,43 @@ async def fuse_prompt(request: FusePromptRequest, raw_request: Request):
         )
 
     llm = _resolve_llm(raw_request)
+    bypass_cache = _cache_bypassed(raw_request)
+    template = _prompt_template(raw_request, FUSE_PROMPT)
+    # 规范化后的输入（全角转半角、折叠空白）参与缓存键，外观差异不影响命中
+    cache_key = make_key(
+        "fuse-prompt",
+        canonical_text(request.analysis_result),
+        canonical_text(request.product_info),
+        template.version,
+        llm.settings.llm_model,
+        settings.llm_temperature,
+    ) if settings.fuse_prompt_cache_enabled else None
 
     async def generate() -> AsyncGenerator[str, None]:
         try:
             messages = [
-                {"role": "system", "content": fuse_prompt_template},
+                {"role": "system", "content": template.text},
                 {
                     "role": "user",
                     "content": f"## 竞品分析模板\n\n{request.analysis_result}\n\n## 目标产品信息\n\n{request.product_info}"
                 }
             ]
-            async for chunk in llm.stream_chat(messages):
-                yield _sse_chunk(chunk)
-            yield _sse_chunk("", done=True)
+            async for line in _stream_chat_sse(
+                llm,
+                messages,
+                cache_key=cache_key,
+                cache_namespace="fuse-prompt",
+                bypass_cache=bypass_cache,
+                prompt=template.label,
+            ):
+                yield line
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("fuse_prompt.failed")
             yield _sse_error(f"提示词融合失败: {str(e)}")
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-        }
-    )
+    return await _sse_response(generate(), raw_request)
 
 
 @app.post("/api/recognize-product")
@@ -292,44 +1137,66 @@ async def recognize_product(request: RecognizeProductRequest, raw_request: Reque
     """
     # 预流验证：返回400 JSON（非SSE）
     llm = _resolve_llm(raw_request)
-    is_valid, error_msg = validate_image_base64(request.image)
-    if not is_valid:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error_msg
-        )
+    image = await _request_image(request.image, request.image_id)
+    return await _recognize_response(raw_request, llm, image)
+
+
+@app.post("/api/recognize-product/upload")
+async def recognize_product_upload(raw_request: Request):
+    """
+    识别产品图片中的产品信息（二进制上传版，SSE流式响应）
+
+    - multipart/form-data 的 **image** 文件字段，或 image/* 原始请求体
+    """
+    llm = _resolve_llm(raw_request)
+    image = await _read_single_upload(raw_request)
+    return await _recognize_response(raw_request, llm, image)
+
+
+async def _recognize_response(raw_request: Request, llm: LLMManager, image: ImagePayload) -> StreamingResponse:
+    bypass_cache = _cache_bypassed(raw_request)
+    template = _prompt_template(raw_request, RECOGNIZE_PRODUCT)
+    cache_key = make_key(
+        "recognize-product",
+        image.sha256,
+        template.version,
+        llm.settings.llm_model,
+        settings.llm_recognize_temperature,
+        _vision_cache_tag(),
+    )
+
+    async def build_messages() -> list[dict]:
+        return [
+            {"role": "system", "content": template.text},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "请识别这张图片中的产品信息"},
+                    *await _vision_image_blocks(image),
+                ]
+            }
+        ]
 
     async def generate() -> AsyncGenerator[str, None]:
         try:
-            messages = [
-                {"role": "system", "content": recognize_template},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "请识别这张图片中的产品信息"},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{request.image}"}
-                        }
-                    ]
-                }
-            ]
             # recognize uses temperature=0.3 (lower for more factual output)
-            async for chunk in llm.stream_chat(messages, temperature=settings.llm_recognize_temperature):
-                yield _sse_chunk(chunk)
-            yield _sse_chunk("", done=True)
+            async for line in _stream_chat_sse(
+                llm,
+                build_messages,
+                temperature=settings.llm_recognize_temperature,
+                cache_key=cache_key,
+                cache_namespace="recognize-product",
+                bypass_cache=bypass_cache,
+                prompt=template.label,
+            ):
+                yield line
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("recognize_product.failed")
             yield _sse_error(f"产品识别失败: {str(e)}")
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-        }
-    )
+    return await _sse_response(generate(), raw_request)
 
 
 # 生产环境：挂载静态文件
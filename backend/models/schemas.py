@@ -3,8 +3,9 @@ from typing import Optional
 
 
 class AnalyzeRequest(BaseModel):
-    """竞品图片分析请求"""
-    image: str = Field(..., description="Base64编码的图片数据")
+    """竞品图片分析请求（image 与 image_id 二选一）"""
+    image: Optional[str] = Field(default=None, description="Base64编码的图片数据")
+    image_id: Optional[str] = Field(default=None, description="POST /api/images 返回的图片ID")
 
 
 class AnalyzeResponse(BaseModel):
@@ -19,6 +20,10 @@ class GenerateRequest(BaseModel):
         default=None,
         description="Base64编码的产品参考图片列表（最多10张），为空时使用文生图模式，否则使用图生图模式"
     )
+    target_image_ids: Optional[list[str]] = Field(
+        default=None,
+        description="POST /api/images 返回的图片ID列表，排在 target_images 之后，与其合计最多10张"
+    )
     prompt: str = Field(..., description="编辑后的视觉风格提示词")
     aspect_ratio: Optional[str] = Field(default="1:1", description="图片宽高比")
     image_size: Optional[str] = Field(default="2K", description="图片分辨率: 1K, 2K, 3K, 4K")
@@ -34,6 +39,44 @@ class GenerateResponse(BaseModel):
     status: str = Field(default="success", description="处理状态")
 
 
+class BatchGenerateRequest(BaseModel):
+    """批量生成请求：同一提示词在 模型 × 宽高比 × 分辨率 矩阵上并发生成"""
+    target_images: Optional[list[str]] = Field(
+        default=None,
+        description="Base64编码的产品参考图片列表（最多10张），所有组合共用"
+    )
+    target_image_ids: Optional[list[str]] = Field(default=None, description="POST /api/images 返回的图片ID列表")
+    prompt: str = Field(..., description="编辑后的视觉风格提示词")
+    models: list[str] = Field(default_factory=lambda: ["nano-banana-v2"], description="图片生成模型列表")
+    aspect_ratios: list[str] = Field(default_factory=lambda: ["1:1"], description="宽高比列表")
+    image_sizes: list[str] = Field(default_factory=lambda: ["2K"], description="分辨率列表: 1K, 2K, 3K, 4K")
+
+
+class JobResponse(BaseModel):
+    """异步生成任务状态"""
+    job_id: str = Field(..., description="任务ID")
+    status: str = Field(..., description="任务状态: queued, running, succeeded, failed")
+    image_url: Optional[str] = Field(default=None, description="生成图片的URL（成功后返回）")
+    error: Optional[str] = Field(default=None, description="错误信息（失败后返回）")
+    created_at: float = Field(..., description="创建时间（Unix 时间戳）")
+    updated_at: float = Field(..., description="最近更新时间（Unix 时间戳）")
+
+
+class ImageUploadRequest(BaseModel):
+    """图片上传请求（JSON 方式；也可直接 multipart / 二进制上传）"""
+    image: str = Field(..., description="Base64编码的图片数据")
+
+
+class ImageUploadResponse(BaseModel):
+    """图片上传响应"""
+    image_id: str = Field(..., description="图片ID（内容 sha256），可在 analyze / recognize / generate 中代替 Base64")
+    format: str = Field(..., description="图片格式")
+    width: int = Field(..., description="宽度（像素）")
+    height: int = Field(..., description="高度（像素）")
+    size: int = Field(..., description="字节数")
+    expires_in: float = Field(..., description="闲置多少秒后过期（每次使用会重新计时）")
+
+
 class ErrorResponse(BaseModel):
     """错误响应"""
     error: str = Field(..., description="错误信息")
@@ -53,8 +96,9 @@ class FusePromptResponse(BaseModel):
 
 
 class RecognizeProductRequest(BaseModel):
-    """产品信息识别请求"""
-    image: str = Field(..., description="Base64编码的产品图片")
+    """产品信息识别请求（image 与 image_id 二选一）"""
+    image: Optional[str] = Field(default=None, description="Base64编码的产品图片")
+    image_id: Optional[str] = Field(default=None, description="POST /api/images 返回的图片ID")
 
 
 class RecognizeProductResponse(BaseModel):
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+生产环境启动入口：多工作进程，关闭热重载，可用时启用 uvloop 事件循环与 httptools 解析器
+
+用法: python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+
+工作进程数默认取 SERVER_WORKERS（0 表示 CPU 核数）。多于一个工作进程时：
+- 任务存储必须共享，JOB_STORE_BACKEND=memory 会切换为 sqlite
+- 准入控制的速率限制共享 SHARED_STATE_PATH 中的令牌桶，并发上限按进程数均分
+- 结果缓存的磁盘层、图片仓库本身就是进程间共享的本地存储
+开发调试仍使用 python main.py（单进程、热重载）。
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import uuid
+from pathlib import Path
+
+import uvicorn
+
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def resolve_workers(requested: int) -> int:
+    return requested if requested > 0 else (os.cpu_count() or 1)
+
+
+def run(workers: int, host: str, port: int) -> None:
+    settings = Settings()
+    workers = resolve_workers(workers)
+    # 工作进程重新加载配置，通过环境变量得知进程数以切换到共享状态
+    os.environ["SERVER_WORKERS"] = str(workers)
+    # 本次启动的标识：任务日志据此区分兄弟工作进程与上次启动留下的任务（services/task_journal.py）
+    os.environ["SERVER_BOOT_ID"] = uuid.uuid4().hex
+    if workers > 1 and settings.job_store_backend.lower() == "memory":
+        # 多工作进程需要共享任务存储
+        logger.warning("serve.job_store_switched", extra={"from": "memory", "to": "sqlite", "workers": workers})
+        os.environ["JOB_STORE_BACKEND"] = "sqlite"
+
+    uvicorn.run(
+        "main:app",
+        app_dir=str(Path(__file__).parent),
+        host=host,
+        port=port,
+        workers=workers,
+        reload=False,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        proxy_headers=True,
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+        access_log=False,  # 应用自己写 JSON 访问日志（services/event_log.py）
+        timeout_graceful_shutdown=30,
+    )
+
+
+def main_cli() -> None:
+    settings = Settings()
+    parser = argparse.ArgumentParser(description="生产环境启动入口")
+    parser.add_argument("--workers", type=int, default=settings.server_workers, help="工作进程数，0 表示 CPU 核数")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    args = parser.parse_args()
+    run(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,505 @@
+"""
+Admission control in front of RunningHub and the Gemini (OpenAI-compatible) LLM.
+
+Each upstream gets one ``AdmissionController`` shared by the whole process. Callers
+are grouped by API key (the per-request ``x-runninghub-api-key`` / ``x-gemini-api-key``
+header, or the server key), identified only by a short hash.
+
+- concurrency caps: at most ``global_limit`` calls in flight, ``key_limit`` per key
+- rates: a token bucket per key (``key_rate`` calls/s, ``key_burst``) and an optional
+  global bucket (``global_rate``)
+- fairness: waiting calls are served by start-time fair queuing; each call's tag
+  advances its key's virtual clock by ``cost`` (e.g. 4 for a 4K image, 1 for 1K), so
+  a tenant submitting heavy batches cannot starve light ones
+- backpressure: when the queue (global or per key) is full, ``AdmissionRejected``
+  is raised with a ``retry_after`` estimate; the API turns it into 429 + Retry-After
+- a key's state is dropped once it is idle (nothing in flight or queued, bucket full
+  again), so memory and dispatch cost follow the active keys, not every key ever seen
+
+With several worker processes (``serve.py --workers N``) the token buckets live in a
+shared SQLite file so rates hold across workers, and concurrency caps are divided
+between the workers. The file is only touched from worker threads, one transaction
+per admission check or dispatch round. Queues and fairness stay per process.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"请求过多，请在 {retry_after} 秒后重试")
+
+
+def key_id(api_key: str) -> str:
+    """Stable, non-reversible label for an API key (used in stats and fairness)."""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        # now 可能早于创建时刻（调用方先取时间再创建令牌桶），不能倒扣
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 = now, or the bucket is unlimited)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+    def refill_time(self, now: float) -> float:
+        """Seconds until the bucket is full again (0 = full, or the bucket is unlimited)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (self.burst - self.tokens) / self.rate)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket kept in a SQLite (WAL) table so every worker process draws from one budget.
+
+    The SQLite work never runs on the event loop: ``transact`` is called through
+    ``asyncio.to_thread`` and handles a batch of buckets in one transaction. In between,
+    ``delay`` and ``take`` work on the local view left by the last transaction, and tokens
+    taken from it are kept as ``pending`` until the next one writes them. Two workers may
+    thus both take the last token; the balance then goes negative and later callers wait
+    longer, keeping the long-run rate exact.
+    """
+
+    _connections: dict[str, sqlite3.Connection] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path: str, name: str, rate: float, burst: int):
+        super().__init__(rate, burst)
+        self.name = name
+        self.pending = 0
+        self._conn = self._connect(path) if rate > 0 else None
+
+    @classmethod
+    def _connect(cls, path: str) -> sqlite3.Connection:
+        with cls._lock:
+            conn = cls._connections.get(path)
+            if conn is None:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+                )
+                cls._connections[path] = conn
+            return conn
+
+    def _tokens(self, conn: sqlite3.Connection, now: float) -> float:
+        row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            return float(self.burst)
+        return min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+
+    def take(self, now: float) -> None:
+        if self._conn is not None:
+            super().take(now)
+            self.pending += 1
+
+    def refill_time(self, now: float) -> float:
+        # 余额保存在共享表中，本地只是视图；待写回的扣减写入后即可丢弃重建
+        return 1.0 if self.pending else 0.0
+
+    @classmethod
+    def transact(
+        cls, buckets: list["SharedTokenBucket"], debits: list[int], take: bool = False
+    ) -> tuple[list[float], bool]:
+        """Write ``debits`` and read back the balances of ``buckets`` (all in one file) in one transaction.
+
+        With ``take``, also takes one token from every bucket if all of them have one.
+        Blocking; run it in a worker thread. Returns (balances, whether the take succeeded).
+        """
+        conn = buckets[0]._conn
+        wall = time.time()
+        with cls._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                balances = [bucket._tokens(conn, wall) - debit for bucket, debit in zip(buckets, debits)]
+                taken = take and all(balance >= 1 for balance in balances)
+                if taken:
+                    balances = [balance - 1 for balance in balances]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    [(bucket.name, balance, wall) for bucket, balance in zip(buckets, balances)],
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return balances, taken
+
+
+class _Waiter:
+    __slots__ = ("future", "tag", "cost", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tag: float, cost: float, enqueued_at: float):
+        self.future = future
+        self.tag = tag
+        self.cost = cost
+        self.enqueued_at = enqueued_at
+
+
+class _KeyState:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.active = 0
+        self.queue: deque[_Waiter] = deque()
+        self.last_tag = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        global_limit: int,
+        key_limit: int,
+        key_rate: float = 0.0,
+        key_burst: int = 1,
+        global_rate: float = 0.0,
+        queue_size: int = 64,
+        key_queue_size: int = 16,
+        enabled: bool = True,
+        shared_path: str = "",
+        name: str = "admission",
+    ):
+        self.enabled = enabled
+        self.shared_path = shared_path
+        self.name = name
+        self.global_limit = global_limit
+        self.key_limit = key_limit
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.queue_size = queue_size
+        self.key_queue_size = key_queue_size
+        self.active = 0
+        self._queued = 0
+        self._vtime = 0.0
+        self._hold = 1.0  # 单次调用占用时长的 EWMA，用于估算 Retry-After
+        self._bucket = self._make_bucket("*", global_rate, max(1, global_limit))
+        self._keys: dict[str, _KeyState] = {}
+        self._waiting: dict[str, _KeyState] = {}        # 有排队调用的 Key，调度只遍历这些
+        self._idle: list[tuple[float, str]] = []        # (令牌桶回满时刻, Key) 小顶堆，到期后丢弃空闲 Key
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._syncing: Optional[asyncio.Task] = None
+        self._resync = False
+        self._debited: set[TokenBucket] = set()         # 调度时在本地扣减、尚未写回共享表的令牌桶
+
+    def _make_bucket(self, key: str, rate: float, burst: int) -> TokenBucket:
+        if self.shared_path:
+            return SharedTokenBucket(self.shared_path, f"{self.name}:{key}", rate, burst)
+        return TokenBucket(rate, burst)
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState(self._make_bucket(key, self.key_rate, self.key_burst))
+        return state
+
+    def _settle(self, key: str, state: _KeyState, now: float) -> None:
+        """Schedule ``key`` for removal once it has nothing in flight or queued."""
+        if not state.active and not state.queue:
+            heapq.heappush(self._idle, (now + state.bucket.refill_time(now), key))
+
+    def _forget_idle(self, now: float) -> None:
+        while self._idle and self._idle[0][0] <= now:
+            _, key = heapq.heappop(self._idle)
+            state = self._keys.get(key)
+            if state is None or state.active or state.queue:
+                continue  # 已删除，或重新活跃（再次空闲时会重新登记）
+            wait = state.bucket.refill_time(now)
+            if wait > 0:
+                heapq.heappush(self._idle, (now + wait, key))
+            else:
+                del self._keys[key]
+
+    def _ready_in(self, state: _KeyState, now: float) -> Optional[float]:
+        """Seconds until ``state`` may start a call; None while a concurrency cap blocks it."""
+        if self.active >= self.global_limit or state.active >= self.key_limit:
+            return None
+        return max(state.bucket.delay(now), self._bucket.delay(now))
+
+    def _admit(self, state: _KeyState, waited: float, now: float, take: bool = True) -> None:
+        if take:
+            state.bucket.take(now)
+            self._bucket.take(now)
+        state.active += 1
+        self.active += 1
+        state.admitted += 1
+        state.wait_total += waited
+        state.wait_max = max(state.wait_max, waited)
+
+    def retry_after(self) -> int:
+        throughput = self.global_limit / max(self._hold, 0.1)
+        return min(60, max(1, math.ceil((self._queued + 1) / throughput)))
+
+    async def acquire(self, key: str, cost: float = 1.0) -> None:
+        now = time.monotonic()
+        self._forget_idle(now)
+        state = self._state(key)
+        if not self._queued and self._ready_in(state, now) == 0:
+            if not self.shared_path:
+                self._admit(state, 0.0, now)
+                return
+            # 共享令牌桶：先占住并发名额，在线程中以一个事务核对并扣减令牌
+            state.active += 1
+            self.active += 1
+            try:
+                taken = await self._sync([state.bucket, self._bucket], take=True)
+            except BaseException:
+                self.release(key)
+                raise
+            state.active -= 1
+            self.active -= 1
+            if taken:
+                self._admit(state, 0.0, now, take=False)
+                return
+        if self._queued >= self.queue_size or len(state.queue) >= self.key_queue_size:
+            state.rejected += 1
+            self._settle(key, state, now)
+            raise AdmissionRejected(self.retry_after())
+
+        waiter = _Waiter(
+            asyncio.get_running_loop().create_future(),
+            tag=max(self._vtime, state.last_tag) + cost,
+            cost=cost,
+            enqueued_at=now,
+        )
+        state.last_tag = waiter.tag
+        state.queue.append(waiter)
+        self._waiting[key] = state
+        self._queued += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():
+                if waiter in state.queue:
+                    state.queue.remove(waiter)
+                    self._queued -= 1
+                    if not state.queue:
+                        del self._waiting[key]
+                        self._settle(key, state, time.monotonic())
+            else:
+                # 已放行但调用方在唤醒前被取消：归还名额
+                self.release(key)
+            raise
+
+    def release(self, key: str, held: Optional[float] = None) -> None:
+        state = self._state(key)
+        state.active -= 1
+        self.active -= 1
+        if held is not None:
+            self._hold = 0.8 * self._hold + 0.2 * held
+        self._settle(key, state, time.monotonic())
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        while self._queued and self.active < self.global_limit:
+            best_key = ""
+            best: Optional[_KeyState] = None
+            wake: Optional[float] = None
+            drained: list[str] = []
+            for key, state in self._waiting.items():
+                while state.queue and state.queue[0].future.done():
+                    # 排队期间已取消
+                    state.queue.popleft()
+                    self._queued -= 1
+                if not state.queue:
+                    drained.append(key)
+                    continue
+                delay = self._ready_in(state, now)
+                if delay is None:
+                    continue
+                if delay > 0:
+                    wake = delay if wake is None else min(wake, delay)
+                elif best is None or state.queue[0].tag < best.queue[0].tag:
+                    best_key, best = key, state
+            for key in drained:
+                self._settle(key, self._waiting.pop(key), now)
+            if best is None:
+                if wake is not None:
+                    self._schedule(wake)
+                return
+            waiter = best.queue.popleft()
+            if not best.queue:
+                del self._waiting[best_key]
+            self._queued -= 1
+            self._vtime = max(self._vtime, waiter.tag - waiter.cost)
+            self._admit(best, now - waiter.enqueued_at, now)
+            waiter.future.set_result(None)
+            if self.shared_path:
+                self._debited.add(best.bucket)
+                self._kick()  # 写回本地扣减的令牌
+
+    def _schedule(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None and not self._timer.cancelled() and self._timer.when() <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        if self.shared_path:
+            self._kick()  # 先刷新共享余额（其他进程可能已取走令牌）再调度
+        else:
+            self._dispatch()
+
+    async def _sync(self, buckets: list[TokenBucket], take: bool = False) -> bool:
+        """Run one shared-bucket transaction in a worker thread and refresh the local views."""
+        # 去重：同一令牌桶出现两次会被重复扣减
+        shared = [b for b in dict.fromkeys(buckets) if isinstance(b, SharedTokenBucket) and b.rate > 0]
+        if not shared:
+            return True
+        debits = [bucket.pending for bucket in shared]
+        balances, taken = await asyncio.to_thread(SharedTokenBucket.transact, shared, debits, take)
+        now = time.monotonic()
+        for bucket, debit, balance in zip(shared, debits, balances):
+            # 事务执行期间本地又取走的令牌留待下次写回
+            bucket.pending -= debit
+            bucket.tokens = balance - bucket.pending
+            bucket.updated = now
+        return taken or not take
+
+    def _kick(self) -> None:
+        if self._syncing is not None and not self._syncing.done():
+            self._resync = True
+            return
+        self._syncing = asyncio.get_running_loop().create_task(self._sync_and_dispatch())
+
+    async def _sync_and_dispatch(self) -> None:
+        """Write pending debits and refresh the buckets of waiting keys in one transaction, then dispatch."""
+        self._resync = True
+        while self._resync:
+            self._resync = False
+            buckets = [self._bucket, *self._debited, *(state.bucket for state in self._waiting.values())]
+            self._debited.clear()
+            try:
+                await self._sync(buckets)
+            except Exception:
+                logger.exception("admission.sync_failed", extra={"admission": self.name})
+                self._schedule(1.0)
+                return
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, key: str, cost: float = 1.0) -> AsyncIterator[None]:
+        """Hold one admission slot for ``key`` for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(key, cost)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(key, time.monotonic() - started)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "active": self.active,
+            "queued": self._queued,
+            "keys": {
+                key: {
+                    "active": state.active,
+                    "queued": len(state.queue),
+                    "admitted": state.admitted,
+                    "rejected": state.rejected,
+                    "wait_avg_ms": round(state.wait_total / state.admitted * 1000, 1) if state.admitted else 0.0,
+                    "wait_max_ms": round(state.wait_max * 1000, 1),
+                }
+                for key, state in self._keys.items()
+            },
+        }
+
+
+_runninghub_admission: Optional[AdmissionController] = None
+_llm_admission: Optional[AdmissionController] = None
+
+
+def _per_worker(limit: int, settings: Settings) -> int:
+    """Share of a concurrency cap for one worker process."""
+    return max(1, math.ceil(limit / max(1, settings.server_workers)))
+
+
+def _shared_path(settings: Settings) -> str:
+    return settings.shared_state_path if settings.server_workers > 1 else ""
+
+
+def get_runninghub_admission(settings: Settings) -> AdmissionController:
+    """Return the process-wide admission controller for RunningHub image generation."""
+    global _runninghub_admission
+    if _runninghub_admission is None:
+        _runninghub_admission = AdmissionController(
+            global_limit=_per_worker(settings.runninghub_admission_global_limit, settings),
+            key_limit=_per_worker(settings.runninghub_admission_key_limit, settings),
+            key_rate=settings.runninghub_admission_key_rate,
+            key_burst=settings.runninghub_admission_key_burst,
+            global_rate=settings.runninghub_admission_global_rate,
+            queue_size=settings.runninghub_admission_queue_size,
+            key_queue_size=settings.runninghub_admission_key_queue_size,
+            enabled=settings.admission_enabled,
+            shared_path=_shared_path(settings),
+            name="runninghub",
+        )
+    return _runninghub_admission
+
+
+def get_llm_admission(settings: Settings) -> AdmissionController:
+    """Return the process-wide admission controller for LLM chat calls."""
+    global _llm_admission
+    if _llm_admission is None:
+        _llm_admission = AdmissionController(
+            global_limit=_per_worker(settings.llm_admission_global_limit, settings),
+            key_limit=_per_worker(settings.llm_admission_key_limit, settings),
+            key_rate=settings.llm_admission_key_rate,
+            key_burst=settings.llm_admission_key_burst,
+            global_rate=settings.llm_admission_global_rate,
+            queue_size=settings.llm_admission_queue_size,
+            key_queue_size=settings.llm_admission_key_queue_size,
+            enabled=settings.admission_enabled,
+            shared_path=_shared_path(settings),
+            name="llm",
+        )
+    return _llm_admission
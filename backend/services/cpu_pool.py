@@ -0,0 +1,116 @@
+"""
+CPU Pool — bounded thread pool for CPU-bound image work (decode, validate, resize).
+
+Keeps base64 decoding and PIL work off the asyncio event loop so concurrent SSE
+streams are not stalled by large uploads. Admission is bounded: at most
+``workers`` jobs run and ``queue_depth`` more wait; beyond that ``run`` raises
+``PoolSaturatedError`` so the endpoint can answer 503 instead of queueing forever.
+Queue depth, running jobs and rejections are exported as ``cpu_pool_*`` metrics.
+With ``workers=0`` jobs run inline on the event loop (previous behaviour).
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from config import Settings
+from services.metrics import cpu_pool_active, cpu_pool_capacity, cpu_pool_queued, cpu_pool_rejected
+
+T = TypeVar("T")
+
+
+class PoolSaturatedError(RuntimeError):
+    """Pool and its wait queue are full."""
+
+
+class CpuPool:
+    def __init__(self, workers: int, queue_depth: int, name: str = "image-cpu"):
+        self.name = name
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) if workers > 0 else None
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        if self._executor is not None:
+            # 抓取时读取当前值；同名的新池（如重建后）替换旧池
+            cpu_pool_active.track(lambda: self.active, name)
+            cpu_pool_queued.track(lambda: self.queued, name)
+            cpu_pool_capacity.track(lambda: workers + queue_depth, name)
+
+    async def run(self, fn: Callable[..., T], *args: object) -> T:
+        if self._executor is None:
+            return fn(*args)
+
+        with self._lock:
+            if self.active + self.queued >= self.workers + self.queue_depth:
+                self.rejected += 1
+                cpu_pool_rejected.inc(self.name)
+                raise PoolSaturatedError("图片处理队列已满，请稍后重试")
+            self.queued += 1
+        submitted = time.perf_counter()
+
+        def job() -> T:
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.wait_seconds += started - submitted
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.run_seconds += time.perf_counter() - started
+
+        def release(future: "Future[T]") -> None:
+            # 排队中被取消（调用方取消、客户端断开或关闭时）的任务不会执行 job()，在此归还排队名额
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+
+        future = self._executor.submit(job)
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "active": self.active,
+                "queued": self.queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+                "avg_run_ms": round(self.run_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_image_pool: Optional[CpuPool] = None
+
+
+def get_image_pool(settings: Settings) -> CpuPool:
+    """Return the process-wide image pool, created on first use."""
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = CpuPool(settings.image_pool_workers, settings.image_pool_queue_depth)
+    return _image_pool
+
+
+def close_image_pool() -> None:
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown()
+        _image_pool = None
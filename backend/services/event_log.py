@@ -0,0 +1,253 @@
+"""
+Event Log — structured, non-blocking logging (JSON lines).
+
+``configure_logging`` routes the root logger through a ``NonBlockingQueueHandler``:
+the request path only builds a LogRecord and appends it to a bounded queue (when the
+queue is full the record is dropped and counted, the caller never waits). A
+``QueueListener`` thread formats the records and writes them to ``LOG_PATH`` with
+size-based rotation, or to stderr.
+
+- every line carries the request id (``x-request-id``, or one generated by
+  ``AccessLogMiddleware``) and, while tracing is on, the trace id
+- fields passed with ``extra=`` become top-level JSON keys
+- high-volume success events are sampled: a record whose ``sample`` attribute names a
+  category ("access", "upstream") is kept with that category's rate and written with
+  ``sample_rate``; warnings and errors are always kept
+- ``upstream_call`` times one call to RunningHub or the LLM and logs it as ``upstream.call``
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import Settings
+from services.metrics import current_endpoint, outcome_of
+from services.tracing import current_span
+
+request_id: ContextVar[str] = ContextVar("request_id", default="")
+
+_RECORD_FIELDS = frozenset(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message", "asctime", "request_id", "trace_id", "sample",
+}
+
+access_logger = logging.getLogger("access")
+upstream_logger = logging.getLogger("upstream")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, event, request/trace ids, extra fields, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, object] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id"):
+            if value := getattr(record, key, ""):
+                data[key] = value
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep records tagged ``sample=<category>`` below WARNING with the category's rate."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "sample", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(category, 1.0)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener thread."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只在请求路径上合并消息参数并记录上下文；JSON 序列化与异常堆栈格式化在写入线程完成
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = request_id.get()
+        if not getattr(record, "trace_id", ""):
+            span = current_span()
+            record.trace_id = span.trace_id if span is not None and span.tracer is not None else ""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _log_file(settings: Settings) -> Path:
+    path = Path(settings.log_path)
+    if settings.server_workers > 1:
+        # 多个工作进程轮转同一个文件会互相覆盖，每个进程写自己的文件
+        path = path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}")
+    return path
+
+
+def configure_logging(settings: Settings) -> None:
+    """Install the queue handler on the root logger and start the background writer."""
+    global _handler, _listener
+    shutdown_logging()
+    if settings.log_path:
+        path = _log_file(settings)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        target: logging.Handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=settings.log_max_bytes, backupCount=settings.log_backup_count, encoding="utf-8"
+        )
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(JsonFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(settings.log_queue_size)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(SamplingFilter({
+        "access": settings.log_access_sample_rate,
+        "upstream": settings.log_upstream_sample_rate,
+    }))
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(settings.log_level.upper())
+    # HTTP 客户端库每个请求一条 INFO，由 upstream.call 事件代替
+    for name in ("httpx", "httpcore", "openai"):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    _listener = logging.handlers.QueueListener(log_queue, target)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records, stop the writer thread and detach the handler."""
+    global _handler, _listener
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def logging_stats() -> dict[str, int]:
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+
+@contextmanager
+def upstream_call(upstream: str, operation: str, **fields: object) -> Iterator[dict[str, object]]:
+    """Time the enclosed upstream call and log it; add response details to the yielded dict."""
+    started = time.perf_counter()
+    details: dict[str, object] = {"upstream": upstream, "operation": operation, **fields}
+    error: Optional[BaseException] = None
+    try:
+        yield details
+    except BaseException as exc:
+        error = exc
+        raise
+    finally:
+        details["outcome"] = outcome = outcome_of(error)
+        details["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if outcome == "success":
+            upstream_logger.info("upstream.call", extra={**details, "sample": "upstream"})
+        elif outcome == "cancelled":
+            upstream_logger.info("upstream.call", extra=details)
+        else:
+            details["error"] = f"{type(error).__name__}: {error}"
+            upstream_logger.warning("upstream.call", extra=details)
+
+
+class AccessLogMiddleware:
+    """Pure ASGI middleware: assigns the request id and writes one access event per request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = ""
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")[:64]
+                break
+        rid = incoming or os.urandom(8).hex()
+        token = request_id.set(rid)
+        started = time.perf_counter()
+        fields: dict[str, object] = {"method": scope["method"], "path": scope["path"], "status": 500, "bytes": 0}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                fields["status"] = message["status"]
+                fields["ttfb_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                headers = message.get("headers", [])
+                for name, value in headers:
+                    if name == b"x-trace-id":
+                        fields["trace_id"] = value.decode("latin-1")
+                message["headers"] = [*headers, (b"x-request-id", rid.encode())]
+            elif message["type"] == "http.response.body":
+                fields["bytes"] = int(fields["bytes"]) + len(message.get("body", b""))  # type: ignore[call-overload]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 在 MetricsMiddleware 内层运行，路由模板已解析
+            fields["route"] = current_endpoint.get() or scope["path"]
+            fields["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            status_code = int(fields["status"])  # type: ignore[call-overload]
+            if status_code >= 500:
+                access_logger.error("http.access", extra=fields)
+            elif status_code >= 400:
+                access_logger.info("http.access", extra=fields)
+            else:
+                access_logger.info("http.access", extra={**fields, "sample": "access"})
+            request_id.reset(token)
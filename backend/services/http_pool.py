@@ -0,0 +1,57 @@
+"""
+Shared HTTP connection pool — one process-wide httpx.AsyncClient for upstream APIs.
+
+The pool is opened and closed by the FastAPI lifespan in ``main.py``. Clients that
+need per-request credentials (e.g. the ``x-runninghub-api-key`` header) pass them as
+request headers and reuse the same pooled transport, so keep-alive connections and
+TLS sessions to runninghub.cn survive across requests.
+"""
+
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from config import Settings
+
+_shared_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 requires the optional ``h2`` package (``httpx[http2]``)."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(settings: Settings) -> httpx.AsyncClient:
+    """Create a pooled AsyncClient from the configured limits."""
+    limits = httpx.Limits(
+        max_connections=settings.http_pool_max_connections,
+        max_keepalive_connections=settings.http_pool_max_keepalive,
+        keepalive_expiry=settings.http_pool_keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        http2=settings.http_pool_http2 and _http2_available(),
+        limits=limits,
+        timeout=httpx.Timeout(60.0),
+    )
+
+
+def open_http_pool(settings: Settings) -> httpx.AsyncClient:
+    """Create the process-wide client (idempotent)."""
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        _shared_client = build_http_client(settings)
+    return _shared_client
+
+
+async def close_http_pool() -> None:
+    """Close the process-wide client and drop its connections."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
+
+
+def get_http_client(settings: Settings) -> httpx.AsyncClient:
+    """Return the shared client, opening it lazily outside the app lifespan (scripts, tests)."""
+    return open_http_pool(settings)
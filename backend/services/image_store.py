@@ -0,0 +1,220 @@
+"""
+Image Store — upload-once, content-addressed storage for reference images.
+
+Clients ``POST /api/images`` once and then pass the returned id (the sha256 of the
+image bytes) as ``image_id`` / ``target_image_ids`` instead of resending Base64 on
+every analyze / recognize / generate call.
+
+- files live under ``<root>/<id[:2]>/<id>``; identical uploads share one file
+- entries expire after ``ttl`` seconds without access (reads refresh the mtime)
+- total size is capped at ``max_bytes``; least recently used files are evicted first
+- several worker processes may share one root: each keeps its own index and falls back
+  to the file (and its mtime) before treating an id as missing or expired
+
+``RemoteUrlCache`` remembers the RunningHub media URL an image was uploaded to, so
+repeat generations can send a short URL in ``imageUrls`` instead of a data URI.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from config import Settings
+
+_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_image_id(value: str) -> bool:
+    return bool(_ID_PATTERN.match(value))
+
+
+class ImageStore:
+    def __init__(self, root: str, ttl: float, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # id -> (size, last access)，按访问时间从旧到新排列
+        self._index: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._load_index()
+
+    def _path(self, image_id: str) -> Path:
+        return self.root / image_id[:2] / image_id
+
+    def _load_index(self) -> None:
+        entries = []
+        for path in self.root.glob("*/*"):
+            if not is_image_id(path.name):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for accessed_at, image_id, size in sorted(entries):
+            self._index[image_id] = (size, accessed_at)
+            self.size += size
+
+    def _remove(self, image_id: str) -> None:
+        entry = self._index.pop(image_id, None)
+        if entry is not None:
+            self.size -= entry[0]
+        self._path(image_id).unlink(missing_ok=True)
+
+    def _sync_from_disk(self, image_id: str) -> Optional[tuple[int, float]]:
+        """Refresh an index entry from the file, which other workers may have written or read."""
+        previous = self._index.pop(image_id, None)
+        if previous is not None:
+            self.size -= previous[0]
+        try:
+            stat = self._path(image_id).stat()
+        except FileNotFoundError:
+            return None
+        entry = (stat.st_size, stat.st_mtime)
+        self._index[image_id] = entry
+        self.size += stat.st_size
+        return entry
+
+    def _evict(self, now: float) -> None:
+        while self._index:
+            image_id, (_, accessed_at) = next(iter(self._index.items()))
+            if self.size > self.max_bytes:
+                self._remove(image_id)
+                continue
+            if now - accessed_at < self.ttl:
+                break
+            entry = self._sync_from_disk(image_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                # 其他工作进程近期访问过
+                continue
+            self._remove(image_id)
+
+    def put_bytes(self, data: bytes) -> str:
+        image_id = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            path = self._path(image_id)
+            try:
+                os.utime(path, (now, now))
+                if image_id not in self._index:
+                    # 其他工作进程已写入同一张图
+                    self.size += len(data)
+            except FileNotFoundError:
+                if image_id in self._index:
+                    # 已被其他工作进程淘汰
+                    self.size -= self._index.pop(image_id)[0]
+                path.parent.mkdir(exist_ok=True)
+                # 先写临时文件再原子替换，读者不会看到半截文件
+                tmp = path.with_name(f".{image_id}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+                self.size += len(data)
+            self._index[image_id] = (len(data), now)
+            self._index.move_to_end(image_id)
+            self._evict(now)
+        return image_id
+
+    def locate(self, image_id: str) -> Optional[Path]:
+        """Return the file of a live entry and mark it as used, or None if missing / expired."""
+        if not is_image_id(image_id):
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._index.get(image_id)
+            if entry is None or now - entry[1] >= self.ttl:
+                entry = self._sync_from_disk(image_id)
+            if entry is None or now - entry[1] >= self.ttl:
+                if entry is not None:
+                    self._remove(image_id)
+                self.misses += 1
+                return None
+            path = self._path(image_id)
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                # 文件被外部清理，同步索引
+                self._index.pop(image_id, None)
+                self.size -= entry[0]
+                self.misses += 1
+                return None
+            self._index[image_id] = (entry[0], now)
+            self._index.move_to_end(image_id)
+            self.hits += 1
+            return path
+
+    def get_bytes(self, image_id: str) -> Optional[bytes]:
+        path = self.locate(image_id)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # 读取前被其他线程 / 进程淘汰
+            return None
+
+    async def put(self, data: bytes) -> str:
+        return await asyncio.to_thread(self.put_bytes, data)
+
+    async def get(self, image_id: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get_bytes, image_id)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._index),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RemoteUrlCache:
+    """Bounded map of "<API key id>:<image sha256>" -> (remote URL, expiry) for RunningHub media uploads."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or time.time() >= entry[1]:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, url: str, ttl: float) -> None:
+        self._entries[key] = (url, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+remote_urls = RemoteUrlCache()
+
+_image_store: Optional[ImageStore] = None
+
+
+def get_image_store(settings: Settings) -> ImageStore:
+    """Return the process-wide image store, creating it on first use."""
+    global _image_store
+    if _image_store is None:
+        _image_store = ImageStore(
+            root=settings.image_store_path,
+            ttl=settings.image_store_ttl,
+            max_bytes=settings.image_store_max_bytes,
+        )
+    return _image_store
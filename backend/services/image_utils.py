@@ -1,7 +1,229 @@
 import base64
+import binascii
+import hashlib
+import math
+from dataclasses import dataclass
+from functools import cached_property
 from io import BytesIO
+from typing import Optional
 
-from PIL import Image
+from PIL import Image, ImageOps
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+# 文件头魔数 → 格式；只读取前 12 字节即可判断
+_MAGIC_FORMATS: tuple[tuple[bytes, str], ...] = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+
+FORMAT_MIME: dict[str, str] = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+
+class ImageValidationError(ValueError):
+    """图片无法通过校验，消息可直接返回给用户"""
+
+
+@dataclass(eq=False)
+class ImagePayload:
+    """
+    一次解码得到的图片：原始字节、格式、尺寸与内容哈希
+
+    在一个请求内复用，LLM 与 RunningHub 两条路径都直接取 data_uri，不再重复解码/拼接。
+    """
+    data: bytes
+    format: str
+    width: int
+    height: int
+    sha256: str
+    _base64: Optional[str] = None
+
+    @property
+    def mime(self) -> str:
+        return FORMAT_MIME[self.format]
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @cached_property
+    def base64(self) -> str:
+        return self._base64 if self._base64 is not None else base64.b64encode(self.data).decode("ascii")
+
+    @cached_property
+    def data_uri(self) -> str:
+        return f"data:{self.mime};base64,{self.base64}"
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """根据文件头识别图片格式（JPEG / PNG / GIF / WebP），无法识别返回 None"""
+    for magic, image_format in _MAGIC_FORMATS:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def load_image_bytes(image_data: bytes, image_base64: Optional[str] = None) -> ImagePayload:
+    """
+    校验图片字节并构建 ImagePayload
+
+    仅解析文件头（魔数 + PIL 惰性打开读取尺寸），不做整图 verify()。
+
+    Raises:
+        ImageValidationError: 图片为空、过大或格式不受支持
+    """
+    if not image_data:
+        raise ImageValidationError("图片数据为空")
+
+    # 检查图片大小（限制5MB）
+    if len(image_data) > MAX_IMAGE_BYTES:
+        raise ImageValidationError(f"图片过大（{len(image_data) / 1024 / 1024:.1f}MB），最大支持5MB")
+
+    image_format = sniff_image_format(image_data[:12])
+    if image_format is None:
+        raise ImageValidationError("无效的图片格式，请上传 JPEG、PNG、GIF 或 WebP 格式")
+
+    try:
+        # Image.open 只读取文件头，像素数据在真正访问时才解码
+        with Image.open(BytesIO(image_data)) as image:
+            width, height = image.size
+    except Exception:
+        raise ImageValidationError("无效的图片格式，请上传 JPEG、PNG、GIF 或 WebP 格式")
+
+    return ImagePayload(
+        data=image_data,
+        format=image_format,
+        width=width,
+        height=height,
+        sha256=hashlib.sha256(image_data).hexdigest(),
+        _base64=image_base64,
+    )
+
+
+def decode_image_base64(image_base64: str) -> ImagePayload:
+    """
+    解码 Base64 图片（支持 data URL 前缀）并校验，整个请求只解码这一次
+
+    Raises:
+        ImageValidationError: 校验失败，消息与 validate_image_base64 一致
+    """
+    if not image_base64:
+        raise ImageValidationError("图片数据为空")
+
+    # 移除可能的data URL前缀
+    clean_base64 = image_base64
+    if "," in image_base64:
+        clean_base64 = image_base64.split(",")[1]
+
+    # 检查base64字符串是否为空
+    if not clean_base64 or clean_base64.strip() == "":
+        raise ImageValidationError("图片数据为空")
+
+    # 解码base64
+    try:
+        image_data = base64.b64decode(clean_base64)
+    except (binascii.Error, ValueError):
+        raise ImageValidationError("无效的Base64编码")
+
+    return load_image_bytes(image_data, image_base64=clean_base64)
+
+
+@dataclass(frozen=True)
+class VisionOptions:
+    """视觉模型输入预处理参数"""
+    max_edge: int = 1536            # 长边上限（像素）
+    output_format: str = "JPEG"     # JPEG 或 WEBP
+    quality: int = 85
+    tile_ratio: float = 2.5         # 高宽比超过该值的长图切成多块
+    max_tiles: int = 4
+    passthrough_bytes: int = 256 * 1024  # 小于该体积、无需缩放/切块且不带元数据的 JPEG/WebP 原样发送
+
+    @property
+    def cache_tag(self) -> str:
+        """参与结果缓存键：预处理参数变化时不复用旧结果"""
+        return f"{self.max_edge}:{self.output_format}:{self.quality}:{self.tile_ratio}:{self.max_tiles}"
+
+
+# EXIF（含 GPS）、XMP、ICC、IPTC、注释等元数据；JFIF（APP0）与 Adobe（APP14）段只描述编码，不算
+_METADATA_KEYS = frozenset({"exif", "xmp", "XML:com.adobe.xmp", "icc_profile", "photoshop", "comment"})
+
+
+def _has_metadata(data: bytes) -> bool:
+    """只读文件头判断图片是否带元数据"""
+    with Image.open(BytesIO(data)) as image:
+        if _METADATA_KEYS.intersection(image.info):
+            return True
+        return any(marker not in ("APP0", "APP14") for marker, _ in getattr(image, "applist", ()))
+
+
+def _encode_vision_image(image: Image.Image, options: VisionOptions) -> ImagePayload:
+    if max(image.size) > options.max_edge:
+        image = image.copy()
+        image.thumbnail((options.max_edge, options.max_edge), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    # 不传 exif/icc 等参数并清空 info（JPEG 编码器会沿用其中的注释），重新编码即去除元数据
+    image.info = {}
+    image.save(buffer, format=options.output_format, quality=options.quality, optimize=True)
+    data = buffer.getvalue()
+    return ImagePayload(
+        data=data,
+        format=options.output_format,
+        width=image.width,
+        height=image.height,
+        sha256=hashlib.sha256(data).hexdigest(),
+    )
+
+
+def prepare_for_vision(payload: ImagePayload, options: VisionOptions) -> list[ImagePayload]:
+    """
+    为视觉模型准备图片：按长边缩放、去除元数据、转为 JPEG/WebP，超长详情页切块
+
+    CPU 密集，调用方应放在线程池中执行。
+
+    Returns:
+        一张或多张（切块时按从上到下顺序）处理后的图片
+    """
+    is_tall = payload.height > payload.width * options.tile_ratio
+    if (
+        not is_tall
+        and max(payload.width, payload.height) <= options.max_edge
+        and payload.format in ("JPEG", "WEBP")
+        and payload.size <= options.passthrough_bytes
+        and not _has_metadata(payload.data)
+    ):
+        return [payload]
+
+    with Image.open(BytesIO(payload.data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ("RGBA", "LA", "P"):
+            # 透明背景铺白，避免 JPEG 转换后变黑
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.split()[-1])
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        if not image.height > image.width * options.tile_ratio:
+            return [_encode_vision_image(image, options)]
+
+        tiles = min(options.max_tiles, math.ceil(image.height / (image.width * options.tile_ratio)))
+        tile_height = math.ceil(image.height / tiles)
+        return [
+            _encode_vision_image(
+                image.crop((0, top, image.width, min(image.height, top + tile_height))),
+                options,
+            )
+            for top in range(0, image.height, tile_height)
+        ]
 
 
 def validate_image_base64(image_base64: str) -> tuple[bool, str]:
@@ -11,39 +233,13 @@ def validate_image_base64(image_base64: str) -> tuple[bool, str]:
     Returns:
         (is_valid, error_message) - 验证结果和错误信息
     """
-    if not image_base64:
-        return False, "图片数据为空"
-
     try:
-        # 移除可能的data URL前缀
-        clean_base64 = image_base64
-        if "," in image_base64:
-            clean_base64 = image_base64.split(",")[1]
-
-        # 检查base64字符串是否为空
-        if not clean_base64 or clean_base64.strip() == "":
-            return False, "图片数据为空"
-
-        # 解码base64
-        try:
-            image_data = base64.b64decode(clean_base64)
-        except Exception:
-            return False, "无效的Base64编码"
-
-        # 检查图片大小（限制5MB）
-        if len(image_data) > 5 * 1024 * 1024:
-            return False, f"图片过大（{len(image_data) / 1024 / 1024:.1f}MB），最大支持5MB"
-
-        # 验证图片格式
-        try:
-            image = Image.open(BytesIO(image_data))
-            image.verify()  # 验证图片完整性
-        except Exception:
-            return False, "无效的图片格式，请上传 JPEG、PNG、GIF 或 WebP 格式"
-
-        return True, ""
+        decode_image_base64(image_base64)
+    except ImageValidationError as e:
+        return False, str(e)
     except Exception as e:
         return False, f"图片验证失败: {str(e)}"
+    return True, ""
 
 
 def is_valid_image(image_base64: str) -> bool:
@@ -0,0 +1,116 @@
+"""
+Job Manager — in-process registry that runs generation jobs in the background.
+
+``submit`` persists a queued job and returns immediately; the RunningHub submit/poll
+runs as an asyncio task. Status changes are written to the job store and pushed to
+any SSE subscribers, so clients no longer need to hold an HTTP request open for the
+whole generation.
+
+With several worker processes a job may be watched from a worker that is not running
+it; such subscribers pick up changes by polling the (shared SQLite) job store.
+
+With a task journal, the job id is the correlation id of its RunningHub task: a job
+interrupted by shutdown after its task was submitted stays running, and ``resolve``
+records the outcome once the task is resumed after the restart.
+"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+from services.job_store import JOB_FAILED, JOB_RUNNING, JOB_SUCCEEDED, Job, JobStore
+from services.task_journal import TaskJournal, correlation_id
+
+logger = logging.getLogger(__name__)
+
+
+class JobManager:
+    def __init__(self, store: JobStore, poll_interval: float = 1.0, journal: TaskJournal | None = None):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.journal = journal
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+        self._subscribers: dict[str, set[asyncio.Queue[Job]]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, params: dict[str, object], runner: Callable[[], Awaitable[str]]) -> Job:
+        """Persist a queued job and start ``runner`` (which returns the image URL) in the background."""
+        job = await self.store.create(Job.new(params))
+        task = asyncio.create_task(self._run(job.id, runner), name=f"job-{job.id}")
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        return await self.store.get(job_id)
+
+    async def _run(self, job_id: str, runner: Callable[[], Awaitable[str]]) -> None:
+        await self._set(job_id, status=JOB_RUNNING)
+        correlation_id.set(job_id)
+        try:
+            image_url = await runner()
+        except asyncio.CancelledError:
+            # 任务已提交到 RunningHub 时保持运行中，重启后接管并回写结果
+            if self.journal is None or not await self.journal.has_pending(job_id):
+                await self._set(job_id, status=JOB_FAILED, error="服务关闭，任务已中断")
+            raise
+        except Exception as e:
+            logger.exception("job.failed", extra={"job_id": job_id})
+            await self._set(job_id, status=JOB_FAILED, error=f"图片生成失败: {str(e)}")
+        else:
+            await self._set(job_id, status=JOB_SUCCEEDED, image_url=image_url)
+
+    async def resolve(self, job_id: str, image_url: str | None = None, error: str | None = None) -> None:
+        """Record the outcome of a job whose task was resumed from the journal; unknown or finished jobs are left alone."""
+        job = await self.store.get(job_id)
+        if job is None or job.is_terminal:
+            return
+        if error is None:
+            await self._set(job_id, status=JOB_SUCCEEDED, image_url=image_url)
+        else:
+            await self._set(job_id, status=JOB_FAILED, error=error)
+
+    async def _set(self, job_id: str, **fields: object) -> None:
+        job = await self.store.update(job_id, **fields)
+        if job is None:
+            return
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(job)
+
+    async def watch(self, job_id: str) -> AsyncIterator[Job]:
+        """Yield the current job state, then every change until it reaches a terminal status."""
+        queue: asyncio.Queue[Job] = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await self.store.get(job_id)
+            while job is not None:
+                yield job
+                if job.is_terminal:
+                    return
+                job = await self._next(job, queue)
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def _next(self, job: Job, queue: asyncio.Queue[Job]) -> Job | None:
+        """Wait for the next change: pushed by the local runner, or seen in the store when another worker runs the job."""
+        while True:
+            try:
+                return await asyncio.wait_for(queue.get(), self.poll_interval)
+            except TimeoutError:
+                latest = await self.store.get(job.id)
+                if latest is None or (latest.status, latest.updated_at) != (job.status, job.updated_at):
+                    return latest
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
@@ -0,0 +1,179 @@
+"""
+Job Store — persistence for asynchronous image generation jobs.
+
+Two interchangeable backends:
+- ``InMemoryJobStore``: process-local dict, the default
+- ``SQLiteJobStore``: a local SQLite file (WAL mode), survives restarts and can be
+  shared by several worker processes on one host
+
+Only job metadata is stored (prompt, model, sizes, result URL) — never image data.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from config import Settings
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = frozenset({JOB_SUCCEEDED, JOB_FAILED})
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = JOB_QUEUED
+    params: dict[str, object] = field(default_factory=dict)
+    image_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def new(cls, params: dict[str, object]) -> "Job":
+        return cls(id=uuid.uuid4().hex, params=params)
+
+    @property
+    def is_terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> dict[str, object]:
+        return asdict(self)
+
+
+class JobStore(ABC):
+    """Interface shared by all job store backends."""
+
+    @abstractmethod
+    async def create(self, job: Job) -> Job: ...
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields: object) -> Optional[Job]: ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]: ...
+
+    async def close(self) -> None:
+        return None
+
+
+class InMemoryJobStore(JobStore):
+    def __init__(self, max_jobs: int = 10000):
+        self._jobs: dict[str, Job] = {}
+        self.max_jobs = max_jobs
+
+    async def create(self, job: Job) -> Job:
+        self._jobs[job.id] = job
+        if len(self._jobs) > self.max_jobs:
+            self._prune()
+        return job
+
+    async def update(self, job_id: str, **fields: object) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.updated_at = time.time()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        # 超出容量时丢弃最早完成的任务（dict 保持插入顺序）
+        for job_id in [j.id for j in self._jobs.values() if j.is_terminal]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    image_url TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _row_to_job(self, row: tuple) -> Job:
+        return Job(
+            id=row[0],
+            status=row[1],
+            params=json.loads(row[2]),
+            image_url=row[3],
+            error=row[4],
+            created_at=row[5],
+            updated_at=row[6],
+        )
+
+    def _create_sync(self, job: Job) -> Job:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.status, json.dumps(job.params, ensure_ascii=False),
+                 job.image_url, job.error, job.created_at, job.updated_at),
+            )
+        return job
+
+    def _get_sync(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def _update_sync(self, job_id: str, fields: dict[str, object]) -> Optional[Job]:
+        allowed = {"status", "image_url", "error"}
+        columns = {k: v for k, v in fields.items() if k in allowed}
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+        return self._get_sync(job_id)
+
+    async def create(self, job: Job) -> Job:
+        return await asyncio.to_thread(self._create_sync, job)
+
+    async def update(self, job_id: str, **fields: object) -> Optional[Job]:
+        return await asyncio.to_thread(self._update_sync, job_id, fields)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self._get_sync, job_id)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def build_job_store(settings: Settings) -> JobStore:
+    backend = settings.job_store_backend.lower()
+    if backend == "memory":
+        if settings.server_workers > 1:
+            raise ValueError("多工作进程部署需要共享任务存储，请设置 JOB_STORE_BACKEND=sqlite")
+        return InMemoryJobStore()
+    if backend == "sqlite":
+        return SQLiteJobStore(settings.job_store_path)
+    raise ValueError(f"不支持的任务存储类型: {settings.job_store_backend}（可选: memory, sqlite）")
@@ -6,6 +6,10 @@ Supports:
 - Per-call temperature override
 - Streaming via async generator
 - Multimodal messages (text + image_url)
+- Reuse of ChatOpenAI instances (and their HTTP pools) via services.model_cache
+- Per-API-key admission control (concurrency / rate / fair queue) via services.admission
+- Tracing spans for message conversion and streamed chunk batches via services.tracing
+- Timed upstream.call log events (duration, first token, chunks) via services.event_log
 
 NOT used for image generation (that stays in GeminiClient with httpx).
 
@@ -15,11 +19,20 @@ Provider-agnostic initialization example (for future use):
     # model = init_chat_model("anthropic:claude-sonnet-4-6")
 """
 
+import time
 from typing import AsyncGenerator, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
 
 from config import Settings
+from services.admission import AdmissionController, get_llm_admission, key_id
+from services.model_cache import ModelCache, get_model_cache
+from services.tracing import tracer
+from services.event_log import upstream_call
+
+# Streamed chunks are traced in batches: a batch span closes after this many chunks or seconds
+TRACE_BATCH_CHUNKS = 16
+TRACE_BATCH_SECONDS = 0.25
 
 
 class LLMManager:
@@ -30,14 +43,26 @@ class LLMManager:
         api_key = settings.gemini_analyze_api_key.get_secret_value()
         if not api_key:
             raise ValueError("GEMINI_ANALYZE_API_KEY环境变量未设置")
-        self.model = ChatOpenAI(
-            base_url=settings.analyze_openai_base_url,
-            api_key=api_key,  # type: ignore[arg-type]
-            model=settings.llm_model,
-            temperature=settings.llm_temperature,
-            streaming=True,
-            timeout=settings.llm_timeout,
+        self._cache: ModelCache = get_model_cache(settings)
+        self.admission: AdmissionController = get_llm_admission(settings)
+        self.admission_key: str = key_id(api_key)
+
+    @property
+    def model(self) -> ChatOpenAI:
+        """The ChatOpenAI instance for the default temperature."""
+        return self._get_model(self.settings.llm_temperature)
+
+    def _get_model(self, temperature: Optional[float] = None) -> ChatOpenAI:
+        """Return a cached ChatOpenAI for (api key, base url, model, temperature)."""
+        if temperature is None:
+            temperature = self.settings.llm_temperature
+        key = ModelCache.make_key(
+            self.settings.gemini_analyze_api_key.get_secret_value(),
+            self.settings.analyze_openai_base_url,
+            self.settings.llm_model,
+            temperature,
         )
+        return self._cache.get_or_create(key, lambda: self._make_model(temperature))
 
     def _make_model(self, temperature: float) -> ChatOpenAI:
         """Create a ChatOpenAI instance with the given temperature."""
@@ -103,22 +128,47 @@ class LLMManager:
         Yields:
             Text chunks as they arrive from the model
         """
-        lc_messages = self._convert_messages(messages)
+        with tracer.span("llm.convert_messages", **{"llm.messages": len(messages)}):
+            lc_messages = self._convert_messages(messages)
 
         # Apply per-call temperature override if provided
-        if temperature is not None and temperature != self.settings.llm_temperature:
-            model = self._make_model(temperature)
-        else:
-            model = self.model
+        model = self._get_model(temperature)
 
+        # Spans are ended explicitly: the generator may be resumed from another context
+        stream_span = tracer.start_span("llm.stream", **{"llm.model": self.settings.llm_model})
+        batch_span = None
+        batch_chunks = 0
+        batch_started = 0.0
         try:
-            async for chunk in model.astream(lc_messages):
-                if hasattr(chunk, "content") and chunk.content:
-                    content = chunk.content
-                    if isinstance(content, str):
-                        yield content
-        except Exception as e:
-            raise RuntimeError(f"LLM streaming error: {str(e)}") from e
+            # Admission is acquired before the stream starts and held until it ends
+            async with self.admission.slot(self.admission_key):
+                try:
+                    with upstream_call("llm", "stream", model=self.settings.llm_model, chunks=0) as call:
+                        started = time.perf_counter()
+                        async for chunk in model.astream(lc_messages):
+                            if hasattr(chunk, "content") and chunk.content:
+                                content = chunk.content
+                                if isinstance(content, str):
+                                    if batch_span is None:
+                                        batch_span = tracer.start_span("llm.chunk_batch", parent=stream_span)
+                                        batch_chunks, batch_started = 0, time.monotonic()
+                                    batch_chunks += 1
+                                    if batch_chunks >= TRACE_BATCH_CHUNKS or time.monotonic() - batch_started >= TRACE_BATCH_SECONDS:
+                                        batch_span.set_attribute("llm.chunks", batch_chunks)
+                                        batch_span.end()
+                                        batch_span = None
+                                    if "first_token_ms" not in call:
+                                        call["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                                    call["chunks"] = int(call["chunks"]) + 1  # type: ignore[call-overload]
+                                    yield content
+                except Exception as e:
+                    stream_span.record_error(e)
+                    raise RuntimeError(f"LLM streaming error: {str(e)}") from e
+        finally:
+            if batch_span is not None:
+                batch_span.set_attribute("llm.chunks", batch_chunks)
+                batch_span.end()
+            stream_span.end()
 
     async def chat(
         self,
@@ -137,14 +187,13 @@ class LLMManager:
         """
         lc_messages = self._convert_messages(messages)
 
-        if temperature is not None and temperature != self.settings.llm_temperature:
-            model = self._make_model(temperature)
-        else:
-            model = self.model
+        model = self._get_model(temperature)
 
-        try:
-            response = await model.ainvoke(lc_messages)
-            content = response.content
-            return str(content) if not isinstance(content, str) else content
-        except Exception as e:
-            raise RuntimeError(f"LLM chat error: {str(e)}") from e
+        async with self.admission.slot(self.admission_key):
+            try:
+                with upstream_call("llm", "invoke", model=self.settings.llm_model):
+                    response = await model.ainvoke(lc_messages)
+                content = response.content
+                return str(content) if not isinstance(content, str) else content
+            except Exception as e:
+                raise RuntimeError(f"LLM chat error: {str(e)}") from e
@@ -0,0 +1,271 @@
+"""
+Metrics — in-process counters and histograms rendered in the Prometheus text format.
+
+Recording is a dict lookup plus a few integer additions on the event loop thread:
+no locks and no per-chunk work, so it stays on under production load. Histogram
+buckets are stored non-cumulatively and summed only when ``/metrics`` is scraped.
+
+``MetricsMiddleware`` times every HTTP request by route template and publishes the
+template through ``current_endpoint`` so deeper layers can label their own metrics
+with the endpoint without threading it through every call.
+
+Each worker process keeps its own registry; scrape each worker (or aggregate by
+``instance``) when running several.
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="")
+
+# 秒级延迟的默认分桶：覆盖毫秒级校验到数分钟的生成任务
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+TEXT_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def samples(self) -> Iterable[str]:
+        for values, total in self._values.items():
+            yield f"{self.name}_total{_format_labels(self.labels, values)} {_format_value(total)}"
+
+
+class Gauge:
+    """Current value per label set; ``track`` registers a function read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def track(self, function: Callable[[], float], *label_values: str) -> None:
+        self._functions[label_values] = function
+
+    def value(self, *label_values: str) -> float:
+        function = self._functions.get(label_values)
+        return function() if function is not None else 0.0
+
+    def samples(self) -> Iterable[str]:
+        for values, function in list(self._functions.items()):
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(function())}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [每个桶的计数..., +Inf 桶计数, sum]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        for values, series in self._series.items():
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {_format_value(cumulative)}"
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {_format_value(cumulative)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[Counter | Gauge | Histogram] = []
+
+    def counter(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request duration until the last body byte", ("endpoint", "method", "status")
+)
+image_validation_seconds = registry.histogram(
+    "image_validation_seconds", "Image decode and validation time", ("endpoint", "outcome")
+)
+cpu_pool_active = registry.gauge("cpu_pool_active", "CPU pool jobs running on a worker thread", ("pool",))
+cpu_pool_queued = registry.gauge("cpu_pool_queued", "CPU pool jobs waiting for a worker thread", ("pool",))
+cpu_pool_capacity = registry.gauge(
+    "cpu_pool_capacity", "CPU pool jobs admitted at most (workers + queue depth)", ("pool",)
+)
+cpu_pool_rejected = registry.counter(
+    "cpu_pool_rejected", "CPU pool jobs rejected because the workers and the queue were full", ("pool",)
+)
+llm_first_token_seconds = registry.histogram(
+    "llm_first_token_seconds", "Time from LLM call to first streamed chunk", ("endpoint", "model", "prompt")
+)
+llm_stream_seconds = registry.histogram(
+    "llm_stream_duration_seconds", "Total LLM stream duration", ("endpoint", "model", "prompt", "outcome")
+)
+llm_output_chars = registry.histogram(
+    "llm_output_chars", "Characters streamed per completed LLM answer", ("endpoint", "model", "prompt"), TEXT_BUCKETS
+)
+llm_cache_requests = registry.counter(
+    "llm_result_cache_requests", "LLM result cache lookups", ("endpoint", "outcome")
+)
+sse_frames = registry.counter("sse_frames", "SSE frames written to clients", ("endpoint",))
+sse_disconnects = registry.counter(
+    "sse_client_disconnects", "SSE responses whose client went away before the stream ended", ("endpoint",)
+)
+# RunningHub 指标的 endpoint 为发起调用的路由，重启后接管的任务为空
+runninghub_submit_seconds = registry.histogram(
+    "runninghub_submit_seconds", "RunningHub task submit request latency", ("endpoint", "path", "mode", "outcome")
+)
+runninghub_task_seconds = registry.histogram(
+    "runninghub_task_seconds", "RunningHub submit-to-result duration", ("endpoint", "path", "resolution", "outcome")
+)
+runninghub_polls_per_task = registry.histogram(
+    "runninghub_polls_per_task", "Status queries issued per RunningHub task", ("endpoint", "path"), COUNT_BUCKETS
+)
+runninghub_attempts = registry.counter(
+    "runninghub_attempts",
+    "RunningHub channel attempts (primary / fallback path usage)",
+    ("endpoint", "path", "mode", "outcome"),
+)
+runninghub_path_skipped = registry.counter(
+    "runninghub_path_skipped", "RunningHub paths skipped because their circuit breaker is open", ("endpoint", "path")
+)
+
+
+def model_label(model: str, known: Iterable[str]) -> str:
+    """Bound the ``model`` label: models outside ``known`` count as ``other``."""
+    return model if model in {name.strip() for name in known if name.strip()} else "other"
+
+
+def outcome_of(exc: BaseException | None) -> str:
+    """Coarse outcome label for a finished operation."""
+    if exc is None:
+        return "success"
+    if isinstance(exc, TimeoutError):
+        return "timeout"
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+        # 客户端断开或任务被取消
+        return "cancelled"
+    return "error"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: labels requests by route template and records their duration."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _endpoint(self, scope: Scope) -> str:
+        router = getattr(scope.get("app"), "router", None)
+        for route in getattr(router, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                # 静态文件挂载在根路径，统一记为 "/"
+                return getattr(route, "path", "") or "/"
+        return "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        token = current_endpoint.set(endpoint)
+        started = time.perf_counter()
+        status_code = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(time.perf_counter() - started, endpoint, scope["method"], status_code)
+            current_endpoint.reset(token)
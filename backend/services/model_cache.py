@@ -0,0 +1,97 @@
+"""
+Model Cache — bounded LRU + idle-TTL cache of ready-to-use chat model instances.
+
+Each ChatOpenAI owns an OpenAI client with its own HTTP connection pool. Keying the
+instances by a hash of (api key, base url, model, temperature) lets requests that
+carry the same ``x-gemini-api-key`` reuse warm connections instead of rebuilding the
+client on every call. The raw API key never appears in the cache key.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+from config import Settings
+
+T = TypeVar("T")
+
+
+class ModelCache(Generic[T]):
+    """LRU cache with idle expiry and hit/miss counters."""
+
+    def __init__(self, max_size: int = 256, ttl: float = 900.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[T, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(api_key: str, base_url: str, model: str, temperature: float) -> str:
+        raw = f"{api_key}\x00{base_url}\x00{model}\x00{temperature!r}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_or_create(self, key: str, factory: Callable[[], T]) -> T:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = factory()
+
+        with self._lock:
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def _evict_idle(self, now: float) -> None:
+        # Entries are ordered by last use, so expired ones are always at the front.
+        while self._entries:
+            key, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used < self.ttl:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_model_cache: Optional[ModelCache] = None
+
+
+def get_model_cache(settings: Settings) -> ModelCache:
+    """Return the process-wide model cache, created on first use."""
+    global _model_cache
+    if _model_cache is None:
+        _model_cache = ModelCache(
+            max_size=settings.llm_model_cache_size,
+            ttl=settings.llm_model_cache_ttl,
+        )
+    return _model_cache
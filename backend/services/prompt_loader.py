@@ -1,27 +1,175 @@
+"""
+Prompt templates — every ``Guidance/*.md`` file, loaded once into a registry.
+
+- a template is keyed by name (the file stem) and identified by its version, the first
+  12 hex digits of the sha256 of its content. The version goes into the result cache
+  keys and the ``prompt`` label of the LLM metrics, so every revision is measured on
+  its own and an edited template never replays answers of the previous one
+- ``get`` never touches the disk. ``watch`` stats the directory every
+  ``prompt_reload_interval`` seconds off the event loop and reloads the files whose
+  mtime or size changed; new files are added, a deleted file keeps its last content
+- ``<name>@<variant>.md`` is a variant of ``<name>``; a request selects it with the
+  ``x-prompt-variant`` header (A/B tests), unknown variants fall back to the default
+- a name without a file uses its built-in fallback text
+
+The ``load_*`` functions read one file directly and raise FileNotFoundError when it is missing.
+"""
+
+import asyncio
+import hashlib
+import logging
 import os
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
+from config import Settings
 
-def load_reverse_prompt_template() -> str:
-    """加载竞品图片反推提示词模板"""
-    template_path = Path(__file__).parent.parent.parent / "Guidance" / "reverse_prompt.md"
+logger = logging.getLogger(__name__)
 
-    if not template_path.exists():
-        raise FileNotFoundError(f"模板文件不存在: {template_path}")
+GUIDANCE_DIR = Path(__file__).parent.parent.parent / "Guidance"
 
-    with open(template_path, "r", encoding="utf-8") as f:
-        return f.read()
+REVERSE_PROMPT = "reverse_prompt"
+FUSE_PROMPT = "fuse_prompt"
+RECOGNIZE_PRODUCT = "recognize_product"
 
+# 模板文件缺失时使用的内置提示词
+BUILTIN_TEMPLATES = {
+    REVERSE_PROMPT: "请分析这张电商详情页图片的构图方式、背景设计、光影质感、文字排版等元素，生成一段可用于图片生成的提示词。",
+    FUSE_PROMPT: "请将目标产品信息融入到竞品分析模板的视觉风格中，生成新的产品图片生成提示词。",
+    RECOGNIZE_PRODUCT: "请识别图片中的产品信息，包括产品名称、外观特征、材质、卖点等。",
+}
 
-def load_fuse_prompt_template() -> str:
-    """加载产品图片融合提示词模板"""
-    template_path = Path(__file__).parent.parent.parent / "Guidance" / "fuse_prompt.md"
+
+def template_version(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    text: str
+    version: str
+    variant: str = ""
+    source: str = "builtin"
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.variant}" if self.variant else self.name
+
+    @property
+    def label(self) -> str:
+        """Metric label and log field: ``name[@variant]:version``."""
+        return f"{self.key}:{self.version}"
+
+
+class TemplateRegistry:
+    def __init__(self, directory: Path = GUIDANCE_DIR, builtin: Optional[dict[str, str]] = None):
+        self.directory = directory
+        self.reloads = 0
+        self._builtin = {
+            name: PromptTemplate(name, text, template_version(text))
+            for name, text in (BUILTIN_TEMPLATES if builtin is None else builtin).items()
+        }
+        self._templates: dict[str, PromptTemplate] = {}
+        self._stamps: dict[str, tuple[int, int]] = {}
+        self.refresh()
+        for name in self._builtin:
+            if name not in self._templates:
+                logger.warning("prompt_template.missing", extra={"template": name, "directory": str(directory)})
+
+    def _scan(self) -> dict[str, tuple[str, tuple[int, int]]]:
+        found: dict[str, tuple[str, tuple[int, int]]] = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return found
+        for entry in entries:
+            if entry.name.endswith(".md") and entry.is_file():
+                stat = entry.stat()
+                found[entry.name[: -len(".md")]] = (entry.path, (stat.st_mtime_ns, stat.st_size))
+        return found
+
+    def refresh(self) -> list[str]:
+        """Reload the files added or modified since the last check; returns the keys whose content changed."""
+        templates = dict(self._templates)
+        changed: list[str] = []
+        for key, (path, stamp) in self._scan().items():
+            if self._stamps.get(key) == stamp:
+                continue
+            try:
+                text = Path(path).read_text(encoding="utf-8")
+            except OSError:
+                continue
+            self._stamps[key] = stamp
+            name, _, variant = key.partition("@")
+            template = PromptTemplate(name, text, template_version(text), variant, path)
+            previous = templates.get(key)
+            templates[key] = template
+            if previous is not None and previous.version != template.version:
+                changed.append(key)
+        # 整体替换：事件循环上的读取方看到旧表或新表，不会看到一半
+        self._templates = templates
+        self.reloads += len(changed)
+        return changed
+
+    def get(self, name: str, variant: str = "") -> PromptTemplate:
+        templates = self._templates
+        if variant and (template := templates.get(f"{name}@{variant}")) is not None:
+            return template
+        template = templates.get(name) or self._builtin.get(name)
+        if template is None:
+            raise KeyError(f"未知的提示词模板: {name}")
+        return template
+
+    def snapshot(self) -> dict[str, dict[str, object]]:
+        templates = {**self._builtin, **self._templates}
+        return {
+            key: {"version": t.version, "source": t.source, "chars": len(t.text)}
+            for key, t in sorted(templates.items())
+        }
+
+    async def watch(self, interval: float) -> None:
+        """Re-check the directory every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changed = await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("prompt_template.refresh_failed")
+                continue
+            for key in changed:
+                logger.info("prompt_template.reloaded", extra={"template": key, "version": self._templates[key].version})
+
+
+_prompt_registry: Optional[TemplateRegistry] = None
+
+
+def get_prompt_registry(settings: Settings) -> TemplateRegistry:
+    """Return the process-wide template registry, loading the directory on first use."""
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = TemplateRegistry(Path(settings.prompt_dir) if settings.prompt_dir else GUIDANCE_DIR)
+    return _prompt_registry
+
+
+def _read_template(name: str) -> str:
+    template_path = GUIDANCE_DIR / f"{name}.md"
 
     if not template_path.exists():
         raise FileNotFoundError(f"模板文件不存在: {template_path}")
 
-    with open(template_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return template_path.read_text(encoding="utf-8")
+
+
+def load_reverse_prompt_template() -> str:
+    """加载竞品图片反推提示词模板"""
+    return _read_template(REVERSE_PROMPT)
+
+
+def load_fuse_prompt_template() -> str:
+    """加载产品图片融合提示词模板"""
+    return _read_template(FUSE_PROMPT)
 
 
 def load_recognize_product_template() -> str:
@@ -31,10 +179,4 @@ def load_recognize_product_template() -> str:
     Returns:
         提示词模板内容
     """
-    template_path = Path(__file__).parent.parent.parent / "Guidance" / "recognize_product.md"
-
-    if not template_path.exists():
-        raise FileNotFoundError(f"模板文件不存在: {template_path}")
-
-    with open(template_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return _read_template(RECOGNIZE_PRODUCT)
@@ -0,0 +1,91 @@
+"""
+Resilience helpers for RunningHub channel selection.
+
+- ``LatencyTracker`` keeps a window of recent successful task durations per api path
+  and reports their p95, used as the hedging threshold.
+- ``CircuitBreaker`` skips an api path after repeated consecutive failures. Once the
+  cooldown has passed the path is tried again (half-open): one more failure re-opens
+  it immediately, a success closes it.
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from config import Settings
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, key: str, duration: float) -> None:
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(duration)
+
+    def percentile(self, key: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        return {
+            key: {"samples": len(samples), "p95": round(self.percentile(key, 0.95) or 0.0, 2)}
+            for key, samples in self._samples.items()
+        }
+
+
+@dataclass
+class _BreakerState:
+    failures: int = 0
+    opened_at: Optional[float] = None
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._states: dict[str, _BreakerState] = {}
+
+    def allow(self, key: str) -> bool:
+        state = self._states.get(key)
+        if state is None or state.opened_at is None:
+            return True
+        return time.monotonic() - state.opened_at >= self.cooldown
+
+    def record_success(self, key: str) -> None:
+        self._states.pop(key, None)
+
+    def record_failure(self, key: str) -> None:
+        state = self._states.setdefault(key, _BreakerState())
+        state.failures += 1
+        if state.failures >= self.failure_threshold:
+            state.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict[str, dict[str, object]]:
+        now = time.monotonic()
+        return {
+            key: {
+                "failures": state.failures,
+                "open": state.opened_at is not None and now - state.opened_at < self.cooldown,
+            }
+            for key, state in self._states.items()
+        }
+
+
+# 进程级实例：所有 RunningHubClient（含按请求 API Key 创建的实例）共享渠道健康状态
+path_latency = LatencyTracker()
+_path_breaker: Optional[CircuitBreaker] = None
+
+
+def get_path_breaker(settings: Settings) -> CircuitBreaker:
+    global _path_breaker
+    if _path_breaker is None:
+        _path_breaker = CircuitBreaker(
+            failure_threshold=settings.runninghub_breaker_failures,
+            cooldown=settings.runninghub_breaker_cooldown,
+        )
+    return _path_breaker
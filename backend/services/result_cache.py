@@ -0,0 +1,246 @@
+"""
+Result Cache — content-addressed cache for LLM text results.
+
+Two tiers:
+- memory: LRU bounded by total bytes, for hot entries
+- disk: a local SQLite file (WAL) bounded by total bytes with LRU eviction by last
+  access time; survives restarts and can be shared by workers on the same host
+
+Entries expire after ``ttl`` seconds in both tiers. Keys are sha256 digests built by
+``make_key`` from the inputs that determine the result (image bytes, template, model,
+temperature), so identical uploads hit regardless of which user sent them.
+"""
+
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from config import Settings
+
+
+def make_key(namespace: str, *parts: str | bytes | float | None) -> str:
+    digest = hashlib.sha256(namespace.encode("utf-8"))
+    for part in parts:
+        data = part if isinstance(part, bytes) else repr(part).encode("utf-8")
+        # 长度前缀避免不同分段拼接出相同字节串
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def canonical_text(text: str) -> str:
+    """
+    Normalize free-form user text before hashing it into a cache key.
+
+    NFKC folds full-width letters, digits and punctuation to their ASCII forms;
+    runs of spaces/tabs collapse to one space, lines are trimmed and repeated
+    blank lines collapse, so cosmetic edits still hit the same entry.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class _MemoryTier:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[str, int, float]] = OrderedDict()
+
+    def get(self, key: str, now: float, ttl: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[2] >= ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: str, value: str, created_at: float) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, size, created_at)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _DiskTier:
+    def __init__(self, path: str, max_bytes: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created_at)")
+            # 总字节数由触发器维护在单行表中，写入时无需对全表求和；多个 worker 共享同一文件时也保持一致
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results_usage (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)"
+                )
+                self._conn.execute("INSERT OR IGNORE INTO results_usage SELECT 0, COALESCE(SUM(size), 0) FROM results")
+                for trigger in (
+                    "results_usage_insert AFTER INSERT ON results BEGIN UPDATE results_usage SET total = total + new.size; END",
+                    "results_usage_update AFTER UPDATE OF size ON results "
+                    "BEGIN UPDATE results_usage SET total = total + new.size - old.size; END",
+                    "results_usage_delete AFTER DELETE ON results BEGIN UPDATE results_usage SET total = total - old.size; END",
+                ):
+                    self._conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger}")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, key: str, now: float, ttl: float) -> Optional[tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= ttl:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, now: float, ttl: float) -> None:
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            # 用 UPSERT 而非 INSERT OR REPLACE：REPLACE 删除旧行时不触发 DELETE 触发器，总字节数会偏大
+            self._conn.execute(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value, size = excluded.size, created_at = excluded.created_at, "
+                "accessed_at = excluded.accessed_at",
+                (key, value, size, now, now),
+            )
+            if self._usage() <= self.max_bytes:
+                return
+            # 超出容量才淘汰：先删过期条目，再按最近访问时间从旧到新分批淘汰，均走索引
+            self._conn.execute("DELETE FROM results WHERE created_at <= ?", (now - ttl,))
+            excess = self._usage() - self.max_bytes
+            while excess > 0:
+                rows = self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at LIMIT 64").fetchall()
+                if not rows:
+                    break
+                victims = []
+                for victim_key, victim_size in rows:
+                    if excess <= 0:
+                        break
+                    victims.append((victim_key,))
+                    excess -= victim_size
+                self._conn.executemany("DELETE FROM results WHERE key = ?", victims)
+
+    def _usage(self) -> int:
+        return self._conn.execute("SELECT total FROM results_usage").fetchone()[0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    def __init__(self, memory_bytes: int, ttl: float, disk_path: str = "", disk_bytes: int = 0):
+        self.ttl = ttl
+        self._memory = _MemoryTier(memory_bytes)
+        self._disk = _DiskTier(disk_path, disk_bytes) if disk_path and disk_bytes > 0 else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # 按端点统计：hits / misses / bypassed（Cache-Control: no-cache）
+        self.namespaces: dict[str, dict[str, int]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._memory.get(key, now, self.ttl)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key, now, self.ttl)
+            if row is not None:
+                self.disk_hits += 1
+                self._memory.set(key, row[0], row[1])
+                return row[0]
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        now = time.time()
+        self._memory.set(key, value, now)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, now, self.ttl)
+
+    def record(self, namespace: str, outcome: str) -> None:
+        counters = self.namespaces.setdefault(namespace, {"hits": 0, "misses": 0, "bypassed": 0})
+        counters[outcome] += 1
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory.size,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "namespaces": {name: dict(counters) for name, counters in self.namespaces.items()},
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache(settings: Settings) -> Optional[ResultCache]:
+    """Return the process-wide result cache, or None when caching is disabled."""
+    global _result_cache
+    if not settings.result_cache_enabled:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            memory_bytes=settings.result_cache_memory_bytes,
+            ttl=settings.result_cache_ttl,
+            disk_path=settings.result_cache_path,
+            disk_bytes=settings.result_cache_disk_bytes,
+        )
+    return _result_cache
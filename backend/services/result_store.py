@@ -0,0 +1,175 @@
+"""
+Result Store — local, content-addressed copies of generated images.
+
+RunningHub result URLs point at a remote CDN, can expire, and make every view of a
+4K result download it again from there. With ``RESULT_STORE_ENABLED`` the backend
+streams each result into this store and hands out ``/api/results/{digest}`` instead.
+
+- downloads are streamed in chunks to a temporary file while hashing, so a result is
+  never held in memory as a whole; the sha256 becomes the id
+- entries share ``ImageStore``'s layout, idle TTL and LRU eviction under ``max_bytes``
+- thumbnails (``?w=``) are rendered on the image pool on first request, snapped to a
+  few fixed widths, and stored next to the originals under a derived id
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Optional
+
+import httpx
+from PIL import Image, ImageOps
+
+from config import Settings
+from services.image_store import ImageStore, RemoteUrlCache
+
+DOWNLOAD_CHUNK = 256 * 1024
+THUMBNAIL_WIDTHS = (128, 256, 512, 1024)
+
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def _write_chunk(f: IO[bytes], hasher: "hashlib._Hash", chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+def sniff_media_type(head: bytes) -> str:
+    for magic, media_type in _MAGIC:
+        if head.startswith(magic):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def thumbnail_width(requested: int) -> int:
+    """Snap a requested width to the next supported size (bounds the number of variants)."""
+    for width in THUMBNAIL_WIDTHS:
+        if requested <= width:
+            return width
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def thumbnail_key(digest: str, width: int) -> str:
+    return hashlib.sha256(f"thumbnail:{digest}:{width}".encode()).hexdigest()
+
+
+def make_thumbnail(path: Path, width: int) -> bytes:
+    """Downscale to ``width`` (keeping the aspect ratio) and encode as JPEG. Runs on the image pool."""
+    with Image.open(path) as source:
+        # JPEG 解码时直接按比例缩小，避免完整解码 4K 原图
+        source.draft("RGB", (width, width))
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=82, progressive=True)
+        return buffer.getvalue()
+
+
+class ResultStore(ImageStore):
+    def __init__(self, root: str, ttl: float, max_bytes: int, max_download_bytes: int):
+        super().__init__(root, ttl, max_bytes)
+        self.max_download_bytes = max_download_bytes
+        self.downloads = 0
+        self.downloaded_bytes = 0
+        # 远端 URL -> digest，同一结果重复本地化时不再下载
+        self.urls = RemoteUrlCache()
+
+    def add_file(self, tmp: Path, image_id: str, size: int) -> None:
+        """Move a fully written temporary file into the store under ``image_id``."""
+        now = time.time()
+        with self._lock:
+            path = self._path(image_id)
+            path.parent.mkdir(exist_ok=True)
+            os.replace(tmp, path)
+            previous = self._index.pop(image_id, None)
+            if previous is not None:
+                self.size -= previous[0]
+            self._index[image_id] = (size, now)
+            self.size += size
+            self._evict(now)
+
+    def put_derived(self, image_id: str, data: bytes) -> None:
+        tmp = self.root / f".derived.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        tmp.write_bytes(data)
+        try:
+            self.add_file(tmp, image_id, len(data))
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def open(self, image_id: str) -> Optional[tuple[Path, os.stat_result, str]]:
+        """Path, stat and media type of a live entry (blocking; call via ``asyncio.to_thread``)."""
+        path = self.locate(image_id)
+        if path is None:
+            return None
+        try:
+            with path.open("rb") as f:
+                head = f.read(12)
+                stat = os.fstat(f.fileno())
+        except FileNotFoundError:
+            return None
+        return path, stat, sniff_media_type(head)
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> str:
+        """Stream ``url`` into the store and return its sha256 digest."""
+        known = self.urls.get(url)
+        if known is not None and await asyncio.to_thread(self.locate, known) is not None:
+            return known
+
+        tmp = self.root / f".download.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with tmp.open("wb") as f:
+                async with client.stream("GET", url, timeout=120.0) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                        size += len(chunk)
+                        if size > self.max_download_bytes:
+                            raise ValueError(f"结果图片超过 {self.max_download_bytes // (1024 * 1024)}MB")
+                        await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+            digest = hasher.hexdigest()
+            await asyncio.to_thread(self.add_file, tmp, digest, size)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self.downloads += 1
+        self.downloaded_bytes += size
+        self.urls.set(url, digest, self.ttl)
+        return digest
+
+    def stats(self) -> dict[str, int]:
+        return {**super().stats(), "downloads": self.downloads, "downloaded_bytes": self.downloaded_bytes}
+
+
+_result_store: Optional[ResultStore] = None
+
+
+def get_result_store(settings: Settings) -> ResultStore:
+    """Return the process-wide result store, creating it on first use."""
+    global _result_store
+    if _result_store is None:
+        _result_store = ResultStore(
+            root=settings.result_store_path,
+            ttl=settings.result_store_ttl,
+            max_bytes=settings.result_store_max_bytes,
+            max_download_bytes=settings.result_store_max_download_bytes,
+        )
+    return _result_store
+
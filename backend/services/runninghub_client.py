@@ -1,10 +1,47 @@
 import asyncio
+import copy
 import importlib
+import time
 from dataclasses import dataclass
 from typing import cast
 
 import httpx
 
+from services.admission import AdmissionController, get_runninghub_admission, key_id
+from services.http_pool import get_http_client
+from services.metrics import (
+    current_endpoint,
+    outcome_of,
+    runninghub_attempts,
+    runninghub_path_skipped,
+    runninghub_submit_seconds,
+    runninghub_task_seconds,
+)
+from services.image_store import RemoteUrlCache, remote_urls
+from services.image_utils import ImagePayload
+from services.resilience import CircuitBreaker, LatencyTracker, get_path_breaker, path_latency
+from services.tracing import KIND_CLIENT, tracer
+from services.event_log import upstream_call
+from services.task_poller import TaskPoller, get_task_poller
+from services.task_journal import (
+    TASK_ABANDONED,
+    TASK_FAILED,
+    TASK_SUCCEEDED,
+    JournalEntry,
+    TaskJournal,
+    correlation_id,
+    get_task_journal,
+    idempotency_key,
+    payload_hash,
+)
+from services.task_completion import (
+    DurationKey,
+    DurationModel,
+    TaskWaiter,
+    duration_model,
+    task_waiter,
+)
+
 _config_module = importlib.import_module("config")
 Settings = _config_module.Settings
 
@@ -18,6 +55,9 @@ class ModelConfig:
 
 
 # 所有模型统一参数格式：resolution（必填）+ aspectRatio（可选）+ imageUrls（图生图）
+# 注意：目前各模型的 api_path_official 与 api_path 相同（尚未接入单独的官方稳定版路径），
+# 因此每个模型只有一个候选渠道：对冲不会触发，熔断也无法切换到其他渠道（全部熔断时仍按原顺序尝试）。
+# 接入官方路径后在此填写即可启用渠道切换。
 MODELS: dict[str, ModelConfig] = {
     "nano-banana-v2": ModelConfig(
         display_name="Nano Banana V2",
@@ -108,8 +148,21 @@ def _build_payload(
     return payload
 
 
-def _base64_to_data_uri(image_base64: str) -> str:
+def _is_path_failure(exc: BaseException) -> bool:
+    """渠道本身的故障（连接/传输错误、5xx、等待超时）才计入熔断。
+
+    4xx（如 API Key 无效）与任务级失败（提示词或内容审核被拒等 FAILED 任务）属于调用方问题，不计入。
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, (httpx.TransportError, TimeoutError))
+
+
+def _base64_to_data_uri(image_base64: "str | ImagePayload") -> str:
     """将裸 base64 字符串转为 data URI（imageUrls 支持此格式，免上传）。"""
+    if isinstance(image_base64, ImagePayload):
+        # 已解码的图片带有正确的 MIME 类型
+        return image_base64.data_uri
     if image_base64.startswith("data:"):
         return image_base64
     return f"data:image/png;base64,{image_base64}"
@@ -118,11 +171,48 @@ def _base64_to_data_uri(image_base64: str) -> str:
 class RunningHubClient:
     """RunningHub 标准模型 API 客户端（统一处理全部图像生成模型）"""
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, http_client: httpx.AsyncClient | None = None):
+        self.settings: Settings = settings
         self.base_url: str = settings.runninghub_base_url.rstrip("/")
         self.api_key: str = settings.runninghub_api_key.get_secret_value()
-        self.poll_interval: int = 3
-        self.max_poll_time: int = 300
+        self.poll_min_interval: float = settings.runninghub_poll_min_interval
+        self.poll_max_interval: float = settings.runninghub_poll_max_interval
+        self.poll_backoff: float = settings.runninghub_poll_backoff
+        self.max_poll_time: float = settings.runninghub_max_poll_time
+        webhook_base = settings.runninghub_webhook_base_url.rstrip("/")
+        self.webhook_url: str = f"{webhook_base}/api/runninghub/webhook" if webhook_base else ""
+        # 多工作进程时 webhook 随机落到某个进程，而唤醒只在本进程生效：仍按历史耗时自适应轮询
+        self.webhook_wakes_poller: bool = bool(self.webhook_url) and settings.server_workers == 1
+        self.duration_model: DurationModel = duration_model
+        self.task_waiter: TaskWaiter = task_waiter
+        self.breaker: CircuitBreaker = get_path_breaker(settings)
+        self.latency: LatencyTracker = path_latency
+        # 可选：参考图上传一次后复用 RunningHub 媒体 URL
+        self.upload_images: bool = settings.runninghub_upload_images
+        self.upload_url_ttl: float = settings.runninghub_upload_url_ttl
+        self.remote_urls: RemoteUrlCache = remote_urls
+        # 按 API Key 的并发 / 速率 / 公平排队（进程内共享）
+        self.admission: AdmissionController = get_runninghub_admission(settings)
+        self.admission_key: str = key_id(self.api_key)
+        # 进程级轮询器：所有未完成任务共用一个时间轮与查询并发上限（见 services/task_poller.py）
+        self.poller: TaskPoller = get_task_poller(settings)
+        # 可选：固定查询间隔（批量生成时使用），为 None 时按历史耗时自适应
+        self.poll_interval: float | None = None
+        # 可选：已提交任务落盘，重启后继续轮询（见 services/task_journal.py）
+        self.journal: TaskJournal | None = get_task_journal(settings)
+        # 共享连接池：未显式传入时使用进程级 client（见 services/http_pool.py）
+        self._http_client: httpx.AsyncClient | None = http_client
+
+    def with_poll_interval(self, interval: float) -> "RunningHubClient":
+        """返回共享同一凭证与连接池、但按固定间隔查询任务状态的副本。"""
+        clone = copy.copy(self)
+        clone.poll_interval = interval
+        return clone
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = get_http_client(self.settings)
+        return self._http_client
 
     def _get_headers(self) -> dict[str, str]:
         return {
@@ -138,39 +228,75 @@ class RunningHubClient:
         payload: dict[str, object],
     ) -> dict[str, object]:
         url = f"{self.base_url}/openapi/v2/{model_path}/{mode}"
-        response = await client.post(url, headers=self._get_headers(), json=payload, timeout=60.0)
-        response.raise_for_status()
-        return _as_dict(cast(object, response.json()))
-
-    async def _poll_task(self, client: httpx.AsyncClient, task_id: str) -> dict[str, object]:
-        url = f"{self.base_url}/openapi/v2/query"
-        elapsed = 0.0
+        started = time.perf_counter()
+        error: BaseException | None = None
+        try:
+            with tracer.span(
+                "runninghub.submit", kind=KIND_CLIENT, **{"runninghub.path": model_path, "runninghub.mode": mode}
+            ) as span, upstream_call("runninghub", "submit", model_path=model_path, mode=mode) as call:
+                response = await client.post(url, headers=self._get_headers(), json=payload, timeout=60.0)
+                span.set_attribute("http.status_code", response.status_code)
+                call["status_code"] = response.status_code
+                response.raise_for_status()
+                result = _as_dict(cast(object, response.json()))
+                span.set_attribute("runninghub.task_id", _as_str(result.get("taskId")))
+                call["task_id"] = _as_str(result.get("taskId"))
+                return result
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            runninghub_submit_seconds.observe(
+                time.perf_counter() - started, current_endpoint.get(), model_path, mode, outcome_of(error)
+            )
 
-        while elapsed < self.max_poll_time:
+    async def _query_task(self, client: httpx.AsyncClient, task_id: str) -> dict[str, object]:
+        with upstream_call("runninghub", "query", task_id=task_id) as call:
             response = await client.post(
-                url,
+                f"{self.base_url}/openapi/v2/query",
                 headers=self._get_headers(),
                 json={"taskId": task_id},
                 timeout=30.0,
             )
+            call["status_code"] = response.status_code
             response.raise_for_status()
             result = _as_dict(cast(object, response.json()))
-            task_status = _as_str(result.get("status"))
+            call["task_status"] = _as_str(result.get("status"))
+            return result
 
-            if task_status == "SUCCESS":
-                return result
-
-            if task_status == "FAILED":
-                error_msg = _as_str(result.get("errorMessage"), "任务失败")
-                failed_reason = result.get("failedReason")
-                if failed_reason is not None:
-                    error_msg += f" — {failed_reason}"
-                raise ValueError(f"RunningHub 任务失败: {error_msg}")
-
-            await asyncio.sleep(self.poll_interval)
-            elapsed += self.poll_interval
-
-        raise TimeoutError(f"RunningHub 任务超时（等待 {self.max_poll_time}s）")
+    async def _upload_image(self, client: httpx.AsyncClient, image: ImagePayload) -> str:
+        """上传参考图到 RunningHub 媒体接口，返回可用于 imageUrls 的下载链接。"""
+        with upstream_call("runninghub", "upload", bytes=len(image.data)) as call:
+            response = await client.post(
+                f"{self.base_url}/openapi/v2/media/upload/binary",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                files={"file": (f"{image.sha256}.{image.format.lower()}", image.data, image.mime)},
+                timeout=60.0,
+            )
+            call["status_code"] = response.status_code
+            response.raise_for_status()
+            body = _as_dict(cast(object, response.json()))
+            url = _as_str(_as_dict(body.get("data")).get("download_url"))
+            if body.get("code") != 0 or not url:
+                raise ValueError(f"RunningHub 上传失败: {_as_str(body.get('message'), 'unknown error')}")
+            return url
+
+    async def _image_url(self, client: httpx.AsyncClient, image: "str | ImagePayload") -> str:
+        """参考图在 imageUrls 中的表示：已上传的远端 URL，或 data URI。"""
+        if not self.upload_images or not isinstance(image, ImagePayload):
+            return _base64_to_data_uri(image)
+        # 上传的媒体归属于提交它的 API Key，按 Key 区分，避免把其他账号的 URL 交给当前账号
+        cache_key = f"{self.admission_key}:{image.sha256}"
+        url = self.remote_urls.get(cache_key)
+        if url:
+            return url
+        try:
+            url = await self._upload_image(client, image)
+        except Exception:
+            # 上传失败不影响生成，本次退回 data URI
+            return image.data_uri
+        self.remote_urls.set(cache_key, url, self.upload_url_ttl)
+        return url
 
     async def _submit_and_wait(
         self,
@@ -179,6 +305,40 @@ class RunningHubClient:
         mode: str,
         payload: dict[str, object],
     ) -> dict[str, object]:
+        started = time.perf_counter()
+        error: BaseException | None = None
+        try:
+            return await self._submit_and_wait_inner(client, model_path, mode, payload)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            runninghub_task_seconds.observe(
+                time.perf_counter() - started,
+                current_endpoint.get(),
+                model_path,
+                _as_str(payload.get("resolution")),
+                outcome_of(error),
+            )
+
+    async def _submit_and_wait_inner(
+        self,
+        client: httpx.AsyncClient,
+        model_path: str,
+        mode: str,
+        payload: dict[str, object],
+    ) -> dict[str, object]:
+        resolution = _as_str(payload.get("resolution"))
+        retry_key = idempotency_key.get()
+        digest = payload_hash(self.admission_key, model_path, mode, payload, retry_key) if self.journal else ""
+        if self.journal is not None and retry_key:
+            # 客户端带相同 Idempotency-Key 重试（如服务重启后）：复用原任务而不重复提交计费
+            previous = await self.journal.find_reusable(digest, self.max_poll_time)
+            if previous is not None and previous.status == TASK_SUCCEEDED and previous.result is not None:
+                return previous.result
+            if previous is not None:
+                return await self._wait_recorded(client, previous.task_id, (model_path, resolution))
+
         submit_result = await self._submit_task(client, model_path, mode, payload)
 
         task_id = _as_str(submit_result.get("taskId"))
@@ -195,7 +355,112 @@ class RunningHubClient:
                 error_msg += f" — {failed_reason}"
             raise ValueError(f"RunningHub 任务提交即失败: {error_msg}")
 
-        return await self._poll_task(client, task_id)
+        if self.journal is not None:
+            await self.journal.record(JournalEntry(
+                task_id=task_id,
+                payload_hash=digest,
+                model_path=model_path,
+                mode=mode,
+                resolution=resolution,
+                key_id=self.admission_key,
+                correlation_id=correlation_id.get(),
+            ))
+        return await self._wait_recorded(client, task_id, (model_path, resolution))
+
+    async def _wait_recorded(
+        self,
+        client: httpx.AsyncClient,
+        task_id: str,
+        duration_key: DurationKey,
+    ) -> dict[str, object]:
+        """等待任务完成并写入任务日志；查询出错或被取消时保持未完成，留待重试或重启后接管。"""
+        try:
+            result = await self.poller.wait(self, client, task_id, duration_key, interval=self.poll_interval)
+        except TimeoutError as exc:
+            if self.journal is not None:
+                await self.journal.finish(task_id, TASK_ABANDONED, error=str(exc))
+            raise
+        except ValueError as exc:
+            if self.journal is not None:
+                await self.journal.finish(task_id, TASK_FAILED, error=str(exc))
+            raise
+        if self.journal is not None:
+            await self.journal.finish(task_id, TASK_SUCCEEDED, result=result)
+        return result
+
+    async def resume(self, entry: JournalEntry) -> str:
+        """继续轮询任务日志中未完成的任务（如重启前提交），返回结果图片 URL。"""
+        result = await self._wait_recorded(self._client(), entry.task_id, (entry.model_path, entry.resolution))
+        return self._extract_first_image_url(result)
+
+    async def _attempt(
+        self,
+        client: httpx.AsyncClient,
+        model_path: str,
+        mode: str,
+        payload: dict[str, object],
+    ) -> dict[str, object]:
+        """单次渠道尝试：记录耗时与熔断状态。"""
+        started = asyncio.get_running_loop().time()
+        try:
+            with tracer.span("runninghub.attempt", **{"runninghub.path": model_path, "runninghub.mode": mode}):
+                result = await self._submit_and_wait(client, model_path, mode, payload)
+        except Exception as exc:
+            if _is_path_failure(exc):
+                self.breaker.record_failure(model_path)
+            runninghub_attempts.inc(current_endpoint.get(), model_path, mode, outcome_of(exc))
+            raise
+        except asyncio.CancelledError:
+            # 对冲中落败的尝试被取消
+            runninghub_attempts.inc(current_endpoint.get(), model_path, mode, "cancelled")
+            raise
+        self.breaker.record_success(model_path)
+        runninghub_attempts.inc(current_endpoint.get(), model_path, mode, "success")
+        self.latency.record(model_path, asyncio.get_running_loop().time() - started)
+        return result
+
+    def _hedge_delay(self, model_path: str) -> float:
+        """对冲阈值：该渠道历史耗时 p95，样本不足时使用配置的默认值。"""
+        p95 = self.latency.percentile(model_path, 0.95, min_samples=self.settings.runninghub_hedge_min_samples)
+        return p95 if p95 is not None else self.settings.runninghub_hedge_delay
+
+    async def _run_hedged(
+        self,
+        client: httpx.AsyncClient,
+        attempts: list[tuple[str, str]],
+        payload: dict[str, object],
+    ) -> dict[str, object]:
+        """对冲请求：当前尝试超过阈值仍未完成时并行提交下一候选，先成功者胜出，其余取消。"""
+        queue = list(attempts)
+        pending: dict[asyncio.Task[dict[str, object]], str] = {}
+        last_error: Exception | None = None
+
+        def launch() -> str:
+            model_path, mode = queue.pop(0)
+            task = asyncio.create_task(self._attempt(client, model_path, mode, payload))
+            pending[task] = model_path
+            return model_path
+
+        latest_path = launch()
+        try:
+            while pending:
+                timeout = self._hedge_delay(latest_path) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    latest_path = launch()
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not pending and queue:
+                    latest_path = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise ValueError(f"RunningHub 调用失败（候选: {attempts}）: {last_error}")
 
     async def _run_with_fallback(
         self,
@@ -204,22 +469,31 @@ class RunningHubClient:
         mode_candidates: tuple[str, ...],
         payload: dict[str, object],
     ) -> dict[str, object]:
-        """先尝试低价渠道版，失败则 fallback 到官方稳定版。"""
+        """先尝试低价渠道版，失败则 fallback 到官方稳定版；开启对冲时超过阈值即并行提交官方版。"""
         path_candidates = [model_config.api_path]
         if model_config.api_path_official != model_config.api_path:
             path_candidates.append(model_config.api_path_official)
 
+        # 熔断中的渠道直接跳过；全部熔断时仍按原顺序尝试，避免完全不可用
+        healthy_paths = [path for path in path_candidates if self.breaker.allow(path)] or path_candidates
+        for path in path_candidates:
+            if path not in healthy_paths:
+                runninghub_path_skipped.inc(current_endpoint.get(), path)
+        attempts = [(path, mode) for path in healthy_paths for mode in mode_candidates]
+
+        if self.settings.runninghub_hedge_enabled and len(attempts) > 1:
+            return await self._run_hedged(client, attempts, payload)
+
         last_error: Exception | None = None
 
-        for model_path in path_candidates:
-            for mode in mode_candidates:
-                try:
-                    return await self._submit_and_wait(client, model_path, mode, payload)
-                except Exception as exc:
-                    last_error = exc
+        for model_path, mode in attempts:
+            try:
+                return await self._attempt(client, model_path, mode, payload)
+            except Exception as exc:
+                last_error = exc
 
         raise ValueError(
-            f"RunningHub 调用失败（路径: {path_candidates}, 模式: {list(mode_candidates)}）: {last_error}"
+            f"RunningHub 调用失败（路径: {healthy_paths}, 模式: {list(mode_candidates)}）: {last_error}"
         )
 
     def _extract_first_image_url(self, result_data: dict[str, object]) -> str:
@@ -233,39 +507,52 @@ class RunningHubClient:
             raise ValueError("RunningHub 结果中未找到图片 URL")
         return image_url
 
+    def resolve_model(self, model: str) -> ModelConfig:
+        """解析模型 ID（兼容旧 ID），不支持时抛出 ValueError。"""
+        model_config = MODELS.get(MODEL_ALIASES.get(model, model))
+        if not model_config:
+            raise ValueError(f"不支持的 RunningHub 模型: {model}")
+        return model_config
+
     async def generate_image(
         self,
         prompt: str,
         model: str,
-        reference_images: list[str] | None = None,
+        reference_images: list[str | ImagePayload] | None = None,
         aspect_ratio: str = "1:1",
         image_size: str = "2K",
     ) -> str:
         """生成图片并返回结果图片 URL。"""
         # 兼容旧 model ID
-        resolved_model = MODEL_ALIASES.get(model, model)
-        model_config = MODELS.get(resolved_model)
-        if not model_config:
-            raise ValueError(f"不支持的 RunningHub 模型: {model}")
-
-        is_img2img = bool(reference_images and len(reference_images) > 0)
-
-        # imageUrls 支持 base64 data URI，无需先上传
-        image_data_uris: list[str] | None = None
-        if is_img2img and reference_images:
-            image_data_uris = [_base64_to_data_uri(img) for img in reference_images]
-
-        payload = _build_payload(
-            prompt=prompt,
-            aspect_ratio=aspect_ratio,
-            image_size=image_size,
-            is_img2img=is_img2img,
-            image_data_uris=image_data_uris,
-        )
+        model_config = self.resolve_model(model)
+
+        # 排队成本按分辨率计：4K 任务占用的公平份额是 1K 的 4 倍
+        resolution = IMAGE_SIZE_TO_RESOLUTION.get(image_size.upper(), "2k")
+        cost = float(resolution.rstrip("k"))
+
+        async with self.admission.slot(self.admission_key, cost=cost):
+            is_img2img = bool(reference_images and len(reference_images) > 0)
+
+            # imageUrls 支持 base64 data URI；开启上传时复用已上传图片的远端 URL
+            client = self._client()
+            image_data_uris: list[str] | None = None
+            if is_img2img and reference_images:
+                image_data_uris = list(await asyncio.gather(
+                    *(self._image_url(client, img) for img in reference_images)
+                ))
+
+            payload = _build_payload(
+                prompt=prompt,
+                aspect_ratio=aspect_ratio,
+                image_size=image_size,
+                is_img2img=is_img2img,
+                image_data_uris=image_data_uris,
+            )
+            if self.webhook_url:
+                payload["webhookUrl"] = self.webhook_url
 
-        mode_candidates = model_config.image_to_image_modes if is_img2img else ("text-to-image",)
+            mode_candidates = model_config.image_to_image_modes if is_img2img else ("text-to-image",)
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
             result_data = await self._run_with_fallback(client, model_config, mode_candidates, payload)
 
-        return self._extract_first_image_url(result_data)
+            return self._extract_first_image_url(result_data)
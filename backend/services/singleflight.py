@@ -0,0 +1,137 @@
+"""
+Single Flight — coalesce concurrent identical requests into one upstream call.
+
+- ``do(key, fn)``: the first caller runs ``fn``; callers arriving while it is in
+  flight await the same result (or exception)
+- ``stream(key, factory)``: the first caller starts the async iterator; later
+  callers attach to a fan-out buffer that replays the chunks produced so far and
+  then follows the live stream
+
+The upstream work is cancelled only when every waiter / subscriber has gone away,
+so one client disconnecting does not break the others. Entries are dropped as soon
+as the upstream finishes; completed results are the result cache's job.
+"""
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class StreamFanout:
+    """Pump one async iterator and replay its items to any number of subscribers."""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.items: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        self._task.add_done_callback(lambda _: callback())
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                changed = self._changed
+                while position < len(self.items):
+                    yield self.items[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # 最后一个订阅者离开：停止上游流
+                self._task.cancel()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, StreamFanout] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            self.leaders += 1
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget_call(key, call))
+        else:
+            self.followers += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget_call(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        fanout = self._streams.get(key)
+        if fanout is None or fanout.done:
+            self.leaders += 1
+            fanout = StreamFanout(factory())
+            self._streams[key] = fanout
+            fanout.add_done_callback(lambda: self._forget_stream(key, fanout))
+        else:
+            self.followers += 1
+        subscription = fanout.subscribe()
+        try:
+            async for item in subscription:
+                yield item
+        finally:
+            # 立即退订，而不是等垃圾回收关闭生成器
+            await subscription.aclose()
+
+    def _forget_stream(self, key: str, fanout: StreamFanout) -> None:
+        if self._streams.get(key) is fanout:
+            del self._streams[key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
+
+
+inflight = SingleFlight()
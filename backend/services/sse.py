@@ -0,0 +1,141 @@
+"""
+SSE streaming helpers for the LLM endpoints (analyze / fuse-prompt / recognize-product).
+
+- ``coalesce``: merge token chunks into fewer frames. The first chunk is sent at once
+  (time to first byte is unchanged); later chunks are flushed every ``interval``
+  seconds, or as soon as ``max_bytes`` are buffered
+- ``until_disconnected``: stop iterating — and so cancel the upstream ``astream`` —
+  as soon as the client goes away, instead of on the next failed write
+- ``json_dumps``: orjson when installed, the standard library otherwise
+"""
+
+import asyncio
+import json
+from collections.abc import AsyncIterator, Callable, Coroutine
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+Receive = Callable[[], Coroutine[Any, Any, dict]]
+
+
+def json_dumps(value: object) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False)
+
+
+def sse_content(content: str, done: bool = False) -> str:
+    """A ``{"content": ..., "done": ...}`` frame; only the text is encoded, the frame layout is fixed."""
+    return f'data: {{"content": {json_dumps(content)}, "done": {"true" if done else "false"}}}\n\n'
+
+
+def sse_error(message: str) -> str:
+    return f'data: {{"error": {json_dumps(message)}, "done": true}}\n\n'
+
+
+async def coalesce(source: AsyncIterator[str], max_bytes: int, interval: float) -> AsyncIterator[str]:
+    """Merge text chunks from ``source``; closing the returned iterator cancels ``source``."""
+    if max_bytes <= 0 and interval <= 0:
+        async for chunk in source:
+            yield chunk
+        return
+
+    buffer: list[str] = []
+    size = 0
+    finished = False
+    error: Optional[Exception] = None
+    ready = asyncio.Event()
+    full = asyncio.Event()
+
+    async def pump() -> None:
+        nonlocal size, finished, error
+        try:
+            async for chunk in source:
+                buffer.append(chunk)
+                size += len(chunk.encode())
+                ready.set()
+                if 0 < max_bytes <= size:
+                    full.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            ready.set()
+            full.set()
+
+    task = asyncio.create_task(pump())
+    first = True
+    try:
+        while True:
+            await ready.wait()
+            if not first and not finished and interval > 0:
+                try:
+                    async with asyncio.timeout(interval):
+                        await full.wait()
+                except TimeoutError:
+                    pass
+            first = False
+            if buffer:
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                ready.clear()
+                full.clear()
+                yield text
+            if finished and not buffer:
+                if error is not None:
+                    raise error
+                return
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def wait_disconnect(receive: Receive) -> None:
+    """Return once the ASGI server reports ``http.disconnect`` (the request body is already consumed)."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def until_disconnected(
+    lines: AsyncIterator[str],
+    receive: Receive,
+    on_disconnect: Optional[Callable[[], None]] = None,
+) -> AsyncIterator[str]:
+    """Yield from ``lines`` until it ends or the client disconnects, then close ``lines``.
+
+    On disconnect the pending step is cancelled, which ends ``lines`` inside that step.
+    The same happens when the caller itself is cancelled (Starlette's own disconnect
+    listener cancels the response task on ASGI servers older than spec 2.4).
+    """
+    watcher = asyncio.ensure_future(wait_disconnect(receive))
+    step: Optional[asyncio.Future[str]] = None
+    try:
+        while True:
+            step = asyncio.ensure_future(anext(lines))
+            await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                if on_disconnect is not None:
+                    on_disconnect()
+                return
+            try:
+                line = step.result()
+            except StopAsyncIteration:
+                return
+            yield line
+    finally:
+        if watcher.done() and not watcher.cancelled():
+            watcher.exception()  # receive 出错同样视为断开
+        watcher.cancel()
+        if step is not None and not step.done():
+            # 生成器正在该任务中运行，不能 aclose；取消后由它自行结束
+            step.cancel()
+            await asyncio.gather(step, return_exceptions=True)
+        else:
+            await lines.aclose()
@@ -0,0 +1,126 @@
+"""
+RunningHub task completion — adaptive poll scheduling and webhook wake-ups.
+
+- ``DurationModel`` learns how long tasks take per (model path, resolution) using an
+  exponentially weighted mean and deviation of observed durations.
+- ``PollSchedule`` turns that estimate into query intervals: sparse while the task
+  is very unlikely to be done, then exponential backoff from a short interval.
+- ``TaskWaiter`` holds one future per outstanding task id; the webhook endpoint
+  resolves it so the poller re-queries immediately instead of sleeping.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+DurationKey = tuple[str, str]
+
+
+class DurationModel:
+    """EWMA estimate of task duration per (model path, resolution)."""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self._mean: dict[DurationKey, float] = {}
+        self._dev: dict[DurationKey, float] = {}
+
+    def record(self, key: DurationKey, duration: float) -> None:
+        mean = self._mean.get(key)
+        if mean is None:
+            self._mean[key] = duration
+            self._dev[key] = duration / 4
+            return
+        self._dev[key] += self.alpha * (abs(duration - mean) - self._dev[key])
+        self._mean[key] = mean + self.alpha * (duration - mean)
+
+    def estimate(self, key: DurationKey) -> Optional[tuple[float, float]]:
+        """(elapsed time after which completion becomes likely, typical spread) or None if unseen."""
+        mean = self._mean.get(key)
+        if mean is None:
+            return None
+        dev = self._dev[key]
+        return max(0.0, mean - 2 * dev), dev
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        return {
+            f"{path}/{resolution}": {"mean": round(mean, 2), "dev": round(self._dev[(path, resolution)], 2)}
+            for (path, resolution), mean in self._mean.items()
+        }
+
+
+class PollSchedule:
+    """Query intervals for one task: wait out the learned quiet period, then back off exponentially.
+
+    With an estimate the backoff is capped at the observed spread, so a task that runs
+    a little longer than usual is still picked up promptly.
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        backoff: float,
+        estimate: Optional[tuple[float, float]] = None,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.dense_from: Optional[float] = None
+        self._cap = max_interval
+        if estimate is not None:
+            self.dense_from = estimate[0]
+            self._cap = min(max_interval, max(min_interval, estimate[1] / 2))
+        self._current = min_interval
+
+    def next_interval(self, elapsed: float) -> float:
+        if self.dense_from is not None and elapsed + self.min_interval < self.dense_from:
+            return min(self.max_interval, self.dense_from - elapsed)
+        interval = self._current
+        self._current = min(self._cap, self._current * self.backoff)
+        return interval
+
+
+class TaskWaiter:
+    """Per-task futures resolved by the RunningHub webhook."""
+
+    def __init__(self, max_early: int = 1024):
+        self._futures: dict[str, asyncio.Future[None]] = {}
+        # 回调可能早于提交响应到达：短暂保留，register 时直接视为已完成
+        self._early: OrderedDict[str, float] = OrderedDict()
+        self._max_early = max_early
+
+    def register(self, task_id: str) -> asyncio.Future[None]:
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        if self._early.pop(task_id, None) is not None:
+            future.set_result(None)
+        self._futures[task_id] = future
+        return future
+
+    def discard(self, task_id: str) -> None:
+        self._futures.pop(task_id, None)
+
+    def notify(self, task_id: str) -> bool:
+        """Wake the waiter for ``task_id``; returns False if nobody was waiting yet."""
+        future = self._futures.get(task_id)
+        if future is None:
+            self._early[task_id] = time.monotonic()
+            while len(self._early) > self._max_early:
+                self._early.popitem(last=False)
+            return False
+        if not future.done():
+            future.set_result(None)
+        return True
+
+    @staticmethod
+    async def wait(future: asyncio.Future[None], timeout: float) -> bool:
+        """Sleep up to ``timeout`` seconds; returns True if woken by a webhook."""
+        if future.done():
+            return True
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+        return bool(done)
+
+
+# 进程级实例：轮询协程与 webhook 端点共享
+duration_model = DurationModel()
+task_waiter = TaskWaiter()
@@ -0,0 +1,281 @@
+"""
+Task Journal — durable record of submitted RunningHub tasks.
+
+RunningHub keeps running (and billing) a task when this process restarts, but the
+poll waiting for it is lost. With ``TASK_JOURNAL_ENABLED`` every submit
+is written to a local SQLite file (WAL mode) before polling starts:
+
+- a row holds the task id, a hash of the submitted payload, model path, mode,
+  resolution, the client correlation id (job id or x-workflow-id), a hash of the API
+  key and the pid and boot id of the process polling it; finishing records the outcome
+- a request retried with the same ``Idempotency-Key`` header (and identical payload)
+  attaches to the task it started instead of paying for a second one: a still-pending
+  task is awaited, a task that has already succeeded is answered from its stored
+  result. Requests without the header always submit, so a deliberate re-roll of the
+  same prompt gets a new image
+- on startup, pending tasks owned by a process that no longer exists are claimed and
+  polled to completion. The boot id is a uuid drawn once per server start (``serve.py``
+  passes it to its workers in ``SERVER_BOOT_ID``), so rows of an earlier start count as
+  orphaned even when a restarted container hands out the same pids. API keys are never stored, so only tasks submitted with the
+  server's own key can be resumed there; the others are picked up when a client
+  retries the same request
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from config import Settings
+
+TASK_PENDING = "pending"
+TASK_SUCCEEDED = "succeeded"
+TASK_FAILED = "failed"
+TASK_ABANDONED = "abandoned"
+
+# 本次启动的标识：serve.py 启动的各工作进程共用同一个，单进程运行时每次启动新生成
+BOOT_ID = os.environ.get("SERVER_BOOT_ID") or uuid.uuid4().hex
+
+# 当前请求的客户端关联 ID：异步任务为 job id，同步接口为 x-workflow-id
+correlation_id: ContextVar[str] = ContextVar("runninghub_correlation_id", default="")
+
+# 客户端的 Idempotency-Key 请求头：带相同键重试的请求复用已提交的任务，为空时总是重新提交
+idempotency_key: ContextVar[str] = ContextVar("runninghub_idempotency_key", default="")
+
+
+def payload_hash(key_id: str, model_path: str, mode: str, payload: dict[str, object], idempotency: str = "") -> str:
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{key_id}\n{idempotency}\n{model_path}\n{mode}\n{body}".encode()).hexdigest()
+
+
+def _owner_alive(pid: int, boot_id: str) -> bool:
+    if boot_id != BOOT_ID:
+        # 之前某次启动留下的任务：进程必然已退出（容器重启后 pid 可能与当前进程相同）
+        return False
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # Windows 上 os.kill(pid, 0) 会终止目标进程，无法探测；视为已退出
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class JournalEntry:
+    task_id: str
+    payload_hash: str
+    model_path: str
+    mode: str
+    resolution: str = ""
+    key_id: str = ""
+    correlation_id: str = ""
+    status: str = TASK_PENDING
+    owner: int = field(default_factory=os.getpid)
+    boot_id: str = field(default_factory=lambda: BOOT_ID)
+    submitted_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    result: Optional[dict[str, object]] = None
+    error: Optional[str] = None
+
+
+class TaskJournal:
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS runninghub_tasks (
+                    task_id TEXT PRIMARY KEY,
+                    payload_hash TEXT NOT NULL,
+                    model_path TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    key_id TEXT NOT NULL,
+                    correlation_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    owner INTEGER NOT NULL,
+                    submitted_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    boot_id TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(runninghub_tasks)")}
+            if "boot_id" not in columns:
+                # 旧版本建的表：补列，旧行的 boot_id 为空，视为之前启动留下的任务
+                self._conn.execute("ALTER TABLE runninghub_tasks ADD COLUMN boot_id TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS runninghub_tasks_pending ON runninghub_tasks (status, payload_hash)"
+            )
+
+    def _row_to_entry(self, row: tuple) -> JournalEntry:
+        return JournalEntry(
+            task_id=row[0],
+            payload_hash=row[1],
+            model_path=row[2],
+            mode=row[3],
+            resolution=row[4],
+            key_id=row[5],
+            correlation_id=row[6],
+            status=row[7],
+            owner=row[8],
+            submitted_at=row[9],
+            updated_at=row[10],
+            result=json.loads(row[11]) if row[11] else None,
+            error=row[12],
+            boot_id=row[13],
+        )
+
+    def _record_sync(self, entry: JournalEntry) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runninghub_tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.task_id, entry.payload_hash, entry.model_path, entry.mode, entry.resolution,
+                 entry.key_id, entry.correlation_id, entry.status, entry.owner, entry.submitted_at,
+                 entry.updated_at, json.dumps(entry.result) if entry.result is not None else None, entry.error,
+                 entry.boot_id),
+            )
+
+    def _get_sync(self, task_id: str) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runninghub_tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def _find_reusable_sync(self, digest: str, since: float) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM runninghub_tasks WHERE status IN (?, ?) AND payload_hash = ? AND submitted_at >= ? "
+                "ORDER BY submitted_at DESC LIMIT 1",
+                (TASK_PENDING, TASK_SUCCEEDED, digest, since),
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def _has_pending_sync(self, correlation: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM runninghub_tasks WHERE status = ? AND correlation_id = ? LIMIT 1",
+                (TASK_PENDING, correlation),
+            ).fetchone()
+        return row is not None
+
+    def _finish_sync(
+        self, task_id: str, status: str, result: Optional[dict[str, object]], error: Optional[str]
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runninghub_tasks SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE task_id = ? AND status = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(),
+                 task_id, TASK_PENDING),
+            )
+
+    def _claim_orphans_sync(self, since: float) -> list[JournalEntry]:
+        now = time.time()
+        pid = os.getpid()
+        with self._lock:
+            # 超过最长等待时间的任务不再接管
+            self._conn.execute(
+                "UPDATE runninghub_tasks SET status = ?, error = ?, updated_at = ? WHERE status = ? AND submitted_at < ?",
+                (TASK_ABANDONED, "超过最长等待时间", now, TASK_PENDING, since),
+            )
+            rows = self._conn.execute(
+                "SELECT * FROM runninghub_tasks WHERE status = ? ORDER BY submitted_at", (TASK_PENDING,)
+            ).fetchall()
+            claimed: list[JournalEntry] = []
+            for row in rows:
+                entry = self._row_to_entry(row)
+                if _owner_alive(entry.owner, entry.boot_id):
+                    continue
+                # 条件更新：多个工作进程同时启动时只有一个能接管
+                cursor = self._conn.execute(
+                    "UPDATE runninghub_tasks SET owner = ?, boot_id = ?, updated_at = ? "
+                    "WHERE task_id = ? AND owner = ? AND boot_id = ? AND status = ?",
+                    (pid, BOOT_ID, now, entry.task_id, entry.owner, entry.boot_id, TASK_PENDING),
+                )
+                if cursor.rowcount == 1:
+                    entry.owner = pid
+                    entry.boot_id = BOOT_ID
+                    claimed.append(entry)
+        return claimed
+
+    def _prune_sync(self, before: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM runninghub_tasks WHERE status != ? AND updated_at < ?", (TASK_PENDING, before)
+            )
+        return cursor.rowcount
+
+    def _stats_sync(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM runninghub_tasks GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    async def record(self, entry: JournalEntry) -> None:
+        await asyncio.to_thread(self._record_sync, entry)
+
+    async def get(self, task_id: str) -> Optional[JournalEntry]:
+        return await asyncio.to_thread(self._get_sync, task_id)
+
+    async def find_reusable(self, digest: str, max_age: float) -> Optional[JournalEntry]:
+        """Latest pending or succeeded task submitted with the same payload hash within ``max_age`` seconds."""
+        return await asyncio.to_thread(self._find_reusable_sync, digest, time.time() - max_age)
+
+    async def has_pending(self, correlation: str) -> bool:
+        return await asyncio.to_thread(self._has_pending_sync, correlation)
+
+    async def finish(
+        self,
+        task_id: str,
+        status: str,
+        result: Optional[dict[str, object]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        await asyncio.to_thread(self._finish_sync, task_id, status, result, error)
+
+    async def claim_orphans(self, max_age: float) -> list[JournalEntry]:
+        """Take over pending tasks whose owning process has exited; older ones are marked abandoned."""
+        return await asyncio.to_thread(self._claim_orphans_sync, time.time() - max_age)
+
+    async def prune(self, retention: float) -> int:
+        """Delete finished rows last updated more than ``retention`` seconds ago."""
+        return await asyncio.to_thread(self._prune_sync, time.time() - retention)
+
+    async def stats(self) -> dict[str, int]:
+        return await asyncio.to_thread(self._stats_sync)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_task_journal: Optional[TaskJournal] = None
+
+
+def get_task_journal(settings: Settings) -> Optional[TaskJournal]:
+    """Return the process-wide task journal, or None when journaling is disabled."""
+    global _task_journal
+    if not settings.task_journal_enabled:
+        return None
+    if _task_journal is None:
+        _task_journal = TaskJournal(settings.task_journal_path)
+    return _task_journal
@@ -0,0 +1,328 @@
+"""
+Task Poller — one process-wide poller for every outstanding RunningHub task.
+
+Instead of one polling coroutine (with its own sleep/query cadence) per task,
+callers register a task id and await a future. The poller keeps the registry of
+outstanding ids with their deadlines and next query times on a hashed timing wheel:
+
+- one driver task advances the wheel every ``tick`` seconds and queries only the
+  tasks that are due, each on its own adaptive ``PollSchedule``
+- queries in flight are capped globally by ``max_in_flight``, whatever the number of
+  waiting tasks or API keys
+- a webhook for a task moves it to the next tick; the same task id awaited twice
+  (e.g. a retry attached through the task journal) shares one registry entry
+"""
+
+import asyncio
+import contextvars
+import math
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from config import Settings
+from services.metrics import current_endpoint, runninghub_polls_per_task
+from services.task_completion import DurationKey, PollSchedule
+from services.tracing import tracer
+
+if TYPE_CHECKING:
+    from services.runninghub_client import RunningHubClient
+
+
+class TimingWheel:
+    """Hashed timing wheel: O(1) schedule / cancel, each tick visits a single slot.
+
+    Items further out than one revolution stay in their slot until the cursor reaches
+    their absolute tick.
+    """
+
+    def __init__(self, tick: float, slots: int, origin: float):
+        self.tick = tick
+        self.origin = origin
+        self.cursor = 0
+        self._slots: list[set["_PollEntry"]] = [set() for _ in range(slots)]
+
+    def schedule(self, entry: "_PollEntry", at: float) -> None:
+        self.cancel(entry)
+        entry.due_tick = max(self.cursor + 1, math.ceil((at - self.origin) / self.tick))
+        self._slots[entry.due_tick % len(self._slots)].add(entry)
+
+    def cancel(self, entry: "_PollEntry") -> None:
+        if entry.due_tick is not None:
+            self._slots[entry.due_tick % len(self._slots)].discard(entry)
+            entry.due_tick = None
+
+    def advance(self, now: float) -> list["_PollEntry"]:
+        """Move the cursor up to ``now`` and return the entries that became due."""
+        due: list["_PollEntry"] = []
+        target = math.floor((now - self.origin) / self.tick)
+        while self.cursor < target:
+            self.cursor += 1
+            slot = self._slots[self.cursor % len(self._slots)]
+            ready = [entry for entry in slot if entry.due_tick is not None and entry.due_tick <= self.cursor]
+            for entry in ready:
+                slot.discard(entry)
+                entry.due_tick = None
+            due.extend(ready)
+        return due
+
+    def next_time(self) -> float:
+        return self.origin + (self.cursor + 1) * self.tick
+
+
+@dataclass(eq=False)
+class _PollEntry:
+    task_id: str
+    client: "RunningHubClient"
+    http_client: httpx.AsyncClient
+    future: asyncio.Future[dict[str, object]]
+    schedule: PollSchedule
+    started: float
+    deadline: float
+    timeout: float
+    duration_key: Optional[DurationKey]
+    context: contextvars.Context
+    signal: Optional[asyncio.Future[None]] = None
+    due_tick: Optional[int] = None
+    waiters: int = 0
+    queries: int = 0
+    last_pending: float = 0.0
+    in_flight: bool = False
+    woken: bool = False
+    query_tasks: set[asyncio.Task[None]] = field(default_factory=set)
+
+
+class TaskPoller:
+    def __init__(self, tick: float = 0.05, slots: int = 1024, max_in_flight: int = 32):
+        self.tick = tick
+        self.slots = slots
+        self.max_in_flight = max_in_flight
+        self.queries = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._entries: dict[str, _PollEntry] = {}
+        self._driver: Optional[asyncio.Task[None]] = None
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        # 每个事件循环一套状态（测试中多次 asyncio.run）
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._entries = {}
+        self._driver = None
+        self._wheel = TimingWheel(self.tick, self.slots, loop.time())
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    @staticmethod
+    def _schedule_for(
+        client: "RunningHubClient", duration_key: Optional[DurationKey], interval: Optional[float]
+    ) -> PollSchedule:
+        if interval is not None:
+            return PollSchedule(interval, interval, 1.0)
+        if client.webhook_wakes_poller:
+            # 单进程时 webhook 负责及时唤醒，轮询仅作兜底
+            return PollSchedule(client.poll_max_interval, client.poll_max_interval, 1.0)
+        return PollSchedule(
+            client.poll_min_interval,
+            client.poll_max_interval,
+            client.poll_backoff,
+            estimate=client.duration_model.estimate(duration_key) if duration_key else None,
+        )
+
+    async def wait(
+        self,
+        client: "RunningHubClient",
+        http_client: httpx.AsyncClient,
+        task_id: str,
+        duration_key: Optional[DurationKey] = None,
+        interval: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> dict[str, object]:
+        """Register ``task_id`` (or join its existing entry) and wait for its final SUCCESS payload."""
+        loop = asyncio.get_running_loop()
+        self._bind(loop)
+        entry = self._entries.get(task_id)
+        if entry is None:
+            now = loop.time()
+            timeout = client.max_poll_time if timeout is None else timeout
+            entry = _PollEntry(
+                task_id=task_id,
+                client=client,
+                http_client=http_client,
+                future=loop.create_future(),
+                schedule=self._schedule_for(client, duration_key, interval),
+                started=now,
+                deadline=now + timeout,
+                timeout=timeout,
+                duration_key=duration_key,
+                # 查询在注册方的上下文中执行，poll span 挂在对应的 attempt 之下
+                context=contextvars.copy_context(),
+            )
+            self._entries[task_id] = entry
+            self._listen(entry)
+            self._reschedule(entry, now)
+            if self._driver is None or self._driver.done():
+                self._driver = asyncio.create_task(self._run(), name="runninghub-task-poller")
+
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.future)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.future.done():
+                # 所有等待方都已取消
+                entry.future.cancel()
+                self._remove(entry)
+
+    def _listen(self, entry: _PollEntry) -> None:
+        entry.signal = entry.client.task_waiter.register(entry.task_id)
+        entry.signal.add_done_callback(lambda _: self._wake(entry))
+
+    def _wake(self, entry: _PollEntry) -> None:
+        if entry.future.done():
+            return
+        if entry.in_flight:
+            # 正在查询：结束后立即再查一次
+            entry.woken = True
+            return
+        self._wheel.schedule(entry, self._wheel.next_time())
+
+    def _reschedule(self, entry: _PollEntry, now: float) -> None:
+        delay = entry.schedule.next_interval(now - entry.started)
+        self._wheel.schedule(entry, min(now + delay, entry.deadline))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._entries:
+            await asyncio.sleep(max(0.0, self._wheel.next_time() - loop.time()))
+            now = loop.time()
+            for entry in self._wheel.advance(now):
+                if entry.future.done():
+                    continue
+                if now >= entry.deadline:
+                    self.timeouts += 1
+                    self._finish(entry, error=TimeoutError(f"RunningHub 任务超时（等待 {entry.timeout:g}s）"))
+                    continue
+                entry.in_flight = True
+                task = loop.create_task(self._query(entry), context=entry.context)
+                entry.query_tasks.add(task)
+                task.add_done_callback(entry.query_tasks.discard)
+
+    async def _query(self, entry: _PollEntry) -> None:
+        loop = asyncio.get_running_loop()
+        result: Optional[dict[str, object]] = None
+        try:
+            async with self._semaphore:
+                if entry.future.done():
+                    return
+                woken = bool(entry.signal and entry.signal.done())
+                if woken:
+                    self._listen(entry)
+                entry.queries += 1
+                self.queries += 1
+                self.in_flight += 1
+                try:
+                    with tracer.span(
+                        "runninghub.poll", **{"runninghub.task_id": entry.task_id, "runninghub.poll": entry.queries}
+                    ) as span:
+                        span.set_attribute("runninghub.woken", woken)
+                        result = await entry.client._query_task(entry.http_client, entry.task_id)
+                        span.set_attribute("runninghub.status", str(result.get("status") or ""))
+                except httpx.HTTPStatusError as exc:
+                    # 4xx（如 API Key 失效）重试无意义，直接失败；5xx 下一轮重试
+                    if exc.response.status_code < 500:
+                        self._finish(entry, error=exc)
+                        return
+                except (httpx.HTTPError, ValueError):
+                    # 单次查询失败不终止任务，按计划重试
+                    pass
+                finally:
+                    self.in_flight -= 1
+        finally:
+            entry.in_flight = False
+
+        if entry.future.done():
+            return
+        now = loop.time()
+        task_status = result.get("status") if result is not None else None
+        if task_status == "SUCCESS":
+            if entry.duration_key:
+                # 实际完成时刻落在最后一次未完成查询与本次查询之间，取中点以消除轮询间隔带来的偏差
+                entry.client.duration_model.record(
+                    entry.duration_key, (entry.last_pending + now - entry.started) / 2
+                )
+            self._finish(entry, result=result)
+        elif task_status == "FAILED":
+            error_msg = str(result.get("errorMessage") or "任务失败")
+            failed_reason = result.get("failedReason")
+            if failed_reason is not None:
+                error_msg += f" — {failed_reason}"
+            self._finish(entry, error=ValueError(f"RunningHub 任务失败: {error_msg}"))
+        else:
+            if result is not None:
+                entry.last_pending = now - entry.started
+            if entry.woken:
+                entry.woken = False
+                self._wheel.schedule(entry, self._wheel.next_time())
+            else:
+                self._reschedule(entry, now)
+
+    def _finish(
+        self,
+        entry: _PollEntry,
+        result: Optional[dict[str, object]] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        if not entry.future.done():
+            if error is not None:
+                entry.future.set_exception(error)
+            else:
+                entry.future.set_result(result or {})
+        self._remove(entry)
+
+    def _remove(self, entry: _PollEntry) -> None:
+        if self._entries.get(entry.task_id) is not entry:
+            return
+        del self._entries[entry.task_id]
+        self._wheel.cancel(entry)
+        entry.client.task_waiter.discard(entry.task_id)
+        runninghub_polls_per_task.observe(
+            entry.queries,
+            entry.context.get(current_endpoint, ""),
+            entry.duration_key[0] if entry.duration_key else "",
+        )
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "outstanding": len(self._entries),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queries": self.queries,
+            "timeouts": self.timeouts,
+        }
+
+    async def close(self) -> None:
+        for entry in list(self._entries.values()):
+            entry.future.cancel()
+            for task in entry.query_tasks:
+                task.cancel()
+            self._remove(entry)
+        if self._driver is not None:
+            self._driver.cancel()
+            await asyncio.gather(self._driver, return_exceptions=True)
+
+
+_task_poller: Optional[TaskPoller] = None
+
+
+def get_task_poller(settings: Settings) -> TaskPoller:
+    """Return the process-wide task poller, creating it on first use."""
+    global _task_poller
+    if _task_poller is None:
+        _task_poller = TaskPoller(
+            tick=settings.runninghub_poll_tick,
+            max_in_flight=settings.runninghub_poll_max_in_flight,
+        )
+    return _task_poller
@@ -0,0 +1,327 @@
+"""
+Tracing — lightweight, OpenTelemetry-compatible spans for the analyze → fuse → generate workflow.
+
+Spans follow the OTel data model (128-bit trace id, 64-bit span id, parent id, unix-nano
+timestamps, typed attributes, status) and are exported either
+
+- ``otlp-file``: one OTLP/JSON ``ExportTraceServiceRequest`` per line (the format of the
+  OpenTelemetry Collector file exporter / ``otlpjsonfile`` receiver), or
+- ``console``: one compact, human-readable line per span on stderr.
+
+Export happens on a background thread; the request path only appends to a queue.
+
+The frontend sends ``x-workflow-id`` with every call of one product-image workflow.
+The trace id is derived from it, so ``/api/analyze``, ``/api/fuse-prompt`` and
+``/api/generate`` of the same workflow land in one trace. A W3C ``traceparent`` header,
+when present, takes precedence.
+
+``span()`` makes the new span current for the enclosed block (use it around code that
+does not yield); inside async generators use ``start_span(...)`` / ``Span.end()`` with
+an explicit parent, since a generator may be resumed from a different context.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import Settings
+from services.metrics import current_endpoint
+
+AttributeValue = str | int | float | bool
+
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(
+        self,
+        tracer: Optional["Tracer"],
+        name: str,
+        trace_id: str,
+        parent_id: str = "",
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[dict[str, AttributeValue]] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: dict[str, AttributeValue] = dict(attributes or {})
+        self.status = 0
+        self.message = ""
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        if self.end_ns or self.tracer is None:
+            return
+        self.end_ns = time.time_ns()
+        self.tracer.export(self)
+
+    def to_otlp(self) -> dict[str, object]:
+        data: dict[str, object] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.status else {},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+def _otlp_attribute(key: str, value: AttributeValue) -> dict[str, object]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+logger = logging.getLogger(__name__)
+
+_NOOP = Span(None, "", "0" * 32)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def trace_id_for_workflow(workflow_id: str) -> str:
+    """Deterministic 128-bit trace id for a frontend workflow id."""
+    return hashlib.sha256(workflow_id.encode("utf-8")).hexdigest()[:32]
+
+
+def parse_traceparent(header: str) -> Optional[tuple[str, str]]:
+    """Return (trace id, parent span id) from a W3C traceparent header."""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+class _Exporter:
+    """Background writer: spans are queued on the request path and written in batches."""
+
+    def __init__(self, service_name: str, path: str = ""):
+        self.service_name = service_name
+        self.path = path
+        self._queue: queue.SimpleQueue[Optional[Span]] = queue.SimpleQueue()
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def _drain(self, first: Span) -> list[Span]:
+        batch = [first]
+        while len(batch) < 512:
+            try:
+                span = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if span is None:
+                self._queue.put(None)
+                break
+            batch.append(span)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            try:
+                self._write(self._drain(span))
+            except Exception:
+                logger.exception("trace.export_failed")
+
+    def _write(self, batch: list[Span]) -> None:
+        if not self.path:
+            for span in batch:
+                duration_ms = (span.end_ns - span.start_ns) / 1e6
+                attrs = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+                status = f" ERROR {span.message}" if span.status == STATUS_ERROR else ""
+                print(
+                    f"[trace {span.trace_id[:8]} {span.span_id[:8]}<{span.parent_id[:8] or '-'}] "
+                    f"{span.name} {duration_ms:.1f}ms {attrs}{status}",
+                    file=sys.stderr,
+                )
+            return
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "ecommerce-image-generator"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[_Exporter] = None):
+        self._exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self._exporter is not None
+
+    def export(self, span: Span) -> None:
+        if self._exporter is not None:
+            self._exporter.submit(span)
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        kind: int = KIND_INTERNAL,
+        trace_id: str = "",
+        parent_id: str = "",
+        **attributes: AttributeValue,
+    ) -> Span:
+        """Start a span without making it current; call ``end()`` when done."""
+        if self._exporter is None:
+            return _NOOP
+        if parent is None:
+            parent = _current_span.get()
+        if parent is not None and parent is not _NOOP:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        return Span(self, name, trace_id or os.urandom(16).hex(), parent_id, kind, attributes)
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes: AttributeValue) -> Iterator[Span]:
+        """Run the block inside a new child span of the current one."""
+        if self._exporter is None:
+            yield _NOOP
+            return
+        previous = _current_span.get()
+        span = self.start_span(name, kind=kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 在另一个上下文中结束（例如生成器被其他任务恢复）
+                _current_span.set(previous)
+            span.end()
+
+    def close(self) -> None:
+        if self._exporter is not None:
+            self._exporter.close()
+            self._exporter = None
+
+
+tracer = Tracer()
+
+
+def configure_tracing(settings: Settings) -> Tracer:
+    """Install the exporter selected by TRACING_EXPORTER ("" = off, "console", "otlp-file")."""
+    tracer.close()
+    exporter = settings.tracing_exporter.strip().lower()
+    if exporter == "console":
+        tracer._exporter = _Exporter(settings.tracing_service_name)
+    elif exporter == "otlp-file":
+        tracer._exporter = _Exporter(settings.tracing_service_name, settings.tracing_path)
+    return tracer
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: one server span per request, joined to the workflow trace."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        workflow_id = headers.get("x-workflow-id", "")[:128]
+        trace_id, parent_id = "", ""
+        if (parsed := parse_traceparent(headers.get("traceparent", ""))) is not None:
+            trace_id, parent_id = parsed
+        elif workflow_id:
+            trace_id = trace_id_for_workflow(workflow_id)
+
+        # 在 MetricsMiddleware 内层运行，路由模板已解析
+        endpoint = current_endpoint.get() or scope["path"]
+        span = tracer.start_span(
+            f"{scope['method']} {endpoint}",
+            kind=KIND_SERVER,
+            trace_id=trace_id,
+            parent_id=parent_id,
+            **{"http.method": scope["method"], "http.route": endpoint},
+        )
+        if workflow_id:
+            span.set_attribute("workflow.id", workflow_id)
+        token = _current_span.set(span)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = STATUS_ERROR
+                message["headers"] = [*message.get("headers", []), (b"x-trace-id", span.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 
-const ImagePreview = ({ image, loading = false, placeholder = '图片预览' }) => {
+const ImagePreview = ({ image, thumbnail = null, loading = false, placeholder = '图片预览' }) => {
   const [isModalOpen, setIsModalOpen] = useState(false);
 
   const handleImageClick = () => {
@@ -48,7 +48,7 @@ const ImagePreview = ({ image, loading = false, placeholder = '图片预览' })
           </div>
         ) : image ? (
           <img
-            src={image}
+            src={thumbnail || image}
             alt="Preview"
             onClick={handleImageClick}
             style={{ cursor: 'pointer' }}
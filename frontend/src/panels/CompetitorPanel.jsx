@@ -4,7 +4,7 @@ import ImageUpload from '../components/ImageUpload';
 import ImagePreview from '../components/ImagePreview';
 import PromptEditor from '../components/PromptEditor';
 import ProductInfoInput from '../components/ProductInfoInput';
-import { fileToBase64, analyzeImageStream } from '../services/api';
+import { prepareImage, analyzeImageStream } from '../services/api';
 
 const CompetitorPanel = ({ onPromptGenerated, onFusedPromptGenerated, productInfo, onProductInfoChange }) => {
   const [competitorImage, setCompetitorImage] = useState(null);
@@ -34,9 +34,8 @@ const CompetitorPanel = ({ onPromptGenerated, onFusedPromptGenerated, productInf
       const previewUrl = URL.createObjectURL(file);
       setCompetitorImagePreview(previewUrl);
 
-      // 转换为Base64
-      const base64 = await fileToBase64(file);
-      setCompetitorImage(base64);
+      // 上传到图片仓库，分析时只发送 image_id
+      setCompetitorImage(await prepareImage(file));
     } catch (err) {
       setError('图片加载失败');
       console.error(err);
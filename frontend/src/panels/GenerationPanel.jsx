@@ -3,7 +3,7 @@ import GlassCard from '../components/GlassCard';
 import ImageUpload from '../components/ImageUpload';
 import ImagePreview from '../components/ImagePreview';
 import PromptEditor from '../components/PromptEditor';
-import { fileToBase64, generateImage, downloadImageFromUrl, recognizeProductStream } from '../services/api';
+import { prepareImage, generateImage, downloadImageFromUrl, recognizeProductStream, thumbnailUrl } from '../services/api';
 
 const GenerationPanel = ({ prompt, tabData, onUpdateTab, onProductInfoRecognized }) => {
   const [targetImagePreviews, setTargetImagePreviews] = useState([]);
@@ -50,10 +50,10 @@ const GenerationPanel = ({ prompt, tabData, onUpdateTab, onProductInfoRecognized
     try {
       onUpdateTab({ error: null });
       const previewUrl = URL.createObjectURL(file);
-      const base64 = await fileToBase64(file);
+      const image = await prepareImage(file);
 
       const newPreviews = [...targetImagePreviews, previewUrl];
-      const newImages = [...(tabData.targetImages || []), base64];
+      const newImages = [...(tabData.targetImages || []), image];
       setTargetImagePreviews(newPreviews);
       onUpdateTab({ targetImages: newImages });
     } catch (err) {
@@ -66,13 +66,12 @@ const GenerationPanel = ({ prompt, tabData, onUpdateTab, onProductInfoRecognized
     try {
       onUpdateTab({ error: null });
       const newPreviews = [];
-      const newBase64s = [];
       for (const file of files) {
         newPreviews.push(URL.createObjectURL(file));
-        newBase64s.push(await fileToBase64(file));
       }
+      const newImages = await Promise.all(files.map(prepareImage));
       const allPreviews = [...targetImagePreviews, ...newPreviews];
-      const allImages = [...(tabData.targetImages || []), ...newBase64s];
+      const allImages = [...(tabData.targetImages || []), ...newImages];
       setTargetImagePreviews(allPreviews);
       onUpdateTab({ targetImages: allImages });
     } catch (err) {
@@ -489,6 +488,7 @@ const GenerationPanel = ({ prompt, tabData, onUpdateTab, onProductInfoRecognized
       <div style={{ marginTop: '16px' }}>
         <ImagePreview
           image={tabData.generatedImage || null}
+          thumbnail={tabData.generatedImage ? thumbnailUrl(tabData.generatedImage, 1024) : null}
           loading={isGenerating}
           placeholder="生成结果将显示在这里"
         />
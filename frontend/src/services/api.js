@@ -1,10 +1,27 @@
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || '/api';
 
+/**
+ * 当前工作流 ID：同一次 分析 → 融合 → 生成 的请求共用，后端据此归入同一条链路追踪
+ */
+let workflowId = null;
+
+const newWorkflowId = () =>
+  (globalThis.crypto?.randomUUID?.() ?? `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`);
+
+/**
+ * 开始新的工作流（每次分析竞品图时调用），返回新的工作流 ID
+ */
+export const startWorkflow = () => {
+  workflowId = newWorkflowId();
+  return workflowId;
+};
+
 /**
  * 从 localStorage 读取用户配置的 API 密钥，构建自定义请求头
  */
 const getApiKeyHeaders = () => {
   const headers = {};
+  headers['X-Workflow-Id'] = workflowId ?? startWorkflow();
   const geminiKey = localStorage.getItem('gemini_api_key');
   const geminiModel = localStorage.getItem('gemini_model');
   const runninghubKey = localStorage.getItem('runninghub_api_key');
@@ -30,19 +47,24 @@ export const fileToBase64 = (file) => {
   });
 };
 
+/**
+ * 请求体中的单张图片：prepareImage 的结果（{ image_id } 或 { image }），或 Base64 字符串
+ */
+const imageBody = (image) => (typeof image === 'string' ? { image } : image);
+
 /**
  * 分析竞品详情页图片
+ * @param {object|string} image - prepareImage 的结果或 Base64 字符串
  */
-export const analyzeImage = async (imageBase64) => {
+export const analyzeImage = async (image) => {
+  startWorkflow();
   const response = await fetch(`${API_BASE_URL}/analyze`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
       ...getApiKeyHeaders(),
     },
-    body: JSON.stringify({
-      image: imageBase64,
-    }),
+    body: JSON.stringify(imageBody(image)),
   });
 
   if (!response.ok) {
@@ -57,10 +79,73 @@ export const analyzeImage = async (imageBase64) => {
   return response.json();
 };
 
+/**
+ * 上传图片到服务端图片仓库，返回 { image_id, ... }
+ * 之后可用 image_id / target_image_ids 代替 Base64 重复发送同一张图
+ * @param {File|Blob} file - 图片文件
+ */
+export const uploadImage = async (file) => {
+  const formData = new FormData();
+  formData.append('image', file);
+  const response = await fetch(`${API_BASE_URL}/images`, {
+    method: 'POST',
+    headers: getApiKeyHeaders(),
+    body: formData,
+  });
+
+  if (!response.ok) {
+    let detail = '图片上传失败';
+    try {
+      const error = await response.json();
+      detail = error.detail || detail;
+    } catch {}
+    throw new Error(detail);
+  }
+
+  return response.json();
+};
+
+/**
+ * 选图后调用：上传到图片仓库，之后的分析 / 识别 / 生成只发送 image_id
+ * 上传失败时退回 Base64，不影响后续请求
+ * @param {File} file - 图片文件
+ * @returns {Promise<{image_id: string}|{image: string}>}
+ */
+export const prepareImage = async (file) => {
+  try {
+    const { image_id } = await uploadImage(file);
+    return { image_id };
+  } catch (err) {
+    console.warn('图片上传失败，改为随请求发送 Base64', err);
+    return { image: await fileToBase64(file) };
+  }
+};
+
+// 后端结果代理返回的本地结果地址（/api/results/<sha256>）
+const RESULT_PATH = /\/results\/[0-9a-f]{64}$/;
+
+/**
+ * 本地结果地址按 API_BASE_URL 解析（远端 URL 原样返回）
+ */
+const resolveResultUrl = (url) =>
+  url && url.startsWith('/api/') && RESULT_PATH.test(url) ? `${API_BASE_URL}${url.slice('/api'.length)}` : url;
+
+/**
+ * 结果图缩略图地址：本地结果追加 ?w=，远端 URL 原样返回
+ * @param {string} url - generateImage 返回的 image_url
+ * @param {number} width - 缩略图宽度（后端取 128/256/512/1024 中不小于该值的最小档）
+ */
+export const thumbnailUrl = (url, width = 512) =>
+  url && RESULT_PATH.test(url) ? `${url}?w=${width}` : url;
+
 /**
  * 生成产品图片
+ * @param {Array<object|string>|null} targetImages - prepareImage 的结果或 Base64 字符串列表
  */
 export const generateImage = async (targetImages, prompt, aspectRatio = '3:4', imageSize = '2K', model = 'nano-banana-v2') => {
+  const images = (targetImages || []).map(imageBody);
+  const imageIds = images.filter((image) => image.image_id).map((image) => image.image_id);
+  const base64s = images.filter((image) => image.image).map((image) => image.image);
   const response = await fetch(`${API_BASE_URL}/generate`, {
     method: 'POST',
     headers: {
@@ -68,7 +153,8 @@ export const generateImage = async (targetImages, prompt, aspectRatio = '3:4', i
       ...getApiKeyHeaders(),
     },
     body: JSON.stringify({
-      target_images: targetImages,
+      target_images: base64s.length > 0 ? base64s : null,
+      target_image_ids: imageIds.length > 0 ? imageIds : null,
       prompt: prompt,
       aspect_ratio: aspectRatio,
       image_size: imageSize,
@@ -85,7 +171,8 @@ export const generateImage = async (targetImages, prompt, aspectRatio = '3:4', i
     throw new Error(detail);
   }
 
-  return response.json();
+  const result = await response.json();
+  return { ...result, image_url: resolveResultUrl(result.image_url) };
 };
 
 /**
@@ -151,18 +238,16 @@ export const downloadImageFromUrl = async (imageUrl, filename = 'generated-image
 
 /**
  * 识别产品信息
- * @param {string} imageBase64 - Base64编码的产品图片
+ * @param {object|string} image - prepareImage 的结果或 Base64 字符串
  */
-export const recognizeProduct = async (imageBase64) => {
+export const recognizeProduct = async (image) => {
   const response = await fetch(`${API_BASE_URL}/recognize-product`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
       ...getApiKeyHeaders(),
     },
-    body: JSON.stringify({
-      image: imageBase64,
-    }),
+    body: JSON.stringify(imageBody(image)),
   });
 
   if (!response.ok) {
@@ -255,10 +340,11 @@ export const streamPost = async (url, body, onChunk, onDone, onError, signal) =>
 /**
  * 流式分析竞品详情页图片
  */
-export const analyzeImageStream = (imageBase64, onChunk, onDone, onError, signal) => {
+export const analyzeImageStream = (image, onChunk, onDone, onError, signal) => {
+  startWorkflow();
   return streamPost(
     `${API_BASE_URL}/analyze`,
-    { image: imageBase64 },
+    imageBody(image),
     onChunk,
     onDone,
     onError,
@@ -283,10 +369,10 @@ export const fusePromptStream = (analysisResult, productInfo, onChunk, onDone, o
 /**
  * 流式识别产品信息
  */
-export const recognizeProductStream = (imageBase64, onChunk, onDone, onError, signal) => {
+export const recognizeProductStream = (image, onChunk, onDone, onError, signal) => {
   return streamPost(
     `${API_BASE_URL}/recognize-product`,
-    { image: imageBase64 },
+    imageBody(image),
     onChunk,
     onDone,
     onError,
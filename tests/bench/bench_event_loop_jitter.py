@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+负载测试 - 大图上传校验期间 SSE 流的分片到达抖动：事件循环内联处理 vs 图片线程池
+
+用法: python tests/bench/bench_event_loop_jitter.py [--uploads 8] [--image-mb 4]
+
+在子进程中启动 uvicorn（LLM 替换为每 10ms 输出一个分片的假模型），
+一路客户端读取 /api/fuse-prompt 的 SSE 流并记录分片间隔，
+同时由另一个子进程并发上传大图到 /api/analyze（解码 + 缩放预处理）。
+输出两种模式下分片间隔的 p50/p99/max。
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+import uvicorn
+from PIL import Image
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+import main  # noqa: E402
+from services import cpu_pool  # noqa: E402
+from services.prompt_loader import FUSE_PROMPT  # noqa: E402
+
+CHUNKS = 300
+CHUNK_INTERVAL = 0.01
+
+
+class _FakeLLM:
+    settings = main.settings
+
+    async def stream_chat(self, messages, temperature=None):
+        for i in range(CHUNKS if messages[0]["content"] == main.prompt_registry.get(FUSE_PROMPT).text else 3):
+            await asyncio.sleep(CHUNK_INTERVAL)
+            yield f"{i} "
+
+
+def _noise_png(megabytes: float) -> str:
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    buffer = BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buffer, format="PNG", compress_level=0)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port: int, workers: int) -> None:
+    """子进程入口：替换 LLM 后运行应用，使客户端与服务端不共享 GIL。"""
+    main.settings = main.settings.model_copy(update={
+        "image_pool_workers": workers,
+        "result_cache_enabled": False,
+    })
+    cpu_pool._image_pool = None
+    main._resolve_llm = lambda request: _FakeLLM()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, __file__, "--serve", str(port), str(workers)])
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(base_url, timeout=0.5)
+            break
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    return process, base_url
+
+
+def _upload(base_url: str, uploads: int, megabytes: float) -> None:
+    """子进程入口：并发上传大图，与计时客户端互不干扰。"""
+    upload_body = json.dumps({"image": _noise_png(megabytes)}).encode()
+
+    async def run() -> None:
+        async with httpx.AsyncClient(timeout=120) as client:
+            async def one() -> None:
+                response = await client.post(
+                    f"{base_url}/api/analyze",
+                    content=upload_body,
+                    headers={"Content-Type": "application/json"},
+                )
+                await response.aread()
+
+            await asyncio.gather(*(one() for _ in range(uploads)))
+
+    asyncio.run(run())
+
+
+async def _measure(base_url: str, uploads: int, megabytes: float) -> list[float]:
+    gaps: list[float] = []
+    async with httpx.AsyncClient(timeout=120) as client:
+        body = {"analysis_result": "x" * 20, "product_info": "产品信息"}
+        async with client.stream("POST", f"{base_url}/api/fuse-prompt", json=body) as response:
+            uploader = subprocess.Popen(
+                [sys.executable, __file__, "--upload", base_url, str(uploads), str(megabytes)]
+            )
+            last = None
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                now = time.perf_counter()
+                if last is not None:
+                    gaps.append((now - last) * 1000)
+                last = now
+            uploader.wait()
+    return gaps
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--image-mb", type=float, default=4.0)
+    args = parser.parse_args()
+
+    results = []
+    for label, workers in (("inline", 0), ("thread-pool", 4)):
+        process, base_url = _start_server(workers)
+        try:
+            gaps = asyncio.run(_measure(base_url, args.uploads, args.image_mb))
+        finally:
+            process.terminate()
+            process.wait()
+        ordered = sorted(gaps)
+        results.append({
+            "mode": label,
+            "chunks": len(gaps),
+            "gap_p50_ms": round(statistics.median(ordered), 2),
+            "gap_p99_ms": round(ordered[int(len(ordered) * 0.99)], 2),
+            "gap_max_ms": round(ordered[-1], 2),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--serve":
+        _serve(int(sys.argv[2]), int(sys.argv[3]))
+    elif len(sys.argv) == 5 and sys.argv[1] == "--upload":
+        _upload(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        main_cli()
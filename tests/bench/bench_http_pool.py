@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+基准测试 - RunningHub 提交：每次调用新建 httpx.AsyncClient vs 进程级共享连接池
+
+用法: python tests/bench/bench_http_pool.py [--requests 200] [--concurrency 20] [--handshake-ms 30]
+
+输出新建连接数（= 握手次数）与提交延迟 p50/p99。
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import Settings  # noqa: E402
+from fake_runninghub import FakeRunningHub  # noqa: E402
+from services.http_pool import build_http_client  # noqa: E402
+from services.runninghub_client import MODELS, RunningHubClient, _build_payload  # noqa: E402
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _run(mode: str, args: argparse.Namespace) -> dict:
+    fake = FakeRunningHub(handshake_delay=args.handshake_ms / 1000)
+    base_url = await fake.start()
+    settings = Settings(runninghub_base_url=base_url, runninghub_api_key="bench")
+    pool = build_http_client(settings) if mode == "pooled" else None
+    client = RunningHubClient(settings, http_client=pool)
+    payload = _build_payload("bench", "1:1", "1K", False, None)
+    model_path = MODELS["nano-banana-v2"].api_path
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            if pool is None:
+                # 旧行为：每次 generate_image 新建一个 AsyncClient
+                async with httpx.AsyncClient(timeout=60.0) as per_call:
+                    await client._submit_and_wait(per_call, model_path, "text-to-image", payload)
+            else:
+                await client._submit_and_wait(pool, model_path, "text-to-image", payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    if pool is not None:
+        await pool.aclose()
+    await fake.stop()
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "handshakes": fake.connections,
+        "submit_p50_ms": round(statistics.median(latencies), 2),
+        "submit_p99_ms": round(_percentile(latencies, 0.99), 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    args = parser.parse_args()
+    results = [await _run("per-call", args), await _run("pooled", args)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+负载测试 - 以固定并发驱动完整应用，上游全部替换为本地替身服务
+
+用法: python tests/bench/bench_load.py [--concurrency 1,8,32] [--duration 20] [--mix analyze,fuse,generate]
+                                      [--rh-task-duration uniform:2,6] [--rh-submit-failure-rate 0.05]
+                                      [--llm-first-token uniform:0.3,0.8] [--output results.json]
+                                      [--server dev|serve] [--workers 4] [--compare]
+
+- 子进程 1：假 RunningHub（fake_runninghub.py）与假 OpenAI 兼容服务（fake_openai.py），延迟与失败率可配置
+- 子进程 2：运行应用，通过环境变量指向两个替身（工作目录为临时目录，不读取本地 .env）；
+  --server dev 为 uvicorn 默认单进程，--server serve 为 serve.py（多工作进程、uvloop、httptools）
+- 本进程：每个并发档位运行 duration 秒，每个 worker 按 mix 轮流发送请求
+
+输出 JSON（可用 --output 写入文件做回归对比）：每个档位、每个端点的吞吐、
+延迟 p50/p95/p99、首字节时间（SSE 即首个事件）p50/p95/p99、错误数，以及服务进程树峰值 RSS。
+--compare 依次运行单进程与 serve.py 多进程两种部署并输出两份报告。不需要任何真实 API Key。
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_runninghub import FakeRunningHub, distribution  # noqa: E402
+
+# 默认关闭会掩盖上游压力的特性；可用 --app-env 覆盖
+DEFAULT_APP_ENV = {
+    "RESULT_CACHE_ENABLED": "false",
+    "SINGLEFLIGHT_ENABLED": "false",
+    "ADMISSION_ENABLED": "false",
+    "RUNNINGHUB_POLL_MIN_INTERVAL": "0.2",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split():
+        pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _read_status(pid: int) -> dict[str, int]:
+    """VmRSS / VmHWM（KB），多工作进程时为整个进程树之和。"""
+    fields = {"VmRSS": 0, "VmHWM": 0}
+    for member in _process_tree(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in fields:
+                        fields[key] += int(value.split()[0])
+        except FileNotFoundError:
+            continue
+    return fields
+
+
+def _png_base64(side: int = 512) -> str:
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+# ---------------------------------------------------------------------------
+# 子进程入口
+# ---------------------------------------------------------------------------
+
+async def _serve_upstream(config: dict) -> None:
+    seed = config["seed"]
+    runninghub = FakeRunningHub(
+        duration_fn=distribution(config["rh_task_duration"], random.Random(seed)),
+        submit_latency_fn=distribution(config["rh_submit_latency"], random.Random(seed + 1)),
+        submit_failure_rate=config["rh_submit_failure_rate"],
+        task_failure_rate=config["rh_task_failure_rate"],
+        seed=seed,
+    )
+    llm = FakeOpenAI(
+        first_token_fn=distribution(config["llm_first_token"], random.Random(seed + 2)),
+        chunk_interval=config["llm_chunk_interval"],
+        chunks=config["llm_chunks"],
+        failure_rate=config["llm_failure_rate"],
+        seed=seed,
+    )
+    print(json.dumps({"runninghub": await runninghub.start(), "llm": await llm.start()}), flush=True)
+    await asyncio.Event().wait()
+
+
+def _serve_app(port: int, server: str, workers: int) -> None:
+    sys.path.insert(0, str(backend_dir))
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    if server == "serve":
+        import serve
+
+        serve.run(workers, "127.0.0.1", port)
+        return
+
+    import uvicorn
+
+    import main
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ---------------------------------------------------------------------------
+# 负载驱动
+# ---------------------------------------------------------------------------
+
+class _Recorder:
+    def __init__(self):
+        self.latency: dict[str, list[float]] = {}
+        self.ttfb: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def summary(self, elapsed: float) -> dict[str, dict]:
+        result = {}
+        for endpoint in sorted(set(self.latency) | set(self.errors)):
+            latency = self.latency.get(endpoint, [])
+            ttfb = self.ttfb.get(endpoint, [])
+            result[endpoint] = {
+                "requests": len(latency),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(latency) / elapsed, 2),
+                "latency_ms": {p: _percentile(latency, q) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+                "ttfb_ms": {p: _percentile(ttfb, q) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            }
+        return result
+
+
+def _request_for(endpoint: str, image: str, seq: int) -> tuple[str, dict]:
+    # 文本请求内容各不相同；分析请求共用一张图，依赖默认关闭的结果缓存与请求合并
+    if endpoint == "analyze":
+        return "/api/analyze", {"image": image}
+    if endpoint == "fuse":
+        return "/api/fuse-prompt", {"analysis_result": "极简白底，柔和侧光，高级质感，居中构图", "product_info": f"保温杯 #{seq}"}
+    if endpoint == "generate":
+        return "/api/generate", {"prompt": f"白底主图 #{seq}", "image_size": "1K"}
+    raise ValueError(f"未知端点: {endpoint}")
+
+
+async def _one(client: httpx.AsyncClient, endpoint: str, path: str, body: dict, recorder: _Recorder) -> None:
+    started = time.perf_counter()
+    first_byte = 0.0
+    try:
+        async with client.stream("POST", path, json=body) as response:
+            async for chunk in response.aiter_raw():
+                if chunk and not first_byte:
+                    first_byte = time.perf_counter()
+            failed = response.status_code >= 400
+    except httpx.HTTPError:
+        failed = True
+    if failed:
+        recorder.errors[endpoint] = recorder.errors.get(endpoint, 0) + 1
+        return
+    recorder.latency.setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+    recorder.ttfb.setdefault(endpoint, []).append(((first_byte or time.perf_counter()) - started) * 1000)
+
+
+async def _run_level(base_url: str, pid: int, concurrency: int, duration: float, mix: list[str], image: str) -> dict:
+    recorder = _Recorder()
+    stop_at = time.perf_counter() + duration
+    peak_rss = 0
+    seq = iter(range(10**9))
+
+    async def worker(index: int) -> None:
+        i = index
+        while time.perf_counter() < stop_at:
+            endpoint = mix[i % len(mix)]
+            i += 1
+            path, body = _request_for(endpoint, image, next(seq))
+            await _one(client, endpoint, path, body, recorder)
+
+    async def sample_rss() -> None:
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, _read_status(pid)["VmRSS"])
+            await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        sampler = asyncio.create_task(sample_rss())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    endpoints = recorder.summary(elapsed)
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(sum(e["requests"] for e in endpoints.values()) / elapsed, 2),
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+        "endpoints": endpoints,
+    }
+
+
+def _run_deployment(args: argparse.Namespace, server: str, upstream_urls: dict, upstream_config: dict,
+                    mix: list[str], levels: list[int], image: str) -> dict:
+    port = _free_port()
+    extra_env = dict(item.split("=", 1) for item in args.app_env)
+    app_env = {
+        **os.environ,
+        "GEMINI_ANALYZE_API_KEY": "bench",
+        "GEMINI_ANALYZE_BASE_URL": upstream_urls["llm"],
+        "RUNNINGHUB_API_KEY": "bench",
+        "RUNNINGHUB_BASE_URL": upstream_urls["runninghub"],
+        **DEFAULT_APP_ENV,
+        **extra_env,
+    }
+    workers = args.workers if server == "serve" else 1
+    with tempfile.TemporaryDirectory() as workdir:
+        app = subprocess.Popen(
+            [sys.executable, __file__, "--serve-app", str(port), server, str(workers)], env=app_env, cwd=workdir
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            _wait_ready(base_url, app)
+
+            async def warmup() -> None:
+                async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+                    recorder = _Recorder()
+                    for endpoint in mix:
+                        for n in range(args.warmup * workers):
+                            path, body = _request_for(endpoint, image, -1 - n)
+                            await _one(client, endpoint, path, body, recorder)
+
+            asyncio.run(warmup())
+            results = [
+                asyncio.run(_run_level(base_url, app.pid, level, args.duration, mix, image))
+                for level in levels
+            ]
+            peak = _read_status(app.pid)["VmHWM"]
+        finally:
+            app.terminate()
+            app.wait()
+
+    return {
+        "config": {
+            **upstream_config,
+            "server": server,
+            "workers": workers,
+            "mix": mix,
+            "duration_s": args.duration,
+            "app_env": {**DEFAULT_APP_ENV, **extra_env},
+        },
+        "levels": results,
+        "server_peak_rss_mb": round(peak / 1024, 1),
+    }
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen) -> None:
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError("应用进程启动失败")
+        try:
+            httpx.get(base_url, timeout=0.5)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("应用进程启动超时")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发档位")
+    parser.add_argument("--duration", type=float, default=20.0, help="每个档位的持续时间（秒）")
+    parser.add_argument("--warmup", type=int, default=3, help="正式计时前每个端点的预热请求数")
+    parser.add_argument("--mix", default="analyze,fuse,generate", help="worker 轮流发送的端点")
+    parser.add_argument("--rh-task-duration", default="uniform:2,6")
+    parser.add_argument("--rh-submit-latency", default="0.05")
+    parser.add_argument("--rh-submit-failure-rate", type=float, default=0.0)
+    parser.add_argument("--rh-task-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-first-token", default="uniform:0.3,0.8")
+    parser.add_argument("--llm-chunk-interval", type=float, default=0.02)
+    parser.add_argument("--llm-chunks", type=int, default=40)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="传给应用进程的额外配置")
+    parser.add_argument("--server", choices=("dev", "serve"), default="dev", help="dev: 单进程 uvicorn；serve: serve.py")
+    parser.add_argument("--workers", type=int, default=4, help="--server serve 的工作进程数")
+    parser.add_argument("--compare", action="store_true", help="依次运行 dev 与 serve 两种部署")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 写入路径")
+    args = parser.parse_args()
+
+    upstream_config = {
+        key: getattr(args, key)
+        for key in (
+            "rh_task_duration", "rh_submit_latency", "rh_submit_failure_rate", "rh_task_failure_rate",
+            "llm_first_token", "llm_chunk_interval", "llm_chunks", "llm_failure_rate", "seed",
+        )
+    }
+    mix = [m.strip() for m in args.mix.split(",") if m.strip()]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    image = _png_base64()
+
+    upstream = subprocess.Popen(
+        [sys.executable, __file__, "--serve-upstream", json.dumps(upstream_config)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        urls = json.loads(upstream.stdout.readline())
+        servers = ["dev", "serve"] if args.compare else [args.server]
+        reports = [_run_deployment(args, server, urls, upstream_config, mix, levels, image) for server in servers]
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+    report = reports if args.compare else reports[0]
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve-upstream":
+        asyncio.run(_serve_upstream(json.loads(sys.argv[2])))
+    elif len(sys.argv) == 5 and sys.argv[1] == "--serve-app":
+        _serve_app(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+    else:
+        main_cli()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+基准测试 - 日志对事件循环的影响：队列 + 后台写入线程 vs 在调用处直接写文件
+
+用法: python tests/bench/bench_logging.py [--rate 1000] [--seconds 5] [--fields 8]
+
+以固定速率（事件/秒）在事件循环中写 upstream.call 风格的 JSON 事件（同时每 10 条带一次异常堆栈），
+统计每次日志调用在事件循环上的耗时分位数，以及同时运行的 1ms 定时器的调度延迟（代表请求延迟受到的影响）。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import logging.handlers
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from bench_load import _percentile  # noqa: E402
+from config import Settings  # noqa: E402
+from services.event_log import JsonFormatter, configure_logging, logging_stats, shutdown_logging  # noqa: E402
+
+
+async def _ticker(stop: asyncio.Event, lags: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        due = loop.time() + 0.001
+        await asyncio.sleep(0.001)
+        lags.append((loop.time() - due) * 1000)
+
+
+async def _emit(rate: int, seconds: float, fields: int) -> dict:
+    logger = logging.getLogger("upstream")
+    extra = {f"field_{i}": f"value-{i}" for i in range(fields)}
+    calls: list[float] = []
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for i in range(int(rate * seconds)):
+        await asyncio.sleep(max(0.0, started + i / rate - loop.time()))
+        t0 = time.perf_counter()
+        if i % 10 == 9:
+            try:
+                raise ValueError("RunningHub 任务失败")
+            except ValueError:
+                logger.exception("upstream.call", extra={**extra, "seq": i})
+        else:
+            logger.info("upstream.call", extra={**extra, "seq": i, "duration_ms": 12.5})
+        calls.append((time.perf_counter() - t0) * 1e6)
+    stop.set()
+    await ticker
+    return {
+        "events": len(calls),
+        "call_us_p50": _percentile(calls, 0.5),
+        "call_us_p99": _percentile(calls, 0.99),
+        "call_us_max": round(max(calls), 1),
+        "loop_lag_ms_p50": _percentile(lags, 0.5),
+        "loop_lag_ms_p99": _percentile(lags, 0.99),
+    }
+
+
+def _direct(path: Path) -> logging.Handler:
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=50 * 1024 * 1024, backupCount=2, encoding="utf-8")
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=1000, help="每秒日志事件数")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fields", type=int, default=8, help="每条事件的附加字段数")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        handler = _direct(Path(workdir) / "direct.jsonl")
+        root.addHandler(handler)
+        try:
+            results["direct"] = asyncio.run(_emit(args.rate, args.seconds, args.fields))
+        finally:
+            root.removeHandler(handler)
+            handler.close()
+
+        configure_logging(Settings(log_path=str(Path(workdir) / "queued.jsonl")))
+        try:
+            results["queued"] = asyncio.run(_emit(args.rate, args.seconds, args.fields))
+            results["queued"]["dropped"] = logging_stats()["dropped"]
+        finally:
+            shutdown_logging()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
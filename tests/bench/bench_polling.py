@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+基准测试 - RunningHub 任务完成检测：固定 3s 轮询 vs 自适应轮询 vs 自适应 + webhook
+
+用法: python tests/bench/bench_polling.py [--tasks 30] [--min-duration 4] [--max-duration 12]
+
+每种策略先运行一轮预热（让耗时模型学习），再统计第二轮：
+每个任务的查询次数，以及任务完成到客户端拿到结果之间的延迟 p50/p99。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import Settings  # noqa: E402
+from fake_runninghub import FakeRunningHub  # noqa: E402
+from services import task_completion  # noqa: E402
+from services.http_pool import build_http_client  # noqa: E402
+from services.runninghub_client import RunningHubClient  # noqa: E402
+
+STRATEGIES = {
+    "fixed-3s": {"runninghub_poll_min_interval": 3.0, "runninghub_poll_max_interval": 3.0, "runninghub_poll_backoff": 1.0},
+    "adaptive": {},
+    "adaptive+webhook": {"runninghub_webhook_base_url": "http://bench.local"},
+}
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _round(client: RunningHubClient, fake: FakeRunningHub, tasks: int) -> list[float]:
+    lag: list[float] = []
+
+    async def one() -> None:
+        url = await client.generate_image("bench", "nano-banana-v2", image_size="2K")
+        task_id = url.rsplit("/", 1)[-1].split(".")[0]
+        lag.append((time.monotonic() - fake.tasks[task_id]) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(tasks)))
+    return lag
+
+
+async def _run(name: str, args: argparse.Namespace) -> dict:
+    rng = random.Random(42)
+    fake = FakeRunningHub(duration_fn=lambda: rng.uniform(args.min_duration, args.max_duration))
+    base_url = await fake.start()
+    settings = Settings(runninghub_base_url=base_url, runninghub_api_key="bench", **STRATEGIES[name])
+    pool = build_http_client(settings)
+    client = RunningHubClient(settings, http_client=pool)
+    # 每种策略使用独立的耗时模型；webhook 由替身服务在任务完成时直接投递
+    client.duration_model = task_completion.DurationModel()
+    if client.webhook_url:
+        fake.on_complete = client.task_waiter.notify
+
+    await _round(client, fake, args.tasks)  # 预热
+    queries_before = fake.query_calls
+    lag = await _round(client, fake, args.tasks)
+    await pool.aclose()
+    await fake.stop()
+    return {
+        "strategy": name,
+        "tasks": args.tasks,
+        "queries_per_task": round((fake.query_calls - queries_before) / args.tasks, 2),
+        "completion_to_response_p50_ms": round(statistics.median(lag), 1),
+        "completion_to_response_p99_ms": round(_percentile(lag, 0.99), 1),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=30)
+    parser.add_argument("--min-duration", type=float, default=4.0)
+    parser.add_argument("--max-duration", type=float, default=12.0)
+    args = parser.parse_args()
+    results = [await _run(name, args) for name in STRATEGIES]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+负载测试 - 突发相同请求下的上游调用次数：关闭 vs 开启请求合并（single-flight）
+
+用法: python tests/bench/bench_singleflight.py [--clients 20] [--distinct 4] [--jitter-ms 50]
+
+在进程内通过 ASGI 传输向应用并发发送 /api/analyze（SSE）与 /api/generate 请求：
+共 distinct 组不同内容，每组 clients 个相同请求在 jitter 毫秒内陆续到达（模拟双击 / 多标签页）。
+LLM 与 RunningHub 替换为计数的假实现（分别耗时约 300ms / 500ms），结果缓存关闭以只观察合并效果。
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+import main  # noqa: E402
+
+
+class _Upstream:
+    def __init__(self):
+        self.llm_calls = 0
+        self.generate_calls = 0
+        self.settings = main.settings
+
+    async def stream_chat(self, messages, temperature=None):
+        self.llm_calls += 1
+        for i in range(30):
+            await asyncio.sleep(0.01)
+            yield f"{i} "
+
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        self.generate_calls += 1
+        await asyncio.sleep(0.5)
+        return "https://cdn.test/out.png"
+
+
+def _png_base64(seed: int) -> str:
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), (seed * 40 % 256, 80, 120)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+async def _burst(enabled: bool, clients: int, distinct: int, jitter: float) -> dict:
+    main.settings = main.settings.model_copy(update={
+        "singleflight_enabled": enabled,
+        "result_cache_enabled": False,
+    })
+    upstream = _Upstream()
+    main._resolve_llm = lambda request: upstream
+    main._resolve_runninghub = lambda request: upstream
+    images = [_png_base64(i) for i in range(distinct)]
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def one(path: str, body: dict) -> None:
+            await asyncio.sleep(random.uniform(0, jitter))
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(
+            one(path, body)
+            for i in range(distinct)
+            for path, body in (
+                ("/api/analyze", {"image": images[i]}),
+                ("/api/generate", {"prompt": f"主图 {i}", "target_images": [images[i]]}),
+            )
+            for _ in range(clients)
+        ))
+
+    return {
+        "singleflight": enabled,
+        "requests": len(latencies),
+        "llm_calls": upstream.llm_calls,
+        "generate_calls": upstream.generate_calls,
+        "latency_p50_ms": round(statistics.median(latencies), 1),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=4)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(_burst(enabled, args.clients, args.distinct, args.jitter_ms / 1000))
+        for enabled in (False, True)
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
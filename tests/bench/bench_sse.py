@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+基准测试 - LLM 流式端点的 SSE 输出：逐块发送 vs 按时间窗口 / 字节数合并，以及客户端断开后的上游浪费
+
+用法: python tests/bench/bench_sse.py [--responses 40] [--concurrency 8] [--chunks 300] [--chunk-interval 0.004]
+                                     [--policies 0:0,0.03:2048] [--disconnects 5] [--app-dir backend]
+
+- 假 OpenAI 兼容服务在本进程内运行（fake_openai.py），每个回复 chunks 个 token 块
+- 每种合并策略（SSE_FLUSH_INTERVAL:SSE_FLUSH_BYTES，0:0 为逐块发送）启动一个应用子进程，
+  以固定并发请求 /api/fuse-prompt，统计帧数、帧率、首字节时间，以及应用进程每个回复消耗的 CPU 时间
+- 断开测试：读到几帧后关闭连接，统计此后上游仍写出的 token 块数
+--app-dir 可指向另一份代码的 backend 目录（如 git worktree 中的旧版本）做对比。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(Path(__file__).parent))
+
+from bench_load import DEFAULT_APP_ENV, _free_port, _percentile, _wait_ready  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+
+
+def _cpu_seconds(pid: int) -> float:
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _fuse_body(seq: int) -> dict:
+    return {"analysis_result": "极简白底，柔和侧光，高级质感，居中构图", "product_info": f"保温杯 #{seq}"}
+
+
+async def _stream(client: httpx.AsyncClient, seq: int) -> tuple[int, float]:
+    """(frames, time to first frame in ms)"""
+    started = time.perf_counter()
+    first = 0.0
+    frames = 0
+    async with client.stream("POST", "/api/fuse-prompt", json=_fuse_body(seq)) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                frames += 1
+                if frames == 1:
+                    first = (time.perf_counter() - started) * 1000
+    return frames, first
+
+
+async def _throughput(base_url: str, pid: int, responses: int, concurrency: int) -> dict:
+    frames: list[int] = []
+    ttfb: list[float] = []
+    queue = list(range(responses))
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await _stream(client, -1)  # 预热
+        cpu_before = _cpu_seconds(pid)
+        started = time.perf_counter()
+
+        async def worker() -> None:
+            while queue:
+                count, first = await _stream(client, queue.pop())
+                frames.append(count)
+                ttfb.append(first)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        cpu = _cpu_seconds(pid) - cpu_before
+    return {
+        "responses": responses,
+        "frames_per_response": round(statistics.mean(frames), 1),
+        "frames_per_s": round(sum(frames) / elapsed, 1),
+        "server_cpu_ms_per_response": round(cpu * 1000 / responses, 2),
+        "ttfb_p50_ms": _percentile(ttfb, 0.5),
+        "ttfb_p95_ms": _percentile(ttfb, 0.95),
+    }
+
+
+async def _disconnects(base_url: str, fake: FakeOpenAI, count: int, read_frames: int) -> dict:
+    wasted: list[int] = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        for seq in range(count):
+            frames = 0
+            async with client.stream("POST", "/api/fuse-prompt", json=_fuse_body(100_000 + seq)) as response:
+                async for line in response.aiter_lines():
+                    frames += line.startswith("data: ")
+                    if frames >= read_frames:
+                        break
+                sent_at_close = fake.chunks_sent
+            # 关闭连接后等待上游把剩余内容写完（若未被取消）
+            await asyncio.sleep(fake.chunks * fake.chunk_interval + 0.5)
+            wasted.append(fake.chunks_sent - sent_at_close)
+    return {
+        "disconnects": count,
+        "upstream_chunks_after_disconnect_mean": round(statistics.mean(wasted), 1),
+        "upstream_chunks_after_disconnect_max": max(wasted),
+        "chunks_per_response": fake.chunks,
+    }
+
+
+async def _run_policy(args: argparse.Namespace, fake: FakeOpenAI, llm_url: str, policy: str) -> dict:
+    interval, _, flush_bytes = policy.partition(":")
+    port = _free_port()
+    env = {
+        **os.environ,
+        **DEFAULT_APP_ENV,
+        "GEMINI_ANALYZE_API_KEY": "bench",
+        "GEMINI_ANALYZE_BASE_URL": llm_url,
+        "SSE_FLUSH_INTERVAL": interval,
+        "SSE_FLUSH_BYTES": flush_bytes or "0",
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(Path(args.app_dir).resolve()),
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            env=env,
+            cwd=workdir,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            await asyncio.to_thread(_wait_ready, base_url, app)
+            throughput = await _throughput(base_url, app.pid, args.responses, args.concurrency)
+            disconnects = await _disconnects(base_url, fake, args.disconnects, args.read_frames)
+        finally:
+            app.terminate()
+            app.wait()
+    return {"policy": {"flush_interval_s": float(interval), "flush_bytes": int(flush_bytes or 0)},
+            **throughput, **disconnects}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chunks", type=int, default=300, help="每个回复的 token 块数")
+    parser.add_argument("--chunk-interval", type=float, default=0.004, help="token 块间隔（秒）")
+    parser.add_argument("--policies", default="0:0,0.03:2048", help="逗号分隔的 SSE_FLUSH_INTERVAL:SSE_FLUSH_BYTES")
+    parser.add_argument("--disconnects", type=int, default=5)
+    parser.add_argument("--read-frames", type=int, default=3, help="断开测试中关闭连接前读取的帧数")
+    parser.add_argument("--app-dir", default=str(backend_dir))
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(chunks=args.chunks, chunk_interval=args.chunk_interval, chunk_text="词")
+    llm_url = await fake.start()
+    try:
+        results = [await _run_policy(args, fake, llm_url, policy) for policy in args.policies.split(",")]
+    finally:
+        await fake.stop()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
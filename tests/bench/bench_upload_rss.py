@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+负载测试 - 多图图生图请求的服务端峰值内存：Base64 JSON vs multipart 二进制上传
+
+用法: python tests/bench/bench_upload_rss.py [--images 10] [--image-mb 4.5] [--requests 4]
+
+在子进程中启动 uvicorn（RunningHub 替换为立即返回的假客户端），
+分别以 /api/generate（Base64 JSON）和 /api/generate/upload（multipart）并发提交相同的参考图，
+读取服务进程的 VmHWM（峰值常驻内存）并输出两种模式的对比。
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+import uvicorn
+from PIL import Image
+
+backend_dir = Path(__file__).parent.parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+import main  # noqa: E402
+
+
+class _FakeRunningHub:
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        return f"https://cdn.test/{len(reference_images or [])}.png"
+
+
+def _noise_png(megabytes: float) -> bytes:
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    buffer = BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buffer, format="PNG", compress_level=0)
+    return buffer.getvalue()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port: int) -> None:
+    """子进程入口：替换 RunningHub 后运行应用，使测得的内存只属于服务端。"""
+    main._resolve_runninghub = lambda request: _FakeRunningHub()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _peak_rss_mb(pid: int) -> tuple[float, float]:
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+    return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+
+
+async def _send(base_url: str, mode: str, images: list[bytes], requests: int) -> None:
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one() -> None:
+            if mode == "base64-json":
+                body = {"prompt": "白底主图", "target_images": [base64.b64encode(i).decode() for i in images]}
+                response = await client.post(f"{base_url}/api/generate", json=body)
+            else:
+                files = [("target_images", (f"{n}.png", img, "image/png")) for n, img in enumerate(images)]
+                response = await client.post(
+                    f"{base_url}/api/generate/upload", data={"prompt": "白底主图"}, files=files
+                )
+            response.raise_for_status()
+
+        await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def _measure(mode: str, images: list[bytes], requests: int) -> dict:
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, __file__, "--serve", str(port)])
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(base_url, timeout=0.5)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        baseline, _ = _peak_rss_mb(process.pid)
+        started = time.perf_counter()
+        asyncio.run(_send(base_url, mode, images, requests))
+        elapsed = time.perf_counter() - started
+        _, peak = _peak_rss_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "mode": mode,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "growth_mb": round(peak - baseline, 1),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--image-mb", type=float, default=4.5)
+    parser.add_argument("--requests", type=int, default=4)
+    args = parser.parse_args()
+
+    images = [_noise_png(args.image_mb) for _ in range(args.images)]
+    results = [_measure(mode, images, args.requests) for mode in ("base64-json", "multipart")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        _serve(int(sys.argv[2]))
+    else:
+        main_cli()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容服务替身 - 仅用于基准测试
+
+模拟 /v1/chat/completions（stream=true 时按 SSE 分块返回 chat.completion.chunk，
+否则返回完整 chat.completion）与 /v1/models。首 token 延迟、块间隔可按分布随机生成，
+并可按比例注入 500 错误。
+
+独立运行: python tests/bench/fake_openai.py --port 9200 --first-token uniform:0.3,0.8 --chunks 40
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from fake_runninghub import distribution
+
+
+@dataclass
+class FakeOpenAI:
+    first_token_latency: float = 0.0   # 请求到首个内容块的耗时
+    chunk_interval: float = 0.0        # 相邻内容块的间隔
+    chunks: int = 20                   # 每个回复的内容块数
+    chunk_text: str = "风格提示词"
+    first_token_fn: Optional[Callable[[], float]] = None   # 可选：按分布随机生成首 token 延迟
+    failure_rate: float = 0.0          # 返回 500 的比例
+    seed: int = 0
+    connections: int = 0
+    completion_calls: int = 0
+    failures: int = 0
+    chunks_sent: int = 0               # 已写出的内容块数（客户端断开后仍在写出的即为浪费的 token）
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        sock = self._server.sockets[0].getsockname()
+        return f"http://{sock[0]}:{sock[1]}"
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                await self._route(writer, method, path.split("?", 1)[0], json.loads(body or b"{}"))
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _route(self, writer: asyncio.StreamWriter, method: str, path: str, body: dict) -> None:
+        if method == "GET" and path == "/v1/models":
+            await self._send_json(writer, 200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+            return
+        if method != "POST" or path != "/v1/chat/completions":
+            await self._send_json(writer, 404, {"error": {"message": "not found"}})
+            return
+
+        self.completion_calls += 1
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            self.failures += 1
+            await self._send_json(writer, 500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+
+        model = str(body.get("model", "fake-model"))
+        completion_id = f"chatcmpl-{self.completion_calls}"
+        await asyncio.sleep(self.first_token_fn() if self.first_token_fn else self.first_token_latency)
+        if not body.get("stream"):
+            await self._send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.chunk_text * self.chunks},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": self.chunks, "total_tokens": self.chunks + 1},
+            })
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+
+        async def event(delta: dict, finish_reason: Optional[str] = None) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            await self._write_chunk(writer, f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+
+        await event({"role": "assistant", "content": ""})
+        for i in range(self.chunks):
+            if i and self.chunk_interval:
+                await asyncio.sleep(self.chunk_interval)
+            await event({"content": self.chunk_text})
+            self.chunks_sent += 1
+        await event({}, "stop")
+        await self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+
+async def _serve_forever(args: argparse.Namespace) -> None:
+    fake = FakeOpenAI(
+        first_token_fn=distribution(args.first_token, random.Random(args.seed)),
+        chunk_interval=args.chunk_interval,
+        chunks=args.chunks,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    print(await fake.start(args.host, args.port), flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--first-token", default="uniform:0.3,0.8")
+    parser.add_argument("--chunk-interval", type=float, default=0.02)
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(_serve_forever(parser.parse_args()))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+本地 RunningHub 替身服务 - 仅用于基准测试
+
+模拟 /openapi/v2/{model}/{mode} 提交接口与 /openapi/v2/query 查询接口，
+支持 HTTP/1.1 keep-alive，并统计新建连接数（每个新连接在生产环境中对应一次 TCP+TLS 握手）。
+提交延迟、任务耗时可按分布随机生成，并可按比例注入提交 5xx 与任务失败。
+
+独立运行: python tests/bench/fake_runninghub.py --port 9100 --task-duration uniform:2,6 --submit-failure-rate 0.05
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass
+class FakeRunningHub:
+    handshake_delay: float = 0.0   # 每个新连接的额外建连耗时（模拟 TLS 握手 RTT）
+    submit_latency: float = 0.0    # 提交接口响应耗时
+    task_duration: float = 0.0     # 任务从提交到完成的耗时，0 表示提交即成功
+    duration_fn: Optional[Callable[[], float]] = None   # 可选：按分布随机生成任务耗时
+    on_complete: Optional[Callable[[str], None]] = None  # 可选：任务完成时回调（模拟 webhook）
+    submit_latency_fn: Optional[Callable[[], float]] = None  # 可选：按分布随机生成提交耗时
+    submit_failure_rate: float = 0.0   # 提交接口返回 500 的比例
+    task_failure_rate: float = 0.0     # 任务最终 FAILED 的比例
+    seed: int = 0
+    connections: int = 0
+    submit_calls: int = 0
+    submit_failures: int = 0
+    query_calls: int = 0
+    tasks: dict[str, float] = field(default_factory=dict)
+    failed_tasks: set[str] = field(default_factory=set)
+
+    def __post_init__(self) -> None:
+        self._ids = itertools.count(1)
+        self._rng = random.Random(self.seed)
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        sock = self._server.sockets[0].getsockname()
+        return f"http://{sock[0]}:{sock[1]}"
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        if self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(" ", 2)
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                status, payload = await self._route(path, json.loads(body or b"{}"))
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, path: str, body: dict) -> tuple[int, dict]:
+        if path == "/openapi/v2/query":
+            self.query_calls += 1
+            return 200, self._task_status(str(body.get("taskId", "")))
+        if path.startswith("/openapi/v2/"):
+            self.submit_calls += 1
+            latency = self.submit_latency_fn() if self.submit_latency_fn else self.submit_latency
+            if latency:
+                await asyncio.sleep(latency)
+            if self.submit_failure_rate and self._rng.random() < self.submit_failure_rate:
+                self.submit_failures += 1
+                return 500, {"errorMessage": "injected failure"}
+            task_id = str(next(self._ids))
+            duration = self.duration_fn() if self.duration_fn else self.task_duration
+            self.tasks[task_id] = time.monotonic() + duration
+            if self.task_failure_rate and self._rng.random() < self.task_failure_rate:
+                self.failed_tasks.add(task_id)
+            if self.on_complete is not None and duration > 0:
+                asyncio.get_running_loop().call_later(duration, self.on_complete, task_id)
+            return 200, self._task_status(task_id)
+        return 404, {"error": "not found"}
+
+    def _task_status(self, task_id: str) -> dict:
+        done_at = self.tasks.get(task_id)
+        if done_at is None:
+            return {"taskId": task_id, "status": "FAILED", "errorMessage": "unknown task"}
+        if time.monotonic() < done_at:
+            return {"taskId": task_id, "status": "RUNNING", "results": None}
+        if task_id in self.failed_tasks:
+            return {"taskId": task_id, "status": "FAILED", "errorMessage": "injected failure"}
+        return {
+            "taskId": task_id,
+            "status": "SUCCESS",
+            "results": [{"url": f"https://cdn.example.com/{task_id}.png", "outputType": "png"}],
+        }
+
+
+def distribution(spec: str, rng: Optional[random.Random] = None) -> Callable[[], float]:
+    """解析耗时分布：固定值 "2.5"、"uniform:a,b"、"lognormal:mu,sigma"、"exp:mean"（单位秒）。"""
+    rng = rng or random.Random(0)
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda: value
+    values = [float(v) for v in params.split(",")]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(values[0], values[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"未知分布: {spec}")
+
+
+async def _serve_forever(args: argparse.Namespace) -> None:
+    fake = FakeRunningHub(
+        duration_fn=distribution(args.task_duration, random.Random(args.seed)),
+        submit_latency_fn=distribution(args.submit_latency, random.Random(args.seed + 1)),
+        submit_failure_rate=args.submit_failure_rate,
+        task_failure_rate=args.task_failure_rate,
+        seed=args.seed,
+    )
+    print(await fake.start(args.host, args.port), flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--task-duration", default="uniform:2,6")
+    parser.add_argument("--submit-latency", default="0.05")
+    parser.add_argument("--submit-failure-rate", type=float, default=0.0)
+    parser.add_argument("--task-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(_serve_forever(parser.parse_args()))
@@ -0,0 +1,38 @@
+"""
+测试公共夹具：应用的本地存储（图片仓库、结果缓存、任务日志等）写到每个测试的临时目录，不在仓库中留下 data/
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+import main  # noqa: E402
+from services import image_store, result_cache, result_store, task_journal  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def local_storage(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    monkeypatch.setattr(main, "settings", main.settings.model_copy(update={
+        "result_cache_path": str(data / "result_cache.sqlite3"),
+        "image_store_path": str(data / "images"),
+        "job_store_path": str(data / "jobs.sqlite3"),
+        "result_store_path": str(data / "results"),
+        "task_journal_path": str(data / "runninghub_tasks.sqlite3"),
+        "shared_state_path": str(data / "shared_state.sqlite3"),
+        "tracing_path": str(data / "traces.jsonl"),
+    }))
+    # 进程级单例按新的路径重新创建，测试结束后恢复
+    for module, name in (
+        (image_store, "_image_store"),
+        (result_cache, "_result_cache"),
+        (result_store, "_result_store"),
+        (task_journal, "_task_journal"),
+    ):
+        monkeypatch.setattr(module, name, None)
+    return data
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+测试准入控制：单 Key / 全局并发上限、令牌桶速率、Key 之间公平排队、排队满时 429
+"""
+
+import asyncio
+import base64
+import sqlite3
+import sys
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services import result_cache  # noqa: E402
+from services.admission import AdmissionController, AdmissionRejected, SharedTokenBucket, key_id  # noqa: E402
+
+
+def test_fair_queue_interleaves_light_key_ahead_of_heavy_backlog():
+    order = []
+
+    async def call(controller, key, cost, started):
+        async with controller.slot(key, cost=cost):
+            started.set()
+            order.append(key)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        controller = AdmissionController(global_limit=1, key_limit=1, queue_size=16, key_queue_size=16)
+        first = asyncio.Event()
+        tasks = [asyncio.create_task(call(controller, "heavy", 4, first))]
+        await first.wait()
+        tasks += [asyncio.create_task(call(controller, "heavy", 4, asyncio.Event())) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call(controller, "light", 1, asyncio.Event())))
+        await asyncio.gather(*tasks)
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    # 轻量 Key 不必等重度 Key 的整批任务跑完
+    assert order.index("light") <= 2
+    assert stats["keys"]["heavy"]["admitted"] == 4 and stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_rejects_when_key_queue_is_full_and_honours_rate():
+    async def scenario():
+        controller = AdmissionController(global_limit=4, key_limit=1, queue_size=8, key_queue_size=1)
+        hold = asyncio.Event()
+
+        async def busy():
+            async with controller.slot("k"):
+                await hold.wait()
+
+        running = asyncio.create_task(busy())
+        queued = asyncio.create_task(busy())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("k")
+        hold.set()
+        await asyncio.gather(running, queued)
+
+        limited = AdmissionController(global_limit=4, key_limit=4, key_rate=20, key_burst=1)
+        started = time.monotonic()
+        for _ in range(3):
+            async with limited.slot("r"):
+                pass
+        return rejected.value, time.monotonic() - started, controller.stats()
+
+    error, elapsed, stats = asyncio.run(scenario())
+    assert error.retry_after >= 1
+    assert elapsed >= 0.09                       # 20 次/秒、突发 1：3 次至少间隔 2 × 50ms
+    assert stats["keys"]["k"]["rejected"] == 1 and stats["keys"]["k"]["admitted"] == 2
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, key_limit=1)
+        await controller.acquire("k")
+        waiter = asyncio.create_task(controller.acquire("k"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        controller.release("k")
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_idle_keys_are_dropped_once_their_bucket_refills():
+    async def scenario():
+        controller = AdmissionController(global_limit=4, key_limit=1, key_rate=20, key_burst=1)
+        for i in range(50):
+            async with controller.slot(f"k{i}"):
+                pass
+        busy = len(controller.stats()["keys"])
+        await asyncio.sleep(0.06)                    # 20 次/秒：50ms 后令牌桶回满
+        async with controller.slot("new"):
+            pass
+        return busy, controller.stats()["keys"], controller._waiting
+
+    busy, keys, waiting = asyncio.run(scenario())
+    assert busy == 50
+    assert list(keys) == ["new"] and not waiting
+    assert keys["new"]["wait_max_ms"] == 0.0           # 新 Key 走快速路径，不经排队
+
+
+def test_shared_token_bucket_spans_controllers(tmp_path, monkeypatch):
+    path = str(tmp_path / "shared.sqlite3")
+    threads = set()
+    transact = SharedTokenBucket.transact
+
+    def traced(buckets, debits, take=False):
+        threads.add(threading.current_thread())
+        return transact(buckets, debits, take)
+
+    monkeypatch.setattr(SharedTokenBucket, "transact", traced)
+
+    async def scenario():
+        # 两个控制器共享同一个令牌桶文件（模拟两个工作进程）
+        workers = [
+            AdmissionController(global_limit=4, key_limit=4, key_rate=20, key_burst=1, shared_path=path, name="rh")
+            for _ in range(2)
+        ]
+        started = time.monotonic()
+        for i in range(4):
+            async with workers[i % 2].slot("k"):
+                pass
+        return time.monotonic() - started
+
+    # 各自独立时 4 次调用只需约 1 次间隔；共享后需 3 × 50ms
+    assert asyncio.run(scenario()) >= 0.13
+    # SQLite 事务都在工作线程中执行，不阻塞事件循环
+    assert threads and threading.main_thread() not in threads
+    # 每次放行只扣一个令牌（不重复扣减）
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT tokens FROM token_buckets WHERE name = 'rh:k'").fetchone()[0] > -0.5
+
+
+def test_key_id_hides_api_key():
+    assert key_id("") == "default"
+    assert len(key_id("sk-secret")) == 12 and "secret" not in key_id("sk-secret")
+
+
+class _RejectingUpstream:
+    settings = main.settings
+    admission_key = "default"
+
+    async def generate_image(self, *args, **kwargs):
+        raise AdmissionRejected(7)
+
+    async def stream_chat(self, messages, temperature=None):
+        raise AdmissionRejected(3)
+        yield ""
+
+
+def test_endpoints_return_429_with_retry_after(monkeypatch):
+    upstream = _RejectingUpstream()
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: upstream)
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: upstream)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    monkeypatch.setattr(main, "settings", main.settings.model_copy(update={"result_cache_enabled": False}))
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+    image = base64.b64encode(buffer.getvalue()).decode()
+
+    with TestClient(main.app) as client:
+        generated = client.post("/api/generate", json={"prompt": "白底主图"})
+        assert generated.status_code == 429 and generated.headers["retry-after"] == "7"
+
+        analyzed = client.post("/api/analyze", json={"image": image})
+        assert analyzed.status_code == 429 and analyzed.headers["retry-after"] == "3"
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+测试结构化日志：JSON 行带 request id，上游调用记录耗时，成功事件采样、按大小轮转，队列满时丢弃而不阻塞
+"""
+
+import json
+import logging
+import queue
+import sys
+from pathlib import Path
+
+import pytest
+from pydantic import SecretStr
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services import result_cache  # noqa: E402
+from services.event_log import (  # noqa: E402
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    configure_logging,
+    shutdown_logging,
+    upstream_call,
+)
+from services.llm_manager import LLMManager  # noqa: E402
+
+
+class _Chunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeModel:
+    async def astream(self, messages):
+        for part in ("风格", "提示", "词"):
+            yield _Chunk(part)
+
+
+@pytest.fixture
+def log_settings(tmp_path):
+    """日志写到临时文件；测试结束后恢复默认配置。"""
+    settings = main.settings.model_copy(update={"log_path": str(tmp_path / "backend.jsonl")})
+    yield settings
+    configure_logging(main.settings)
+
+
+def _read_lines(path: Path) -> list[dict]:
+    shutdown_logging()  # 刷新写入线程
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_access_and_upstream_events_share_request_id(monkeypatch, log_settings):
+    settings = log_settings.model_copy(update={
+        "result_cache_enabled": False,
+        "singleflight_enabled": False,
+        "admission_enabled": False,
+        "gemini_analyze_api_key": SecretStr("test"),
+    })
+    llm = LLMManager(settings)
+    monkeypatch.setattr(llm, "_get_model", lambda temperature=None: _FakeModel())
+    monkeypatch.setattr(main, "settings", settings)
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: llm)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    configure_logging(settings)
+
+    with TestClient(main.app) as client:
+        fused = client.post(
+            "/api/fuse-prompt",
+            json={"analysis_result": "极简白底，柔和侧光，居中构图", "product_info": "保温杯"},
+            headers={"x-request-id": "req-7"},
+        )
+        generated = client.get("/api/stats")
+    assert fused.headers["x-request-id"] == "req-7"
+    assert len(generated.headers["x-request-id"]) == 16   # 未携带时自动生成
+
+    lines = _read_lines(Path(settings.log_path))
+    access = next(line for line in lines if line["event"] == "http.access" and line["request_id"] == "req-7")
+    assert access["route"] == "/api/fuse-prompt" and access["status"] == 200
+    assert access["duration_ms"] >= access["ttfb_ms"] >= 0 and access["bytes"] > 0
+    upstream = next(line for line in lines if line["event"] == "upstream.call")
+    assert upstream["request_id"] == "req-7"
+    assert upstream["upstream"] == "llm" and upstream["operation"] == "stream" and upstream["outcome"] == "success"
+    assert upstream["chunks"] == 3 and "first_token_ms" in upstream and "duration_ms" in upstream
+
+
+def test_success_events_are_sampled_and_files_rotate(log_settings):
+    settings = log_settings.model_copy(update={
+        "log_upstream_sample_rate": 0.0,
+        "log_max_bytes": 4096,
+        "log_backup_count": 2,
+    })
+    configure_logging(settings)
+    logger = logging.getLogger("test")
+    for i in range(200):
+        logger.info("filler", extra={"seq": i})
+    for _ in range(50):
+        with upstream_call("runninghub", "query", task_id="t1"):
+            pass
+    with pytest.raises(ValueError):
+        with upstream_call("runninghub", "submit", model_path="rhart-image-n-pro/text-to-image"):
+            raise ValueError("RunningHub 任务失败")
+
+    path = Path(settings.log_path)
+    lines = [line for p in (path.with_name("backend.jsonl.2"), path.with_name("backend.jsonl.1"), path)
+             for line in (_read_lines(p) if p.exists() else [])]
+    assert path.with_name("backend.jsonl.1").exists() and not path.with_name("backend.jsonl.3").exists()
+    upstream = [line for line in lines if line["event"] == "upstream.call"]
+    # 成功调用全部被采样丢弃，失败始终记录
+    assert [(line["level"], line["outcome"], line["error"]) for line in upstream] == [
+        ("WARNING", "error", "ValueError: RunningHub 任务失败")
+    ]
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(2))
+    logger = logging.getLogger("test.queue")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(5):
+            logger.warning("event %d", i)
+    finally:
+        logger.removeHandler(handler)
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == ["event 0", "event 1"]
+
+
+def test_json_formatter_keeps_extra_fields_and_exception():
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.getLogger("test").makeRecord(
+            "test", logging.ERROR, __file__, 1, "job.failed", None, sys.exc_info(), extra={"job_id": "j1"}
+        )
+    line = json.loads(JsonFormatter().format(record))
+    assert line["event"] == "job.failed" and line["job_id"] == "j1" and line["level"] == "ERROR"
+    assert "ZeroDivisionError" in line["exc"]
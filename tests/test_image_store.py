@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+测试图片仓库：内容寻址、TTL / 容量淘汰、image_id 接口复用，以及 RunningHub 远端 URL 复用
+"""
+
+import asyncio
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image
+from pydantic import SecretStr
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from config import Settings  # noqa: E402
+from services import image_store  # noqa: E402
+from services.image_store import ImageStore, RemoteUrlCache  # noqa: E402
+from services.image_utils import load_image_bytes  # noqa: E402
+from services.runninghub_client import RunningHubClient  # noqa: E402
+from services.task_completion import DurationModel, TaskWaiter  # noqa: E402
+
+
+def _png_bytes(color: str = "red") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_store_dedupes_and_evicts_least_recent(tmp_path):
+    red, blue, green = _png_bytes("red"), _png_bytes("blue"), _png_bytes("green")
+    store = ImageStore(str(tmp_path), ttl=60, max_bytes=len(red) * 2 + 10)
+
+    red_id = store.put_bytes(red)
+    assert store.put_bytes(red) == red_id and store.stats()["entries"] == 1
+    blue_id = store.put_bytes(blue)
+    assert store.get_bytes(red_id) == red       # red 变为最近使用
+    store.put_bytes(green)                      # 超出容量，淘汰 blue
+    assert store.get_bytes(blue_id) is None
+    assert store.get_bytes(red_id) == red
+
+    reopened = ImageStore(str(tmp_path), ttl=60, max_bytes=1 << 20)
+    assert reopened.get_bytes(red_id) == red
+    assert reopened.get_bytes("../etc/passwd") is None
+
+    expired = ImageStore(str(tmp_path), ttl=0, max_bytes=1 << 20)
+    assert expired.get_bytes(red_id) is None
+
+
+def test_workers_share_store_root(tmp_path):
+    red = _png_bytes("red")
+    first = ImageStore(str(tmp_path), ttl=60, max_bytes=1 << 20)
+    second = ImageStore(str(tmp_path), ttl=60, max_bytes=1 << 20)
+
+    # 另一个工作进程上传的图片，本进程索引中没有也能读到
+    red_id = first.put_bytes(red)
+    assert second.get_bytes(red_id) == red
+
+    # 被另一个进程删除后，重新上传会补回文件
+    first._remove(red_id)
+    assert second.put_bytes(red) == red_id and first.get_bytes(red_id) == red
+
+
+class _FakeRunningHub:
+    def __init__(self):
+        self.reference_images = None
+
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        self.reference_images = reference_images
+        return "https://cdn.test/out.png"
+
+
+def test_image_id_is_accepted_by_generate(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_store, "_image_store", ImageStore(str(tmp_path), ttl=60, max_bytes=1 << 20))
+    fake = _FakeRunningHub()
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: fake)
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: None)
+    red = _png_bytes()
+
+    with TestClient(main.app) as client:
+        uploaded = client.post("/api/images", files={"image": ("a.png", red, "image/png")})
+        assert uploaded.status_code == 200
+        body = uploaded.json()
+        assert (body["format"], body["width"], body["size"]) == ("PNG", 8, len(red))
+
+        response = client.post(
+            "/api/generate", json={"prompt": "白底主图", "target_image_ids": [body["image_id"]]}
+        )
+        assert response.status_code == 200
+        assert [img.data for img in fake.reference_images] == [red]
+
+        missing = client.post("/api/analyze", json={"image_id": "0" * 64})
+        assert missing.status_code == 404
+        empty = client.post("/api/analyze", json={})
+        assert empty.status_code == 400
+
+
+def test_runninghub_uploads_once_and_reuses_url():
+    uploads, submitted = [], []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/media/upload/binary":
+            uploads.append(request)
+            return httpx.Response(200, json={"code": 0, "message": "success", "data": {"download_url": "https://rh.test/in.png"}})
+        if request.url.path == "/openapi/v2/query":
+            return httpx.Response(200, json={"status": "SUCCESS", "results": [{"url": "https://cdn.test/out.png"}]})
+        submitted.append(request.read())
+        return httpx.Response(200, json={"taskId": "t1", "status": "RUNNING"})
+
+    settings = Settings(
+        runninghub_api_key="test",
+        runninghub_base_url="http://rh.test",
+        runninghub_upload_images=True,
+        runninghub_poll_min_interval=0.01,
+    )
+    client = RunningHubClient(settings, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    client.duration_model = DurationModel()
+    client.task_waiter = TaskWaiter()
+    client.remote_urls = RemoteUrlCache()
+    image = load_image_bytes(_png_bytes())
+
+    other_key = RunningHubClient(
+        settings.model_copy(update={"runninghub_api_key": SecretStr("other")}),
+        http_client=client._client(),
+    )
+    other_key.duration_model = client.duration_model
+    other_key.task_waiter = client.task_waiter
+    other_key.remote_urls = client.remote_urls
+
+    async def scenario():
+        for _ in range(2):
+            await client.generate_image("p", "nano-banana-v2", reference_images=[image])
+        # 其他 API Key 不复用本账号上传的媒体
+        await other_key.generate_image("p", "nano-banana-v2", reference_images=[image])
+
+    asyncio.run(scenario())
+    assert len(uploads) == 2
+    assert [request.headers["authorization"] for request in uploads] == ["Bearer test", "Bearer other"]
+    assert all(b"https://rh.test/in.png" in body and b"data:image" not in body for body in submitted)
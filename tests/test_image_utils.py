@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+测试图片解码与校验：一次解码得到可复用的 ImagePayload
+"""
+
+import base64
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from services.image_utils import (  # noqa: E402
+    ImageValidationError,
+    decode_image_base64,
+    sniff_image_format,
+    validate_image_base64,
+)
+
+
+def _encode(image_format: str, size=(12, 7)) -> str:
+    buffer = BytesIO()
+    Image.new("RGB", size, "blue").save(buffer, format=image_format)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG", "GIF", "WEBP"])
+def test_decode_supported_formats(image_format):
+    payload = decode_image_base64(_encode(image_format))
+    assert payload.format == image_format
+    assert (payload.width, payload.height) == (12, 7)
+    assert payload.data_uri.startswith(f"data:{payload.mime};base64,")
+
+
+def test_data_url_prefix_is_reused_without_reencoding():
+    raw = _encode("PNG")
+    payload = decode_image_base64(f"data:image/png;base64,{raw}")
+    assert payload.base64 is raw or payload.base64 == raw
+    assert payload.data_uri == f"data:image/png;base64,{raw}"
+
+
+def test_rejects_invalid_payloads():
+    assert validate_image_base64("") == (False, "图片数据为空")
+    assert validate_image_base64("abc") == (False, "无效的Base64编码")
+    not_image = base64.b64encode(b"hello world, not an image").decode()
+    assert validate_image_base64(not_image)[1].startswith("无效的图片格式")
+    with pytest.raises(ImageValidationError, match="图片过大"):
+        decode_image_base64(base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"0" * (5 * 1024 * 1024)).decode())
+
+
+def test_sniff_uses_header_only():
+    assert sniff_image_format(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "WEBP"
+    assert sniff_image_format(b"\xff\xd8\xff\xe0") == "JPEG"
+    assert sniff_image_format(b"BM") is None
+
+
+def test_prepare_for_vision_downscales_and_strips_metadata():
+    from services.image_utils import VisionOptions, prepare_for_vision
+
+    buffer = BytesIO()
+    Image.new("RGBA", (3000, 2000), (10, 20, 30, 128)).save(buffer, format="PNG")
+    payload = decode_image_base64(base64.b64encode(buffer.getvalue()).decode())
+
+    [prepared] = prepare_for_vision(payload, VisionOptions(max_edge=1000))
+    assert prepared.format == "JPEG" and prepared.mime == "image/jpeg"
+    assert (prepared.width, prepared.height) == (1000, 667)
+    assert prepared.size < payload.size
+    assert "exif" not in Image.open(BytesIO(prepared.data)).info
+
+
+def test_prepare_for_vision_tiles_tall_detail_pages():
+    from services.image_utils import VisionOptions, prepare_for_vision
+
+    payload = decode_image_base64(_encode("JPEG", size=(400, 4000)))
+    tiles = prepare_for_vision(payload, VisionOptions(max_edge=1000, tile_ratio=2.5, max_tiles=4, output_format="WEBP"))
+    assert len(tiles) == 4
+    assert all(tile.format == "WEBP" and tile.height <= 1000 for tile in tiles)
+
+
+def test_prepare_for_vision_passes_small_jpeg_through():
+    from services.image_utils import VisionOptions, prepare_for_vision
+
+    payload = decode_image_base64(_encode("JPEG"))
+    assert prepare_for_vision(payload, VisionOptions()) == [payload]
+
+
+def test_prepare_for_vision_reencodes_small_jpeg_with_metadata():
+    from services.image_utils import VisionOptions, prepare_for_vision
+
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"
+    exif.get_ifd(0x8825)[2] = (31.0, 14.0, 0.0)   # GPSLatitude
+    buffer = BytesIO()
+    Image.new("RGB", (12, 7), "blue").save(buffer, format="JPEG", exif=exif, comment=b"shop")
+    payload = decode_image_base64(base64.b64encode(buffer.getvalue()).decode())
+
+    [prepared] = prepare_for_vision(payload, VisionOptions())
+    assert prepared is not payload and (prepared.width, prepared.height) == (12, 7)
+    with Image.open(BytesIO(prepared.data)) as image:
+        assert not {"exif", "comment"} & set(image.info) and not image.getexif()
+
+
+def test_cpu_pool_rejects_when_queue_is_full():
+    import asyncio
+    import threading
+
+    from services.cpu_pool import CpuPool, PoolSaturatedError
+    from services.metrics import registry
+
+    pool = CpuPool(workers=1, queue_depth=1, name="test-pool")
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(release.wait)
+        saturated = registry.render()
+        release.set()
+        await asyncio.gather(*running)
+        return saturated
+
+    saturated = asyncio.run(scenario())
+    stats = pool.stats()
+    pool.shutdown()
+    assert stats["completed"] == 2 and stats["rejected"] == 1 and stats["active"] == 0
+    # 饱和状态可从 /metrics 告警
+    for sample in ('cpu_pool_active{pool="test-pool"} 1', 'cpu_pool_queued{pool="test-pool"} 1',
+                   'cpu_pool_capacity{pool="test-pool"} 2', 'cpu_pool_rejected_total{pool="test-pool"} 1'):
+        assert sample in saturated
+    assert 'cpu_pool_active{pool="test-pool"} 0' in registry.render()
+
+
+def test_cpu_pool_releases_slot_of_job_cancelled_while_queued():
+    import asyncio
+    import threading
+
+    from services.cpu_pool import CpuPool
+
+    pool = CpuPool(workers=1, queue_depth=2)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        waiting = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        waiting.cancel()                     # 例如客户端断开，扇出任务被取消
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+    stats = pool.stats()
+    pool.shutdown()
+    assert stats["queued"] == 0 and stats["active"] == 0 and stats["completed"] == 1
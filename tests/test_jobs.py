@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+测试异步生成任务：任务存储（内存 / SQLite）与 /api/jobs 接口
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services.job_manager import JobManager  # noqa: E402
+from services.job_store import JOB_FAILED, JOB_SUCCEEDED, InMemoryJobStore, SQLiteJobStore  # noqa: E402
+
+
+class _FakeRunningHub:
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        await asyncio.sleep(0.05)
+        if prompt == "fail":
+            raise ValueError("boom")
+        return f"https://cdn.test/{model}.png"
+
+
+def _run_job(store, prompt: str):
+    async def scenario():
+        manager = JobManager(store)
+        job = await manager.submit({"prompt": prompt}, lambda: _FakeRunningHub().generate_image(prompt, "m"))
+        states = [j.status for j in [j async for j in manager.watch(job.id)]]
+        final = await manager.get(job.id)
+        await manager.shutdown()
+        return states, final
+
+    return asyncio.run(scenario())
+
+
+def test_memory_store_job_lifecycle():
+    states, job = _run_job(InMemoryJobStore(), "ok")
+    assert states[-1] == JOB_SUCCEEDED
+    assert job.image_url == "https://cdn.test/m.png"
+
+
+def test_sqlite_store_persists_failure(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    states, job = _run_job(SQLiteJobStore(path), "fail")
+    assert states[-1] == JOB_FAILED and "boom" in job.error
+
+    reopened = SQLiteJobStore(path)
+    persisted = asyncio.run(reopened.get(job.id))
+    assert persisted.status == JOB_FAILED and persisted.params == {"prompt": "fail"}
+
+
+def test_watch_follows_job_run_by_another_worker(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "jobs.sqlite3")
+        runner = JobManager(SQLiteJobStore(path))
+        watcher = JobManager(SQLiteJobStore(path), poll_interval=0.02)
+        job = await runner.submit({"prompt": "p"}, lambda: _FakeRunningHub().generate_image("p", "m"))
+        # 订阅方与执行方是不同的 JobManager（模拟两个工作进程），只能通过共享存储观察变化
+        states = [j.status async for j in watcher.watch(job.id)]
+        await runner.shutdown()
+        await watcher.shutdown()
+        return states
+
+    states = asyncio.run(scenario())
+    assert states[-1] == JOB_SUCCEEDED
+
+
+def test_jobs_endpoints(monkeypatch):
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: _FakeRunningHub())
+    with TestClient(main.app) as client:
+        response = client.post("/api/jobs", json={"prompt": "ok", "model": "seedream-v4"})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        with client.stream("GET", f"/api/jobs/{job_id}/events") as stream:
+            events = [json.loads(line[6:]) for line in stream.iter_lines() if line.startswith("data: ")]
+        assert events[-1]["status"] == JOB_SUCCEEDED and events[-1]["done"] is True
+
+        job = client.get(f"/api/jobs/{job_id}").json()
+        assert job["image_url"] == "https://cdn.test/seedream-v4.png"
+        assert client.get("/api/jobs/missing").status_code == 404
+        assert client.post("/api/jobs", json={"prompt": " "}).status_code == 400
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试指标：直方图 / 计数器的 Prometheus 文本输出，以及 /metrics 中的请求与上游调用指标
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from config import Settings  # noqa: E402
+from services import metrics  # noqa: E402
+from services.metrics import Registry  # noqa: E402
+from services.runninghub_client import ModelConfig, RunningHubClient  # noqa: E402
+from services.task_completion import DurationModel, TaskWaiter  # noqa: E402
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("stage_seconds", "Stage time", ("endpoint",), buckets=(0.1, 1.0))
+    counter = registry.counter("calls", "Calls", ("outcome",))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/api/x")
+    counter.inc("success")
+    counter.inc("success")
+
+    text = registry.render()
+    assert 'stage_seconds_bucket{endpoint="/api/x",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{endpoint="/api/x",le="1"} 3' in text
+    assert 'stage_seconds_bucket{endpoint="/api/x",le="+Inf"} 4' in text
+    assert 'stage_seconds_sum{endpoint="/api/x"} 3.65' in text
+    assert 'stage_seconds_count{endpoint="/api/x"} 4' in text
+    assert 'calls_total{outcome="success"} 2' in text
+    assert "# TYPE stage_seconds histogram" in text
+
+
+class _FakeRunningHub:
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        return "https://cdn.test/out.png"
+
+
+def test_metrics_endpoint_reports_route_templates(monkeypatch):
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: _FakeRunningHub())
+    with TestClient(main.app) as client:
+        assert client.post("/api/generate", json={"prompt": "白底主图"}).status_code == 200
+        client.get("/api/jobs/does-not-exist")
+        text = client.get("/metrics").text
+
+    assert 'http_request_duration_seconds_count{endpoint="/api/generate",method="POST",status="200"}' in text
+    assert 'endpoint="/api/jobs/{job_id}"' in text
+
+
+def test_runninghub_records_attempts_submit_and_polls():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            return httpx.Response(200, json={"status": "SUCCESS", "results": [{"url": "https://cdn.test/a.png"}]})
+        if "metrics-cheap/" in request.url.path:
+            return httpx.Response(500, json={})
+        return httpx.Response(200, json={"taskId": "t1", "status": "RUNNING"})
+
+    settings = Settings(runninghub_api_key="test", runninghub_base_url="http://rh.test", runninghub_poll_min_interval=0.01)
+    client = RunningHubClient(settings, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    client.duration_model = DurationModel()
+    client.task_waiter = TaskWaiter()
+    # 低价渠道 500，回退到官方渠道
+    model = ModelConfig("Metrics", "metrics-cheap", "metrics-official", ("image-to-image",))
+    before_fallback = metrics.runninghub_attempts.value("", model.api_path_official, "text-to-image", "success")
+    before_polls = metrics.runninghub_polls_per_task.count("", model.api_path_official)
+
+    asyncio.run(client._run_with_fallback(client._client(), model, ("text-to-image",), {"resolution": "2k"}))
+
+    assert metrics.runninghub_attempts.value("", model.api_path, "text-to-image", "error") >= 1
+    assert metrics.runninghub_attempts.value("", model.api_path_official, "text-to-image", "success") == before_fallback + 1
+    assert metrics.runninghub_polls_per_task.count("", model.api_path_official) == before_polls + 1
+    assert metrics.runninghub_submit_seconds.count("", model.api_path, "text-to-image", "error") >= 1
+
+
+def test_runninghub_metrics_carry_the_calling_endpoint(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            return httpx.Response(200, json={"status": "SUCCESS", "results": [{"url": "https://cdn.test/b.png"}]})
+        return httpx.Response(200, json={"taskId": "t2", "status": "RUNNING"})
+
+    settings = Settings(runninghub_api_key="test", runninghub_base_url="http://rh.test", runninghub_poll_min_interval=0.01)
+    client = RunningHubClient(settings, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    client.duration_model = DurationModel()
+    client.task_waiter = TaskWaiter()
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: client)
+
+    with TestClient(main.app) as test_client:
+        assert test_client.post("/api/generate", json={"prompt": "白底主图"}).status_code == 200
+        text = test_client.get("/metrics").text
+
+    assert 'runninghub_attempts_total{endpoint="/api/generate",' in text
+    assert 'runninghub_polls_per_task_count{endpoint="/api/generate",' in text
+
+
+class _FakeLLM:
+    admission_key = "default"
+
+    def __init__(self, model: str):
+        self.settings = main.settings.model_copy(update={"llm_model": model})
+
+    async def stream_chat(self, messages, temperature=None):
+        yield "提示词"
+
+
+def test_llm_model_label_is_bounded(monkeypatch):
+    monkeypatch.setattr(main, "settings", main.settings.model_copy(update={"metrics_llm_models": "gemini-known"}))
+    body = {"analysis_result": "极简白底，柔和侧光，居中构图", "product_info": "保温杯"}
+    with TestClient(main.app) as client:
+        for model in ("gemini-known", "made-up-1", "made-up-2"):
+            monkeypatch.setattr(main, "_resolve_llm", lambda request, model=model: _FakeLLM(model))
+            client.post("/api/fuse-prompt", json=body, headers={"Cache-Control": "no-cache"})
+        text = client.get("/metrics").text
+
+    assert 'llm_output_chars_count{endpoint="/api/fuse-prompt",model="gemini-known",' in text
+    assert 'model="other"' in text
+    assert "made-up" not in text
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+测试 LLM 模型实例缓存（LRU + 空闲 TTL）
+"""
+
+import sys
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from config import Settings  # noqa: E402
+from services import model_cache  # noqa: E402
+from services.llm_manager import LLMManager  # noqa: E402
+from services.model_cache import ModelCache  # noqa: E402
+
+
+def test_hits_and_misses():
+    cache: ModelCache[object] = ModelCache(max_size=4, ttl=60)
+    key = ModelCache.make_key("sk-a", "https://x/v1", "m", 0.3)
+    first = cache.get_or_create(key, object)
+    assert cache.get_or_create(key, object) is first
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_key_does_not_contain_api_key():
+    key = ModelCache.make_key("sk-secret", "https://x/v1", "m", 0.7)
+    assert "sk-secret" not in key
+    assert key != ModelCache.make_key("sk-secret", "https://x/v1", "m", 0.3)
+
+
+def test_lru_and_idle_eviction():
+    cache: ModelCache[object] = ModelCache(max_size=2, ttl=60)
+    cache.get_or_create("a", object)
+    cache.get_or_create("b", object)
+    cache.get_or_create("a", object)
+    cache.get_or_create("c", object)  # evicts "b" (least recently used)
+    assert cache.stats()["size"] == 2
+    cache.get_or_create("b", object)
+    assert cache.stats()["misses"] == 4
+
+    cache.ttl = 0
+    cache.get_or_create("d", object)  # idle sweep drops everything older
+    assert cache.stats()["size"] == 1
+
+
+def test_llm_manager_reuses_models_per_key_and_temperature():
+    model_cache._model_cache = ModelCache(max_size=8, ttl=60)
+    settings = Settings(gemini_analyze_api_key="sk-test", llm_model="m")
+    first = LLMManager(settings)
+    second = LLMManager(settings.model_copy())
+    assert first._get_model(0.3) is second._get_model(0.3)
+    assert first.model is second.model
+    assert first.model is not first._get_model(0.3)
+    assert model_cache._model_cache.stats()["misses"] == 2
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试提示词模板注册表：内容哈希版本、修改后重新加载、A/B 变体，版本进入结果缓存键与 LLM 指标标签
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from pydantic import SecretStr
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services import result_cache  # noqa: E402
+from services.llm_manager import LLMManager  # noqa: E402
+from services.metrics import registry  # noqa: E402
+from services.prompt_loader import TemplateRegistry, template_version  # noqa: E402
+
+
+def _write(path: Path, text: str) -> None:
+    """写入并推后 mtime，避免同一时间粒度内的两次写入无法区分。"""
+    stamp = path.stat().st_mtime_ns + 1_000_000_000 if path.exists() else None
+    path.write_text(text, encoding="utf-8")
+    if stamp is not None:
+        os.utime(path, ns=(stamp, stamp))
+
+
+def test_registry_versions_variants_and_reload(tmp_path, monkeypatch):
+    _write(tmp_path / "fuse_prompt.md", "融合 A")
+    _write(tmp_path / "fuse_prompt@b.md", "融合 B")
+    _write(tmp_path / "model.txt", "不是模板")
+    prompts = TemplateRegistry(tmp_path, builtin={"fuse_prompt": "内置", "reverse_prompt": "内置反推"})
+
+    fuse = prompts.get("fuse_prompt")
+    assert (fuse.text, fuse.version, fuse.label) == ("融合 A", template_version("融合 A"), f"fuse_prompt:{fuse.version}")
+    assert prompts.get("fuse_prompt", "b").text == "融合 B"
+    assert prompts.get("fuse_prompt", "c").text == "融合 A"          # 未知变体使用默认模板
+    assert prompts.get("reverse_prompt").source == "builtin"
+    assert set(prompts.snapshot()) == {"fuse_prompt", "fuse_prompt@b", "reverse_prompt"}
+    with pytest.raises(KeyError):
+        prompts.get("unknown")
+
+    # 读取只走内存
+    def no_disk(*args, **kwargs):
+        raise AssertionError("disk access")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(os, "scandir", no_disk)
+        patched.setattr(Path, "read_text", no_disk)
+        assert all(prompts.get("fuse_prompt") is fuse for _ in range(100))
+
+    assert prompts.refresh() == []
+    _write(tmp_path / "fuse_prompt.md", "融合 A2")
+    _write(tmp_path / "recognize_product.md", "识别")
+    assert prompts.refresh() == ["fuse_prompt"]
+    assert prompts.get("fuse_prompt").version == template_version("融合 A2") and prompts.reloads == 1
+    assert prompts.get("recognize_product").text == "识别"
+
+    # 删除文件（如编辑器保存过程中）时保留最后加载的内容
+    (tmp_path / "fuse_prompt.md").unlink()
+    assert prompts.refresh() == [] and prompts.get("fuse_prompt").text == "融合 A2"
+
+
+def test_template_revision_feeds_cache_key_and_metrics(monkeypatch, tmp_path):
+    template_dir = tmp_path / "Guidance"
+    template_dir.mkdir()
+    _write(template_dir / "fuse_prompt.md", "融合 v1")
+    _write(template_dir / "fuse_prompt@b.md", "融合 B")
+    prompts = TemplateRegistry(template_dir)
+    settings = main.settings.model_copy(update={
+        "result_cache_enabled": True,
+        "result_cache_path": "",
+        "singleflight_enabled": False,
+        "admission_enabled": False,
+        "prompt_reload_interval": 0,
+        "gemini_analyze_api_key": SecretStr("test"),
+    })
+    system_prompts: list[str] = []
+
+    class _Chunk:
+        def __init__(self, content: str):
+            self.content = content
+
+    class _FakeModel:
+        async def astream(self, messages):
+            system_prompts.append(messages[0].content)
+            yield _Chunk("白底保温杯主图")
+
+    llm = LLMManager(settings)
+    monkeypatch.setattr(llm, "_get_model", lambda temperature=None: _FakeModel())
+    monkeypatch.setattr(main, "settings", settings)
+    monkeypatch.setattr(main, "prompt_registry", prompts)
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: llm)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    body = {"analysis_result": "极简白底，柔和侧光，居中构图", "product_info": "保温杯"}
+
+    with TestClient(main.app) as client:
+        assert client.post("/api/fuse-prompt", json=body).status_code == 200
+        assert client.post("/api/fuse-prompt", json=body).status_code == 200   # 缓存命中
+        client.post("/api/fuse-prompt", json=body, headers={"x-prompt-variant": "b"})
+        _write(template_dir / "fuse_prompt.md", "融合 v2")
+        assert prompts.refresh() == ["fuse_prompt"]
+        client.post("/api/fuse-prompt", json=body)                               # 新版本不命中旧结果
+
+    assert system_prompts == ["融合 v1", "融合 B", "融合 v2"]
+    rendered = registry.render()
+    for text, key in (("融合 v1", "fuse_prompt"), ("融合 B", "fuse_prompt@b"), ("融合 v2", "fuse_prompt")):
+        label = f'prompt="{key}:{template_version(text)}"'
+        assert f'llm_first_token_seconds_count{{endpoint="/api/fuse-prompt",model="{settings.llm_model}",{label}}} 1' in rendered
+        assert f'llm_output_chars_sum{{endpoint="/api/fuse-prompt",model="{settings.llm_model}",{label}}} 7' in rendered
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试结果缓存：内存 / 磁盘两级、TTL、容量淘汰，以及 /api/analyze 的命中回放
+"""
+
+import asyncio
+import base64
+import json
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services import result_cache  # noqa: E402
+from services.result_cache import ResultCache, canonical_text, make_key  # noqa: E402
+
+
+def _png_base64(color: str = "red") -> str:
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_make_key_separates_parts():
+    assert make_key("ns", "ab", "c") != make_key("ns", "a", "bc")
+    assert make_key("ns", b"img", 0.3) != make_key("ns", b"img", 0.7)
+    assert make_key("analyze", b"x") != make_key("recognize-product", b"x")
+
+
+def test_disk_tier_survives_restart_and_evicts(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def scenario():
+        # 内存层容量极小，读写都落到磁盘层
+        cache = ResultCache(memory_bytes=1, ttl=60, disk_path=path, disk_bytes=25)
+        await cache.set("a", "x" * 10)
+        await cache.set("b", "y" * 10)
+        await asyncio.sleep(0.01)
+        await cache.get("a")              # 刷新 a 的访问时间
+        await cache.set("c", "z" * 10)    # 超出 25 字节，淘汰最久未访问的 b
+        cache.close()
+
+        reopened = ResultCache(memory_bytes=1, ttl=60, disk_path=path, disk_bytes=25)
+        values = [await reopened.get(k) for k in ("a", "b", "c")]
+        return values, reopened.stats()
+
+    values, stats = asyncio.run(scenario())
+    assert values == ["x" * 10, None, "z" * 10]
+    assert stats["disk_hits"] == 2 and stats["misses"] == 1
+
+
+def test_disk_tier_tracks_usage_without_scanning(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = result_cache._DiskTier(path, max_bytes=1000)
+    statements: list[str] = []
+    disk._conn.set_trace_callback(statements.append)
+    disk.set("a", "x" * 10, now=100.0, ttl=60)
+    disk.set("a", "x" * 30, now=101.0, ttl=60)   # 覆盖写入只计新值
+    disk.set("b", "y" * 5, now=102.0, ttl=60)
+    assert disk._usage() == 35
+    # 容量以内的写入不做求和、过期清理或淘汰扫描
+    assert not [s for s in statements if "SUM(" in s or s.startswith(("DELETE", "SELECT key"))]
+
+    assert disk.get("b", now=200.0, ttl=60) is None   # 读到过期条目时删除
+    assert disk._usage() == 30
+    disk.close()
+    assert result_cache._DiskTier(path, max_bytes=1000)._usage() == 30
+
+
+def test_ttl_expires_entries():
+    async def scenario():
+        cache = ResultCache(memory_bytes=1024, ttl=0)
+        await cache.set("k", "v")
+        return await cache.get("k")
+
+    assert asyncio.run(scenario()) is None
+
+
+class _FakeLLM:
+    admission_key = "default"
+
+    def __init__(self):
+        self.settings = main.settings
+        self.calls = 0
+
+    async def stream_chat(self, messages, temperature=None):
+        self.calls += 1
+        for chunk in ("风格", "提示词"):
+            yield chunk
+
+
+def test_analyze_replays_cached_result(monkeypatch):
+    llm = _FakeLLM()
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: llm)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(memory_bytes=1 << 20, ttl=60))
+    image = _png_base64()
+
+    def analyze() -> list[dict]:
+        with TestClient(main.app) as client:
+            response = client.post("/api/analyze", json={"image": image})
+        return [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+    first, second = analyze(), analyze()
+    assert "".join(e["content"] for e in first) == "风格提示词"
+    assert "".join(e["content"] for e in second) == "风格提示词" and second[-1]["done"] is True
+    assert llm.calls == 1
+
+
+def test_canonical_text_folds_width_and_whitespace():
+    assert canonical_text("  ＡＢＣ１２３，  产品\t名称 \n\n\n\n规格 ") == "ABC123, 产品 名称\n\n规格"
+
+
+def test_fuse_prompt_cache_hits_bypass_and_counters(monkeypatch):
+    llm = _FakeLLM()
+    cache = ResultCache(memory_bytes=1 << 20, ttl=60)
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: llm)
+    monkeypatch.setattr(result_cache, "_result_cache", cache)
+
+    def fuse(product_info: str, headers=None) -> str:
+        body = {"analysis_result": "极简白底，柔和侧光，高级质感", "product_info": product_info}
+        with TestClient(main.app) as client:
+            response = client.post("/api/fuse-prompt", json=body, headers=headers or {})
+        return "".join(
+            json.loads(line[6:])["content"] for line in response.text.splitlines() if line.startswith("data: ")
+        )
+
+    assert fuse("保温杯 500ml") == "风格提示词"
+    assert fuse("保温杯　５００ｍｌ ") == "风格提示词"       # 全角与多余空白规范化后命中
+    assert llm.calls == 1
+    fuse("保温杯 500ml", headers={"Cache-Control": "no-cache"})
+    assert llm.calls == 2
+    assert cache.stats()["namespaces"]["fuse-prompt"] == {"hits": 1, "misses": 1, "bypassed": 1}
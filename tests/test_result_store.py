@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试生成结果代理：流式下载入库、容量淘汰，以及 /api/results 的 ETag / Range / 缩略图
+"""
+
+import asyncio
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services import result_store  # noqa: E402
+from services.result_store import ResultStore, thumbnail_width  # noqa: E402
+
+
+def _png_bytes(color: str, side: int = 600) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (side, side // 2), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _cdn(images: dict[str, bytes]) -> httpx.AsyncClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        data = images.get(request.url.path)
+        if data is None:
+            return httpx.Response(404)
+
+        async def chunks():
+            # 分块返回，模拟流式下载
+            for i in range(0, len(data), 1000):
+                yield data[i:i + 1000]
+
+        return httpx.Response(200, content=chunks())
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_fetch_streams_into_store_and_evicts_lru(tmp_path):
+    red, blue, green = _png_bytes("red"), _png_bytes("blue"), _png_bytes("green")
+    store = ResultStore(str(tmp_path), ttl=60, max_bytes=len(red) + len(blue) + 10, max_download_bytes=1 << 20)
+
+    async def scenario():
+        client = _cdn({"/red.png": red, "/blue.png": blue, "/green.png": green})
+        red_id = await store.fetch(client, "https://cdn.test/red.png")
+        assert await store.fetch(client, "https://cdn.test/red.png") == red_id   # 同一 URL 不再下载
+        blue_id = await store.fetch(client, "https://cdn.test/blue.png")
+        assert store.locate(red_id) is not None                                   # red 变为最近使用
+        await store.fetch(client, "https://cdn.test/green.png")                   # 超出容量，淘汰 blue
+        return red_id, blue_id
+
+    red_id, blue_id = asyncio.run(scenario())
+    assert store.get_bytes(red_id) == red
+    assert store.get_bytes(blue_id) is None
+    assert store.stats()["downloads"] == 3
+    assert not list(tmp_path.glob("*.tmp"))
+
+    too_small = ResultStore(str(tmp_path / "small"), ttl=60, max_bytes=1 << 20, max_download_bytes=100)
+    try:
+        asyncio.run(too_small.fetch(_cdn({"/red.png": red}), "https://cdn.test/red.png"))
+        raise AssertionError("should reject oversized results")
+    except ValueError:
+        pass
+
+
+def test_thumbnail_width_snaps_up():
+    assert [thumbnail_width(w) for w in (1, 128, 200, 900, 5000)] == [128, 128, 256, 1024, 1024]
+
+
+class _FakeRunningHub:
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        return "https://cdn.test/out.png"
+
+
+def test_generate_returns_local_result_with_cache_headers(monkeypatch, tmp_path):
+    image = _png_bytes("red")
+    store = ResultStore(str(tmp_path), ttl=60, max_bytes=1 << 20, max_download_bytes=1 << 20)
+    monkeypatch.setattr(main, "settings", main.settings.model_copy(update={"result_store_enabled": True}))
+    monkeypatch.setattr(result_store, "_result_store", store)
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: _FakeRunningHub())
+    monkeypatch.setattr(main, "get_http_client", lambda settings: _cdn({"/out.png": image}))
+
+    with TestClient(main.app) as client:
+        image_url = client.post("/api/generate", json={"prompt": "白底主图"}).json()["image_url"]
+        assert image_url.startswith("/api/results/")
+
+        full = client.get(image_url)
+        assert full.status_code == 200 and full.content == image
+        assert full.headers["content-type"] == "image/png"
+        assert "immutable" in full.headers["cache-control"]
+        etag = full.headers["etag"]
+
+        assert client.get(image_url, headers={"If-None-Match": etag}).status_code == 304
+        partial = client.get(image_url, headers={"Range": "bytes=0-9"})
+        assert partial.status_code == 206 and partial.content == image[:10]
+
+        thumb = client.get(f"{image_url}?w=200")
+        assert thumb.headers["content-type"] == "image/jpeg" and thumb.headers["etag"] != etag
+        assert Image.open(BytesIO(thumb.content)).size == (256, 128)
+
+        assert client.get("/api/results/" + "0" * 64).status_code == 404
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+测试 RunningHub 客户端：自适应轮询、webhook 唤醒（使用 httpx.MockTransport，无需真实 API Key）
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from config import Settings  # noqa: E402
+from services.runninghub_client import RunningHubClient  # noqa: E402
+from services.task_completion import DurationModel, PollSchedule, TaskWaiter  # noqa: E402
+from services.task_poller import TaskPoller, TimingWheel  # noqa: E402
+
+
+def _make_client(handler, **overrides) -> RunningHubClient:
+    settings = Settings(runninghub_api_key="test", runninghub_base_url="http://rh.test", **overrides)
+    client = RunningHubClient(settings, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    client.duration_model = DurationModel()
+    client.task_waiter = TaskWaiter()
+    return client
+
+
+def _success(task_id: str) -> dict:
+    return {"taskId": task_id, "status": "SUCCESS", "results": [{"url": f"https://cdn.test/{task_id}.png"}]}
+
+
+def test_poll_schedule_backs_off_and_respects_estimate():
+    schedule = PollSchedule(0.5, 10.0, 2.0)
+    assert [schedule.next_interval(0) for _ in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 10.0]
+
+    learned = PollSchedule(0.5, 10.0, 2.0, estimate=(30.0, 4.0))
+    assert learned.next_interval(0) == 10.0       # 远未到预期完成时间：稀疏等待
+    assert learned.next_interval(25.0) == 5.0     # 直接等到预期完成窗口
+    assert [learned.next_interval(30.0) for _ in range(4)] == [0.5, 1.0, 2.0, 2.0]  # 上限为耗时离散度的一半
+
+
+def test_duration_model_learns_per_model_and_resolution():
+    model = DurationModel(alpha=0.5)
+    assert model.estimate(("m", "2k")) is None
+    for duration in (20.0, 22.0, 24.0):
+        model.record(("m", "2k"), duration)
+    dense_from, spread = model.estimate(("m", "2k"))
+    assert 10.0 < dense_from < 22.0 and spread > 0
+    assert model.estimate(("m", "4k")) is None
+
+
+def test_generate_image_polls_until_success():
+    queries = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            queries.append(request)
+            status = "SUCCESS" if len(queries) >= 3 else "RUNNING"
+            return httpx.Response(200, json=_success("t1") if status == "SUCCESS" else {"taskId": "t1", "status": status})
+        assert json.loads(request.content)["resolution"] == "1k"
+        return httpx.Response(200, json={"taskId": "t1", "status": "QUEUED"})
+
+    client = _make_client(handler, runninghub_poll_min_interval=0.01, runninghub_poll_max_interval=0.02)
+    url = asyncio.run(client.generate_image("p", "nano-banana-v2", image_size="1K"))
+    assert url == "https://cdn.test/t1.png"
+    assert len(queries) == 3
+    assert client.duration_model.estimate(("rhart-image-n-g31-flash", "1k")) is not None
+
+
+def test_webhook_wakes_poller_immediately():
+    state = {"done": False}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            return httpx.Response(200, json=_success("t2") if state["done"] else {"taskId": "t2", "status": "RUNNING"})
+        payload = json.loads(request.content)
+        assert payload["webhookUrl"] == "https://app.test/api/runninghub/webhook"
+        return httpx.Response(200, json={"taskId": "t2", "status": "QUEUED"})
+
+    client = _make_client(
+        handler,
+        runninghub_webhook_base_url="https://app.test",
+        runninghub_poll_max_interval=60.0,
+    )
+
+    async def scenario() -> float:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        waiting = asyncio.create_task(client.generate_image("p", "nano-banana-v2"))
+        await asyncio.sleep(0.05)
+        state["done"] = True
+        assert client.task_waiter.notify("t2")
+        await waiting
+        return loop.time() - started
+
+    assert asyncio.run(scenario()) < 5.0
+
+
+def test_webhook_keeps_adaptive_polling_with_several_workers():
+    single = _make_client(lambda request: None, runninghub_webhook_base_url="https://app.test")
+    several = _make_client(lambda request: None, runninghub_webhook_base_url="https://app.test", server_workers=4)
+    key = ("rhart-image-n-g31-flash", "1k")
+    for client in (single, several):
+        client.duration_model.record(key, 20.0)
+
+    # 单进程：webhook 负责唤醒，只按最长间隔兜底
+    relaxed = TaskPoller._schedule_for(single, key, None)
+    assert relaxed.next_interval(19.0) == single.poll_max_interval
+    # 多进程：webhook 可能落到其他进程，按历史耗时在预期完成时查询
+    adaptive = TaskPoller._schedule_for(several, key, None)
+    assert adaptive.next_interval(19.0) < several.poll_max_interval
+
+
+def test_webhook_before_register_is_not_lost():
+    async def scenario() -> bool:
+        waiter = TaskWaiter()
+        assert not waiter.notify("early")
+        return await waiter.wait(waiter.register("early"), timeout=0.01)
+
+    assert asyncio.run(scenario())
+
+
+def test_task_poller_resolves_many_tasks_per_cycle():
+    counter = {"submit": 0, "query": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            counter["query"] += 1
+            task_id = json.loads(request.content)["taskId"]
+            if task_id == "3":
+                return httpx.Response(200, json={"taskId": task_id, "status": "FAILED", "errorMessage": "bad"})
+            return httpx.Response(200, json=_success(task_id))
+        counter["submit"] += 1
+        return httpx.Response(200, json={"taskId": str(counter["submit"]), "status": "QUEUED"})
+
+    client = _make_client(handler)
+    client.poller = TaskPoller(tick=0.005)
+
+    async def scenario():
+        batch = client.with_poll_interval(0.01)
+        return await asyncio.gather(
+            *(batch.generate_image("p", "seedream-v4", image_size=size) for size in ("1K", "2K", "3K")),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert sorted(r for r in results if isinstance(r, str)) == ["https://cdn.test/1.png", "https://cdn.test/2.png"]
+    assert any(isinstance(r, ValueError) and "bad" in str(r) for r in results)
+    assert counter["query"] == 3
+    assert client.poll_interval is None
+    assert client.poller.stats()["outstanding"] == 0
+
+
+def test_task_poller_caps_queries_in_flight_across_tasks():
+    state = {"active": 0, "peak": 0, "queries": {}}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        task_id = json.loads(request.content)["taskId"]
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.02)
+        state["active"] -= 1
+        seen = state["queries"][task_id] = state["queries"].get(task_id, 0) + 1
+        return httpx.Response(200, json=_success(task_id) if seen >= 2 else {"taskId": task_id, "status": "RUNNING"})
+
+    client = _make_client(handler, runninghub_poll_min_interval=0.01, runninghub_poll_max_interval=0.02)
+    poller = TaskPoller(tick=0.005, max_in_flight=3)
+
+    async def scenario():
+        return await asyncio.gather(*(poller.wait(client, client._client(), str(i)) for i in range(12)))
+
+    results = asyncio.run(scenario())
+    assert [result["taskId"] for result in results] == [str(i) for i in range(12)]
+    assert state["peak"] <= 3
+    assert all(count == 2 for count in state["queries"].values())
+    assert poller.stats()["queries"] == 24
+
+
+def test_timing_wheel_keeps_far_entries_for_later_revolutions():
+    wheel = TimingWheel(tick=1.0, slots=4, origin=0.0)
+    near, far = _PollEntryStub(), _PollEntryStub()
+    wheel.schedule(near, at=2.0)
+    wheel.schedule(far, at=6.0)          # 超过一圈，与 near 落在同一槽
+    assert wheel.advance(2.0) == [near]
+    assert wheel.advance(5.9) == []
+    assert wheel.advance(6.0) == [far]
+    wheel.schedule(near, at=7.0)
+    wheel.cancel(near)
+    assert wheel.advance(10.0) == []
+
+
+class _PollEntryStub:
+    due_tick = None
+
+
+def _two_channel_model():
+    from services.runninghub_client import ModelConfig
+
+    return ModelConfig(
+        display_name="Test",
+        api_path="cheap-path",
+        api_path_official="official-path",
+        image_to_image_modes=("image-to-image",),
+    )
+
+
+def test_hedged_request_races_official_channel():
+    from services.resilience import CircuitBreaker, LatencyTracker
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            task_id = json.loads(request.content)["taskId"]
+            # 低价渠道一直运行中，官方渠道立即完成
+            return httpx.Response(200, json=_success(task_id) if task_id == "official" else {"taskId": task_id, "status": "RUNNING"})
+        task_id = "official" if request.url.path.startswith("/openapi/v2/official-path") else "cheap"
+        return httpx.Response(200, json={"taskId": task_id, "status": "QUEUED"})
+
+    client = _make_client(
+        handler,
+        runninghub_hedge_enabled=True,
+        runninghub_hedge_delay=0.05,
+        runninghub_poll_min_interval=0.01,
+        runninghub_poll_max_interval=0.02,
+    )
+    client.breaker = CircuitBreaker()
+    client.latency = LatencyTracker()
+
+    async def scenario() -> tuple[dict, float]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await client._run_with_fallback(client._client(), _two_channel_model(), ("text-to-image",), {"prompt": "p"})
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result["taskId"] == "official"
+    assert elapsed < 2.0
+    assert client.latency.percentile("official-path", 0.95) is not None
+
+
+def test_circuit_breaker_skips_failing_channel():
+    from services.resilience import CircuitBreaker, LatencyTracker
+
+    submitted = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.startswith("/openapi/v2/cheap-path"):
+            submitted.append("cheap")
+            return httpx.Response(502, json={})
+        submitted.append("official")
+        return httpx.Response(200, json={**_success("ok"), "taskId": "ok"})
+
+    client = _make_client(handler)
+    client.breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    client.latency = LatencyTracker()
+
+    async def scenario() -> None:
+        for _ in range(3):
+            await client._run_with_fallback(client._client(), _two_channel_model(), ("text-to-image",), {"prompt": "p"})
+
+    asyncio.run(scenario())
+    assert submitted == ["cheap", "official", "cheap", "official", "official"]
+    assert client.breaker.snapshot()["cheap-path"]["open"] is True
+
+
+def test_rejected_tasks_do_not_open_circuit_breaker():
+    from services.resilience import CircuitBreaker, LatencyTracker
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            # 提示词被内容审核拒绝：调用方问题，不是渠道故障
+            return httpx.Response(200, json={"taskId": "t", "status": "FAILED", "errorMessage": "content rejected"})
+        return httpx.Response(200, json={"taskId": "t", "status": "QUEUED"})
+
+    client = _make_client(handler, runninghub_poll_min_interval=0.01)
+    client.breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    client.latency = LatencyTracker()
+
+    async def scenario() -> None:
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await client._run_with_fallback(client._client(), _two_channel_model(), ("text-to-image",), {"prompt": "p"})
+
+    asyncio.run(scenario())
+    assert client.breaker.allow("cheap-path") and client.breaker.allow("official-path")
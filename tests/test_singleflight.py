@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试请求合并：并发相同请求只调用一次上游，SSE 后到者通过扇出缓冲回放完整流
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+import main  # noqa: E402
+from services.singleflight import SingleFlight  # noqa: E402
+
+
+def test_do_coalesces_results_and_errors():
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.02)
+        if value == "bad":
+            raise ValueError("boom")
+        return value.upper()
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", lambda: work("ok")) for _ in range(5)))
+        errors = await asyncio.gather(*(flight.do("e", lambda: work("bad")) for _ in range(3)), return_exceptions=True)
+        again = await flight.do("k", lambda: work("next"))
+        return results, errors, again, flight.stats()
+
+    results, errors, again, stats = asyncio.run(scenario())
+    assert results == ["OK"] * 5
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert again == "NEXT"                         # 完成后不再合并
+    assert calls == ["ok", "bad", "next"]
+    assert stats == {"leaders": 3, "followers": 6, "in_flight": 0}
+
+
+def test_do_cancels_upstream_only_when_all_waiters_leave():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        finished = []
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            finished.append(True)
+            return 1
+
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await started.wait()
+        first.cancel()
+        assert await second == 1
+
+        lone = asyncio.create_task(flight.do("j", work))
+        await asyncio.sleep(0.01)
+        lone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lone
+        await asyncio.sleep(0.06)
+        return finished
+
+    assert asyncio.run(scenario()) == [True]
+
+
+def test_stream_fanout_replays_to_late_subscribers():
+    calls = []
+
+    async def source():
+        calls.append(1)
+        for i in range(4):
+            await asyncio.sleep(0.01)
+            yield str(i)
+
+    async def consume(flight, delay, limit=None):
+        await asyncio.sleep(delay)
+        items = []
+        async for item in flight.stream("k", source):
+            items.append(item)
+            if limit and len(items) == limit:
+                break
+        return items
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(consume(flight, 0), consume(flight, 0.025), consume(flight, 0, limit=1))
+        return results, flight.stats()
+
+    (full, late, early_exit), stats = asyncio.run(scenario())
+    assert full == late == ["0", "1", "2", "3"]
+    assert early_exit == ["0"]
+    assert calls == [1]
+    assert stats["in_flight"] == 0
+
+
+def test_stream_stops_upstream_when_last_subscriber_leaves():
+    closed = []
+
+    async def source():
+        try:
+            for i in range(100):
+                await asyncio.sleep(0.01)
+                yield str(i)
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        flight = SingleFlight()
+        async for _ in flight.stream("k", source):
+            break
+        await asyncio.sleep(0.02)
+        return flight.stats()
+
+    stats = asyncio.run(scenario())
+    assert closed == [True] and stats["in_flight"] == 0
+
+
+def test_sse_streams_coalesce_only_for_the_same_api_key(monkeypatch):
+    calls = []
+
+    class _FakeLLM:
+        def __init__(self, admission_key):
+            self.settings = main.settings
+            self.admission_key = admission_key
+
+        async def stream_chat(self, messages, temperature=None):
+            calls.append(self.admission_key)
+            await asyncio.sleep(0.02)
+            yield "提示词"
+
+    monkeypatch.setattr(main, "settings", main.settings.model_copy(update={
+        "result_cache_enabled": False,
+        "singleflight_enabled": True,
+        "sse_flush_interval": 0,
+    }))
+
+    async def consume(llm):
+        return [line async for line in main._stream_chat_sse(llm, [], cache_key="same-content")]
+
+    async def scenario():
+        return await asyncio.gather(consume(_FakeLLM("key-a")), consume(_FakeLLM("key-a")), consume(_FakeLLM("key-b")))
+
+    first, second, other = asyncio.run(scenario())
+    assert first == second == other
+    assert sorted(calls) == ["key-a", "key-b"]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试 SSE 输出：token 块按时间窗口 / 字节数合并，客户端断开后取消上游流
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from services.sse import coalesce, sse_content, until_disconnected  # noqa: E402
+
+
+async def _tokens(count: int, delay: float, state: dict):
+    try:
+        for i in range(count):
+            await asyncio.sleep(delay)
+            state["sent"] = i + 1
+            yield f"t{i};"
+    finally:
+        state["closed"] = True
+
+
+def test_coalesce_sends_first_chunk_then_merges_by_window():
+    state: dict = {}
+
+    async def scenario():
+        return [frame async for frame in coalesce(_tokens(30, 0.002, state), max_bytes=0, interval=0.03)]
+
+    frames = asyncio.run(scenario())
+    assert frames[0] == "t0;"                             # 首块立即发送
+    assert "".join(frames) == "".join(f"t{i};" for i in range(30))
+    assert 2 <= len(frames) < 15
+
+
+def test_coalesce_flushes_when_buffer_is_full():
+    async def scenario():
+        source = _tokens(40, 0.0, {})
+        return [frame async for frame in coalesce(source, max_bytes=16, interval=10.0)]
+
+    frames = asyncio.run(scenario())
+    assert "".join(frames) == "".join(f"t{i};" for i in range(40))
+    assert all(len(frame) <= 16 + 4 for frame in frames[1:])   # 不等 10s 窗口，攒满即发
+
+
+def test_coalesce_passes_upstream_errors_through():
+    async def failing():
+        yield "a"
+        raise RuntimeError("LLM streaming error: boom")
+
+    async def scenario():
+        frames = []
+        try:
+            async for frame in coalesce(failing(), max_bytes=0, interval=0.01):
+                frames.append(frame)
+        except RuntimeError as e:
+            return frames, str(e)
+        return frames, None
+
+    assert asyncio.run(scenario()) == (["a"], "LLM streaming error: boom")
+
+
+def test_disconnect_cancels_upstream_stream():
+    state: dict = {}
+    disconnects = []
+
+    async def scenario():
+        gone = asyncio.Event()
+
+        async def receive() -> dict:
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def lines():
+            async for text in coalesce(_tokens(10_000, 0.001, state), max_bytes=0, interval=0.01):
+                yield sse_content(text)
+
+        frames = []
+        async for frame in until_disconnected(lines(), receive, on_disconnect=lambda: disconnects.append(1)):
+            frames.append(json.loads(frame[len("data: "):]))
+            if len(frames) == 3:
+                gone.set()
+        sent_at_disconnect = state["sent"]
+        await asyncio.sleep(0.05)
+        return frames, sent_at_disconnect
+
+    frames, sent_at_disconnect = asyncio.run(scenario())
+    assert state["closed"] and disconnects == [1]
+    assert state["sent"] == sent_at_disconnect < 10_000    # 断开后上游不再产生 token
+    assert frames[0] == {"content": "t0;", "done": False}
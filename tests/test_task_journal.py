@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+测试 RunningHub 任务日志：进程在轮询中被杀死后，重启接管原任务，带相同 Idempotency-Key 的重试不重复提交
+"""
+
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).parent / "bench"))
+
+from config import Settings  # noqa: E402
+from fake_runninghub import FakeRunningHub  # noqa: E402
+from services import task_journal  # noqa: E402
+from services.runninghub_client import RunningHubClient  # noqa: E402
+from services.task_journal import (  # noqa: E402
+    TASK_ABANDONED,
+    TASK_PENDING,
+    TASK_SUCCEEDED,
+    JournalEntry,
+    TaskJournal,
+    idempotency_key,
+)
+
+CHILD = """
+import asyncio, sys
+sys.path.insert(0, {backend!r})
+from config import Settings
+from services.runninghub_client import RunningHubClient
+from services.task_journal import correlation_id, idempotency_key
+
+settings = Settings(**{settings!r})
+correlation_id.set("job-1")
+idempotency_key.set("retry-1")
+asyncio.run(RunningHubClient(settings).generate_image("白底主图", "nano-banana-v2"))
+"""
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_claim_orphans_takes_over_dead_owners_once(tmp_path):
+    journal = TaskJournal(str(tmp_path / "tasks.sqlite3"))
+    dead = _dead_pid()
+
+    async def scenario():
+        await journal.record(JournalEntry(task_id="1", payload_hash="a", model_path="m", mode="t", owner=dead))
+        await journal.record(JournalEntry(task_id="2", payload_hash="b", model_path="m", mode="t"))  # 本进程仍在轮询
+        await journal.record(JournalEntry(
+            task_id="3", payload_hash="c", model_path="m", mode="t", owner=dead, submitted_at=time.time() - 3600,
+        ))
+        # 容器重启前留下的任务，pid 恰好与本进程相同
+        await journal.record(JournalEntry(
+            task_id="4", payload_hash="d", model_path="m", mode="t", owner=os.getpid(), boot_id="previous-boot",
+        ))
+        claimed = await journal.claim_orphans(max_age=600)
+        assert [entry.task_id for entry in claimed] == ["1", "4"]
+        assert {entry.boot_id for entry in claimed} == {task_journal.BOOT_ID}
+        assert await journal.claim_orphans(max_age=600) == []        # 已被本进程接管
+        assert (await journal.get("3")).status == TASK_ABANDONED      # 超过最长等待时间
+
+        assert (await journal.find_reusable("a", 600)).status == TASK_PENDING
+        await journal.finish("1", TASK_SUCCEEDED, result={"status": "SUCCESS"})
+        assert (await journal.find_reusable("a", 600)).result == {"status": "SUCCESS"}   # 已完成的任务可直接复用
+        await journal.finish("2", "failed", error="boom")
+        assert await journal.find_reusable("b", 600) is None
+        assert await journal.find_reusable("a", 0) is None
+        assert await journal.stats() == {TASK_ABANDONED: 1, "failed": 1, TASK_PENDING: 1, TASK_SUCCEEDED: 1}
+
+    asyncio.run(scenario())
+
+
+def test_journal_from_before_boot_ids_is_migrated(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE runninghub_tasks (task_id TEXT PRIMARY KEY, payload_hash TEXT NOT NULL, "
+            "model_path TEXT NOT NULL, mode TEXT NOT NULL, resolution TEXT NOT NULL, key_id TEXT NOT NULL, "
+            "correlation_id TEXT NOT NULL, status TEXT NOT NULL, owner INTEGER NOT NULL, "
+            "submitted_at REAL NOT NULL, updated_at REAL NOT NULL, result TEXT, error TEXT)"
+        )
+        conn.execute(
+            "INSERT INTO runninghub_tasks VALUES ('1', 'a', 'm', 't', '', '', 'job-1', ?, ?, ?, ?, NULL, NULL)",
+            (TASK_PENDING, os.getpid(), time.time(), time.time()),
+        )
+    conn.close()
+
+    journal = TaskJournal(path)
+    claimed = asyncio.run(journal.claim_orphans(max_age=600))
+    assert [(entry.task_id, entry.boot_id) for entry in claimed] == [("1", task_journal.BOOT_ID)]
+
+
+def test_killed_mid_poll_is_resumed_without_resubmitting(monkeypatch, tmp_path):
+    fake = FakeRunningHub(task_duration=2.0)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    base_url = asyncio.run_coroutine_threadsafe(fake.start(), loop).result()
+
+    journal_path = str(tmp_path / "tasks.sqlite3")
+    overrides = {
+        "runninghub_api_key": "test",
+        "runninghub_base_url": base_url,
+        "runninghub_poll_min_interval": 0.05,
+        "runninghub_poll_max_interval": 0.1,
+        "task_journal_enabled": True,
+        "task_journal_path": journal_path,
+    }
+    child = subprocess.Popen(
+        [sys.executable, "-c", CHILD.format(backend=str(backend_dir), settings=overrides)], cwd=tmp_path
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while fake.query_calls < 2 and time.monotonic() < deadline and child.poll() is None:
+            time.sleep(0.02)
+        assert fake.query_calls >= 2, "子进程未进入轮询"
+    finally:
+        child.kill()
+        child.wait()
+    assert fake.submit_calls == 1
+
+    journal = TaskJournal(journal_path)
+    monkeypatch.setattr(task_journal, "_task_journal", journal)
+
+    async def scenario():
+        entries = await journal.claim_orphans(max_age=60)
+        assert [entry.correlation_id for entry in entries] == ["job-1"]
+        async with httpx.AsyncClient() as http_client:
+            client = RunningHubClient(Settings(**overrides), http_client=http_client)
+            # 接管原任务的同时客户端带相同 Idempotency-Key 重试：等待同一任务而不是重新提交
+            idempotency_key.set("retry-1")
+            urls = await asyncio.gather(
+                client.resume(entries[0]),
+                client.generate_image("白底主图", "nano-banana-v2"),
+            )
+            # 原任务完成后才到达的重试：直接返回日志中的结果
+            urls.append(await client.generate_image("白底主图", "nano-banana-v2"))
+            assert fake.submit_calls == 1
+            # 不带 Idempotency-Key 的相同请求是有意重新生成，提交新任务
+            idempotency_key.set("")
+            rerolled = await client.generate_image("白底主图", "nano-banana-v2")
+            assert fake.submit_calls == 2 and rerolled not in urls
+        return urls, entries[0].task_id
+
+    try:
+        (resumed_url, retried_url, late_url), task_id = asyncio.run(scenario())
+    finally:
+        asyncio.run_coroutine_threadsafe(fake.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    assert resumed_url == retried_url == late_url == f"https://cdn.example.com/{task_id}.png"
+    assert asyncio.run(journal.get(task_id)).status == TASK_SUCCEEDED
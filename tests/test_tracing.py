@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+测试链路追踪：同一 x-workflow-id 的 analyze / fuse-prompt 归入同一 trace，LLM 与 RunningHub 子 span 的父子关系
+"""
+
+import asyncio
+import base64
+import json
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image
+from pydantic import SecretStr
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from config import Settings  # noqa: E402
+from services import result_cache  # noqa: E402
+from services.llm_manager import LLMManager  # noqa: E402
+from services.runninghub_client import RunningHubClient  # noqa: E402
+from services.task_completion import DurationModel, TaskWaiter  # noqa: E402
+from services.tracing import configure_tracing, parse_traceparent, trace_id_for_workflow, tracer  # noqa: E402
+
+
+class _Chunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeModel:
+    async def astream(self, messages):
+        for part in ("风格", "提示", "词"):
+            yield _Chunk(part)
+
+
+def _read_spans(path: Path) -> list[dict]:
+    spans = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return spans
+
+
+def test_workflow_requests_share_one_trace(monkeypatch, tmp_path):
+    trace_file = tmp_path / "traces.jsonl"
+    settings = main.settings.model_copy(update={
+        "tracing_exporter": "otlp-file",
+        "tracing_path": str(trace_file),
+        "result_cache_enabled": False,
+        "singleflight_enabled": False,
+        "admission_enabled": False,
+        "gemini_analyze_api_key": SecretStr("test"),
+    })
+    llm = LLMManager(settings)
+    monkeypatch.setattr(llm, "_get_model", lambda temperature=None: _FakeModel())
+    monkeypatch.setattr(main, "settings", settings)
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: llm)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+    image = base64.b64encode(buffer.getvalue()).decode()
+    headers = {"x-workflow-id": "wf-42"}
+
+    with TestClient(main.app) as client:
+        analyzed = client.post("/api/analyze", json={"image": image}, headers=headers)
+        fused = client.post(
+            "/api/fuse-prompt", json={"analysis_result": "白底", "product_info": "保温杯"}, headers=headers
+        )
+    # 关闭时已刷新导出队列
+    assert analyzed.headers["x-trace-id"] == fused.headers["x-trace-id"] == trace_id_for_workflow("wf-42")
+
+    spans = _read_spans(trace_file)
+    by_id = {span["spanId"]: span for span in spans}
+    names = [span["name"] for span in spans]
+    assert {"POST /api/analyze", "POST /api/fuse-prompt", "image.validate", "llm.stream", "llm.chunk_batch"} <= set(names)
+    assert {span["traceId"] for span in spans} == {trace_id_for_workflow("wf-42")}
+
+    def root_of(span: dict) -> str:
+        while "parentSpanId" in span:
+            span = by_id[span["parentSpanId"]]
+        return span["name"]
+
+    validate = next(span for span in spans if span["name"] == "image.validate")
+    assert root_of(validate) == "POST /api/analyze"
+    batch = next(span for span in spans if span["name"] == "llm.chunk_batch")
+    assert by_id[batch["parentSpanId"]]["name"] == "llm.stream"
+    assert {"key": "llm.chunks", "value": {"intValue": "3"}} in batch["attributes"]
+
+
+def test_runninghub_attempt_submit_and_poll_spans(tmp_path):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/openapi/v2/query":
+            return httpx.Response(200, json={"status": "SUCCESS", "results": [{"url": "https://cdn.test/a.png"}]})
+        return httpx.Response(200, json={"taskId": "t1", "status": "RUNNING"})
+
+    trace_file = tmp_path / "traces.jsonl"
+    settings = Settings(
+        runninghub_api_key="test",
+        runninghub_base_url="http://rh.test",
+        runninghub_poll_min_interval=0.01,
+        tracing_exporter="otlp-file",
+        tracing_path=str(trace_file),
+    )
+    client = RunningHubClient(settings, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    client.duration_model = DurationModel()
+    client.task_waiter = TaskWaiter()
+
+    async def scenario():
+        with tracer.span("workflow"):
+            return await client.generate_image("白底主图", "nano-banana-v2")
+
+    configure_tracing(settings)
+    try:
+        assert asyncio.run(scenario()) == "https://cdn.test/a.png"
+    finally:
+        tracer.close()
+
+    spans = _read_spans(trace_file)
+    by_name = {span["name"]: span for span in spans}
+    assert by_name["runninghub.attempt"]["parentSpanId"] == by_name["workflow"]["spanId"]
+    assert by_name["runninghub.submit"]["parentSpanId"] == by_name["runninghub.attempt"]["spanId"]
+    assert by_name["runninghub.poll"]["parentSpanId"] == by_name["runninghub.attempt"]["spanId"]
+    assert by_name["runninghub.submit"]["kind"] == 3
+
+
+def test_parse_traceparent():
+    trace_id, parent_id = "0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331"
+    assert parse_traceparent(f"00-{trace_id}-{parent_id}-01") == (trace_id, parent_id)
+    assert parse_traceparent("00-xyz-123-01") is None
+    assert parse_traceparent("") is None
+    assert len(trace_id_for_workflow("wf-1")) == 32 and trace_id_for_workflow("wf-1") != trace_id_for_workflow("wf-2")
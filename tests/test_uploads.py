@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+测试二进制上传接口：multipart / 原始请求体与 Base64 JSON 接口结果一致
+"""
+
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(backend_dir))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from services import result_cache  # noqa: E402
+from services.image_utils import MAX_IMAGE_BYTES  # noqa: E402
+from services.result_cache import ResultCache  # noqa: E402
+
+
+def _png_bytes(color: str = "red") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class _FakeRunningHub:
+    def __init__(self):
+        self.calls = []
+
+    async def generate_image(self, prompt, model, reference_images=None, aspect_ratio="1:1", image_size="2K"):
+        self.calls.append((prompt, model, reference_images, aspect_ratio, image_size))
+        return "https://cdn.test/out.png"
+
+
+class _FakeLLM:
+    admission_key = "default"
+
+    def __init__(self):
+        self.settings = main.settings
+        self.messages = None
+
+    async def stream_chat(self, messages, temperature=None):
+        self.messages = messages
+        yield "ok"
+
+
+def test_generate_upload_passes_decoded_images(monkeypatch):
+    fake = _FakeRunningHub()
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: fake)
+    red, blue = _png_bytes("red"), _png_bytes("blue")
+
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/generate/upload",
+            data={"prompt": "白底主图", "aspect_ratio": "3:4"},
+            files=[
+                ("target_images", ("a.png", red, "image/png")),
+                ("target_images", ("b.png", blue, "image/png")),
+            ],
+        )
+        assert response.status_code == 200
+        assert response.json()["image_url"] == "https://cdn.test/out.png"
+
+        prompt, model, images, ratio, size = fake.calls[0]
+        assert (prompt, model, ratio, size) == ("白底主图", "nano-banana-v2", "3:4", "2K")
+        assert [img.data for img in images] == [red, blue]
+
+        broken = client.post(
+            "/api/generate/upload",
+            data={"prompt": "x"},
+            files=[("target_images", ("c.png", b"not an image", "image/png"))],
+        )
+        assert broken.status_code == 400
+        assert broken.json()["detail"].startswith("第1张图片验证失败")
+
+
+def test_analyze_upload_accepts_raw_body(monkeypatch):
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(memory_bytes=1 << 20, ttl=60))
+    fake = _FakeLLM()
+    monkeypatch.setattr(main, "_resolve_llm", lambda request: fake)
+
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/analyze/upload", content=_png_bytes(), headers={"Content-Type": "image/png"}
+        )
+        assert response.status_code == 200
+        assert '"done": true' in response.text
+        assert fake.messages[1]["content"][1]["type"] == "image_url"
+
+        unsupported = client.post(
+            "/api/recognize-product/upload", content=b"hi", headers={"Content-Type": "text/plain"}
+        )
+        assert unsupported.status_code == 415
+
+        oversized = client.post(
+            "/api/analyze/upload",
+            content=b"\0" * (MAX_IMAGE_BYTES + 1),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert oversized.status_code == 400
+        assert "最大支持5MB" in oversized.json()["detail"]
+
+
+def test_generate_upload_limits_file_count_and_body_size(monkeypatch):
+    fake = _FakeRunningHub()
+    monkeypatch.setattr(main, "_resolve_runninghub", lambda request: fake)
+    red = _png_bytes()
+
+    with TestClient(main.app) as client:
+        too_many = client.post(
+            "/api/generate/upload",
+            data={"prompt": "白底主图"},
+            files=[("target_images", (f"{i}.png", red, "image/png")) for i in range(main.MAX_UPLOAD_IMAGES + 1)],
+        )
+        assert too_many.status_code == 400
+
+        declared = client.post(
+            "/api/images",
+            files={"image": ("big.png", b"\0" * (MAX_IMAGE_BYTES + main.MULTIPART_OVERHEAD_BYTES), "image/png")},
+        )
+        assert declared.status_code == 400
+        assert "上传内容过大" in declared.json()["detail"]
+
+        # 无 Content-Length 的分块上传：边读边计数
+        boundary = "limit-boundary"
+        head = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="big.png"\r\n'
+            "Content-Type: image/png\r\n\r\n"
+        ).encode()
+
+        def chunks():
+            yield head
+            for _ in range(MAX_IMAGE_BYTES // (1 << 20) + 2):
+                yield b"\0" * (1 << 20)
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        streamed = client.post(
+            "/api/images", content=chunks(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        )
+        assert streamed.status_code == 400
+        assert "上传内容过大" in streamed.json()["detail"]
+
+    assert fake.calls == []